@@ -1,9 +1,12 @@
 import logging
 import platform
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import pdb
+from core.llm import LLMAgent
 from utils.grounding import ACI
 from agent.worker import Worker
+from utils import telemetry
+from utils.warmup import EndpointWarmup
 
 
 logger = logging.getLogger("ComputerAgent.agent.agent")
@@ -19,6 +22,11 @@ class Agent:
         platform: str = platform.system().lower(),
         max_trajectory_length: int = 8,
         enable_reflection: bool = True,
+        pricing: Optional[Dict[str, Dict[str, float]]] = None,
+        warmup: bool = False,
+        prime_cache: bool = False,
+        macro_mode: bool = False,
+        max_macro_actions: int = 4,
     ):
         """Initialize a minimalist AgentS2 without hierarchy
 
@@ -28,6 +36,11 @@ class Agent:
             platform: Operating system platform (darwin, linux, windows)
             max_trajectory_length: Maximum number of image turns to keep
             enable_reflection: Creates a reflection agent to assist the worker agent
+            pricing: Per-model price per million prompt / completion tokens, used for cost accounting
+            warmup: Open connections to every model endpoint in the background on each reset
+            prime_cache: While warming up, also send each system prompt so the server can cache its prefix
+            macro_mode: Let the generator emit several actions per turn, each with a postcondition (see utils/macro.py)
+            max_macro_actions: Maximum number of actions per turn in macro mode
         """
 
         self.worker_engine_params = worker_engine_params
@@ -35,24 +48,71 @@ class Agent:
         self.platform = platform
         self.max_trajectory_length = max_trajectory_length
         self.enable_reflection = enable_reflection
+        self.pricing = pricing
+        self.warmup = warmup
+        self.prime_cache = prime_cache
+        self.warmup_handle = None
+        self.macro_mode = macro_mode
+        self.max_macro_actions = max_macro_actions
 
         self.reset()
 
     def reset(self) -> None:
         """Reset agent state and initialize components"""
+        # The grounding agent outlives a task; drop its notes, code agent result and caches
+        if hasattr(self.grounding_agent, "reset"):
+            self.grounding_agent.reset()
         self.executor = Worker(
             worker_engine_params=self.worker_engine_params,
             grounding_agent=self.grounding_agent,
             platform=self.platform,
             max_trajectory_length=self.max_trajectory_length,
             enable_reflection=self.enable_reflection,
+            pricing=self.pricing,
+            macro_mode=self.macro_mode,
+            max_macro_actions=self.max_macro_actions,
         )
+        if self.warmup:
+            self.warmup_handle = self.start_warmup(self.prime_cache)
+
+    def start_warmup(self, prime: bool = False) -> EndpointWarmup:
+        """Warm up the generator, reflection and grounding endpoints without blocking; wait on the returned handle if needed."""
+        agents = [self.executor.generator_agent]
+        if self.enable_reflection:
+            agents.append(self.executor.reflection_agent)
+        grounding_model = self._grounding_warmup_agent()
+        if grounding_model is not None:
+            agents.append(grounding_model)
+        return EndpointWarmup(agents, prime=prime)
+
+    def _grounding_warmup_agent(self) -> Optional[LLMAgent]:
+        """The grounding model if it is already built, otherwise a stand-in on the same endpoint.
+
+        Reading grounding_model directly would build it (it is a cached_property), so a task
+        that never grounds anything would pay for it on every reset.
+        """
+        built = self.grounding_agent.__dict__.get("grounding_model")
+        if built is not None:
+            return built
+        engine_params = getattr(self.grounding_agent, "engine_params_for_grounding", None)
+        if not engine_params:
+            return None
+        # Same engine params and default system prompt as the real grounding model
+        stand_in = LLMAgent(engine_params)
+        stand_in.usage_tracker = self.executor.usage_tracker
+        stand_in.usage_role = "grounding"
+        return stand_in
+
+    def record_macro_result(self, report: Dict) -> None:
+        """Report how a macro from the last prediction ran (utils.macro.run_macro) so the next turn can account for it."""
+        self.executor.record_macro_result(report)
 
     def predict(self, instruction: str, observation: Dict) -> Tuple[Dict, List[str]]:
         # Initialize the three info dictionaries
-        executor_info, actions = self.executor.generate_next_action(
-            instruction=instruction, obs=observation
-        )
+        with telemetry.span("agent.predict"):
+            executor_info, actions = self.executor.generate_next_action(
+                instruction=instruction, obs=observation
+            )
         # pdb.set_trace()
         # concatenate the three info dictionaries
         info = {**{k: v for d in [executor_info or {}] for k, v in d.items()}}
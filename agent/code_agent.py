@@ -1,9 +1,18 @@
 import logging
+import re
 from typing import Dict, List, Tuple, Optional
 
 from prompt.sys_prompt import PROCEDURAL_MEMORY
-from utils.common_utils import call_llm_safe, split_thinking_response
+from utils.common_utils import (
+    call_llm_safe,
+    split_thinking_response,
+    estimate_tokens,
+    truncate_to_tokens,
+)
 from core.llm import LLMAgent
+from utils import telemetry
+from utils.logging_setup import echo
+from utils.trajectory import record_code_execution
 
 logger = logging.getLogger("ComputerAgent.code_agent")
 
@@ -29,19 +38,39 @@ def extract_code_block(action: str) -> Tuple[Optional[str], Optional[str]]:
     return code_type, code
 
 
+# Independent blocks are wrapped in <parallel>...</parallel> inside the answer
+PARALLEL_SECTION_PATTERN = re.compile(r"<parallel>(.*?)</parallel>", re.DOTALL)
+CODE_BLOCK_PATTERN = re.compile(r"```(python|bash)\s*\n(.*?)```", re.DOTALL)
+
+
+def extract_parallel_blocks(action: str) -> List[Tuple[str, str]]:
+    """Extract the (code_type, code) blocks the agent marked as independent."""
+    section = PARALLEL_SECTION_PATTERN.search(action)
+    if not section:
+        return []
+    blocks = [
+        (code_type, code.strip())
+        for code_type, code in CODE_BLOCK_PATTERN.findall(section.group(1))
+        if code.strip()
+    ]
+    logger.debug(f"Extracted {len(blocks)} parallel code blocks")
+    return blocks
+
+
 def execute_code(code_type: str, code: str, env_controller) -> Dict:
     """Execute code based on its type."""
     # Log the full code being executed (untruncated)
-    logger.info(f"CODING_AGENT_CODE_EXECUTION - Type: {code_type}\nCode:\n{code}")
+    logger.info("CODING_AGENT_CODE_EXECUTION - Type: %s\nCode:\n%s", code_type, code)
 
     try:
         if code_type == "bash":
             result = env_controller.run_bash_script(code, timeout=30)
         elif code_type == "python":
-            result = env_controller.run_python_script(code)
+            result = env_controller.run_python_script(code, timeout=60)
         else:
             result = {"status": "error", "error": f"Unknown code type: {code_type}"}
 
+        record_code_execution(code_type, code, result)
         return result
 
     except Exception as e:
@@ -49,12 +78,72 @@ def execute_code(code_type: str, code: str, env_controller) -> Dict:
         return {"status": "error", "error": str(e)}
 
 
-def format_result(result: Dict, step_count: int) -> str:
+def execute_batch(blocks: List[Tuple[str, str]], env_controller) -> List[Dict]:
+    """Execute independent code blocks concurrently, results in input order."""
+    for code_type, code in blocks:
+        logger.info("CODING_AGENT_CODE_EXECUTION - Type: %s (parallel)\nCode:\n%s", code_type, code)
+
+    run_batch = getattr(env_controller, "run_batch", None)
+    if run_batch is None:
+        # Controller cannot run blocks concurrently, fall back to one by one
+        return [execute_code(code_type, code, env_controller) for code_type, code in blocks]
+
+    try:
+        results = run_batch(blocks)
+        for (code_type, code), result in zip(blocks, results):
+            record_code_execution(code_type, code, result)
+        return results
+    except Exception as e:
+        logger.error(f"Error executing parallel code blocks: {e}")
+        return [{"status": "error", "error": str(e)} for _ in blocks]
+
+
+def report_result(result: Dict, label: str) -> None:
+    """Print and log an execution result."""
+    output = result.get("output", "")
+    error = result.get("error", "")
+    message = result.get("message", "")
+    status = result.get("status", "")
+
+    # Print execution result to terminal for immediate visibility
+    print(f"\n⚡ CODE EXECUTION RESULT - {label}")
+    print("-" * 50)
+    print(f"Status: {status}")
+    if output:
+        echo(f"Output:\n{output}")
+    if error:
+        echo(f"Error:\n{error}")
+    if message and not output and not error:
+        echo(f"Message:\n{message}")
+    print("-" * 50)
+
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    log_lines = [
+        f"CODING_AGENT_EXECUTION_RESULT - {label}:",
+        f"Status: {status}" if status else None,
+    ]
+
+    if output:
+        log_lines.append("Output:\n" + ("-" * 40) + f"\n{output}\n" + ("-" * 40))
+    if error:
+        log_lines.append("Error:\n" + ("!" * 40) + f"\n{error}\n" + ("!" * 40))
+    if message and not output and not error:
+        log_lines.append("Message:\n" + ("-" * 40) + f"\n{message}\n" + ("-" * 40))
+
+    # Remove None entries and join
+    formatted_log = "\n".join([line for line in log_lines if line])
+    logger.info(formatted_log)
+
+
+def format_result(result: Dict, step_count: int, label: Optional[str] = None) -> str:
     """Format execution result into context string."""
+    label = label or f"Step {step_count + 1}"
     if not result:
-        logger.warning(f"Step {step_count + 1}: No result returned from execution")
+        logger.warning(f"{label}: No result returned from execution")
         return f"""
-Step {step_count + 1} Error:
+{label} Error:
 Error: No result returned from execution
 """
 
@@ -71,10 +160,10 @@ Error: No result returned from execution
         output = result.get("output", "")  # stdout only
         error = result.get("error", "")  # stderr only
 
-    logger.debug(f"Step {step_count + 1}: Status={status}, Return Code={return_code}")
+    logger.debug(f"{label}: Status={status}, Return Code={return_code}")
 
     # Format with better structure for multi-line outputs
-    result_text = f"Step {step_count + 1} Result:\n"
+    result_text = f"{label} Result:\n"
     result_text += f"Status: {status}\n"
     result_text += f"Return Code: {return_code}\n"
 
@@ -84,20 +173,88 @@ Error: No result returned from execution
     if error:
         result_text += f"Error:\n{error}\n"
 
+    # Output is capped at capture time; point the agent at the full log instead
+    if result.get("truncated"):
+        log_paths = result.get("log_paths") or []
+        result_text += "Output Truncated: yes"
+        if log_paths:
+            result_text += f" (full log: {', '.join(log_paths)})"
+        result_text += "\n"
+
+    return result_text
+
+
+def format_batch_result(results: List[Dict], step_count: int) -> str:
+    """Format the results of a parallel batch into one context string."""
+    result_text = (
+        f"Step {step_count + 1} ran {len(results)} independent code blocks in parallel:\n"
+    )
+    for index, result in enumerate(results):
+        result_text += "\n" + format_result(
+            result, step_count, label=f"Step {step_count + 1}.{index + 1}"
+        )
     return result_text
 
 
+def summarize_step_result(result: Dict, label: str, code_type: Optional[str]) -> Dict:
+    """Reduce an execution result to a compact structured record for the summary."""
+    result = result or {}
+    status = result.get("status", "unknown")
+    return_code = result.get("returncode", result.get("return_code", -1))
+
+    # The last non-empty line is usually the printed result or the exception
+    source = result.get("error") if status == "error" and result.get("error") else ""
+    source = source or result.get("output") or result.get("message") or ""
+    last_line = ""
+    for line in reversed(source.splitlines()):
+        if line.strip():
+            last_line = line.strip()
+            break
+    if len(last_line) > 200:
+        last_line = last_line[:200] + "..."
+
+    digest = f"{label} [{code_type or 'unknown'}] {status} (rc={return_code})"
+    if last_line:
+        digest += f": {last_line}"
+    return {
+        "label": label,
+        "code_type": code_type,
+        "status": status,
+        "return_code": return_code,
+        "digest": digest,
+    }
+
+
 class CodeAgent:
     """A dedicated agent for executing code with a budget of steps."""
 
-    def __init__(self, engine_params: Dict, budget: int = 20):
-        """Initialize the CodeAgent."""
+    def __init__(
+        self,
+        engine_params: Dict,
+        budget: int = 20,
+        summarize_with_llm: bool = False,
+        summary_token_budget: int = 2000,
+    ):
+        """Initialize the CodeAgent.
+
+        Args:
+            engine_params: Engine configuration for the code agent
+            budget: Maximum number of steps per execute call
+            summarize_with_llm: Run an extra LLM pass to summarize the session
+                instead of using the incrementally built summary
+            summary_token_budget: Maximum estimated tokens of execution context
+                sent to the LLM summary pass
+        """
         if not engine_params:
             raise ValueError("engine_params cannot be None or empty")
 
         self.engine_params = engine_params
         self.budget = budget
+        self.summarize_with_llm = summarize_with_llm
+        self.summary_token_budget = summary_token_budget
         self.agent = None
+        # Shared token accounting, assigned by the owning ACI
+        self.usage_tracker = None
 
         logger.info(f"CodeAgent initialized with budget={budget}")
         self.reset()
@@ -109,12 +266,32 @@ class CodeAgent:
             engine_params=self.engine_params,
             system_prompt=PROCEDURAL_MEMORY.CODE_AGENT_PROMPT,
         )
+        self.agent.usage_tracker = self.usage_tracker
+        self.agent.usage_role = "code_agent"
 
     def execute(self, task_instruction: str, screenshot: str, env_controller) -> Dict:
-        """Execute code for the given task with a budget of steps."""
+        """Execute code for the given task with a budget of steps.
+
+        If the controller supports sessions, a persistent interpreter is kept
+        alive for the whole run so state carries over between steps.
+        """
         if env_controller is None:
             raise ValueError("env_controller is required for code execution")
 
+        start_session = getattr(env_controller, "start_session", None)
+        end_session = getattr(env_controller, "end_session", None)
+        if start_session is not None:
+            start_session()
+        try:
+            return self._execute_steps(task_instruction, screenshot, env_controller)
+        finally:
+            if end_session is not None:
+                end_session()
+
+    def _execute_steps(
+        self, task_instruction: str, screenshot: str, env_controller
+    ) -> Dict:
+        """Run the step loop and build the final result."""
         print(f"\n🚀 STARTING CODE EXECUTION")
         print("=" * 60)
         print(f"Task: {task_instruction}")
@@ -144,13 +321,11 @@ class CodeAgent:
             # Print to terminal for immediate visibility
             print(f"\n🤖 CODING AGENT RESPONSE - Step {step_count + 1}/{self.budget}")
             print("=" * 60)
-            print(response)
+            echo(response)
             print("=" * 60)
 
             # Log the latest message from the coding agent (untruncated)
-            logger.info(
-                f"CODING_AGENT_LATEST_MESSAGE - Step {step_count + 1}:\n{response}"
-            )
+            logger.info("CODING_AGENT_LATEST_MESSAGE - Step %d:\n%s", step_count + 1, response)
 
             # Check if response is None or empty
             if not response or response.strip() == "":
@@ -187,47 +362,36 @@ class CodeAgent:
             # Extract and execute code
             code_type, code = extract_code_block(action)
 
-            if code:
-                result = execute_code(code_type, code, env_controller)
-                # Prepare formatted output and error for logging
-                output = result.get("output", "")
-                error = result.get("error", "")
-                message = result.get("message", "")
-                status = result.get("status", "")
-
-                # Print execution result to terminal for immediate visibility
-                print(f"\n⚡ CODE EXECUTION RESULT - Step {step_count + 1}")
-                print("-" * 50)
-                print(f"Status: {status}")
-                if output:
-                    print(f"Output:\n{output}")
-                if error:
-                    print(f"Error:\n{error}")
-                if message and not output and not error:
-                    print(f"Message:\n{message}")
-                print("-" * 50)
-
-                log_lines = [
-                    f"CODING_AGENT_EXECUTION_RESULT - Step {step_count + 1}:",
-                    f"Status: {status}" if status else None,
-                ]
+            parallel_blocks = extract_parallel_blocks(action)
 
-                if output:
-                    log_lines.append(
-                        "Output:\n" + ("-" * 40) + f"\n{output}\n" + ("-" * 40)
-                    )
-                if error:
-                    log_lines.append(
-                        "Error:\n" + ("!" * 40) + f"\n{error}\n" + ("!" * 40)
-                    )
-                if message and not output and not error:
-                    log_lines.append(
-                        "Message:\n" + ("-" * 40) + f"\n{message}\n" + ("-" * 40)
+            if parallel_blocks:
+                logger.info(
+                    f"Step {step_count + 1}: Running {len(parallel_blocks)} independent code blocks in parallel"
+                )
+                with telemetry.span(
+                    "code_agent.execute", step=step_count + 1, blocks=len(parallel_blocks)
+                ):
+                    results = execute_batch(parallel_blocks, env_controller)
+                step_results = []
+                for index, block_result in enumerate(results):
+                    label = f"Step {step_count + 1}.{index + 1}"
+                    report_result(block_result, label)
+                    step_results.append(
+                        summarize_step_result(
+                            block_result, label, parallel_blocks[index][0]
+                        )
                     )
-
-                # Remove None entries and join
-                formatted_log = "\n".join([line for line in log_lines if line])
-                logger.info(formatted_log)
+                result_context = format_batch_result(results, step_count)
+            elif code:
+                with telemetry.span(
+                    "code_agent.execute", step=step_count + 1, code_type=code_type
+                ):
+                    result = execute_code(code_type, code, env_controller)
+                report_result(result, f"Step {step_count + 1}")
+                step_results = [
+                    summarize_step_result(result, f"Step {step_count + 1}", code_type)
+                ]
+                result_context = format_result(result, step_count)
             else:
                 print(f"\n⚠️  NO CODE BLOCK FOUND - Step {step_count + 1}")
                 print("-" * 50)
@@ -241,11 +405,17 @@ class CodeAgent:
                     f"Status: skipped\n"
                     f"Message:\n{'-' * 40}\n{result['message']}\n{'-' * 40}"
                 )
+                step_results = [
+                    summarize_step_result(result, f"Step {step_count + 1}", None)
+                ]
+                result_context = format_result(result, step_count)
+
+            # Keep the structured results with the step for the incremental summary
+            execution_history[-1]["results"] = step_results
             # Add assistant's thoughts and code to message history
             self.agent.add_message(response, role="assistant")
 
-            # Process result and add formatted environment results as user message
-            result_context = format_result(result, step_count)
+            # Add formatted environment results as user message
             self.agent.add_message(result_context, role="user")
 
             step_count += 1
@@ -259,9 +429,13 @@ class CodeAgent:
             logger.info(f"Budget exhausted after {step_count} steps")
             completion_reason = f"BUDGET_EXHAUSTED_AFTER_{step_count}_STEPS"
 
-        # Generate final summary
-        logger.info("Generating execution summary")
-        summary = self._generate_summary(execution_history, task_instruction)
+        # Build the summary from the structured step results; the extra LLM pass is opt-in
+        summary = self._build_summary(execution_history, completion_reason)
+        if self.summarize_with_llm:
+            logger.info("Generating execution summary with LLM")
+            summary = self._generate_summary(
+                execution_history, task_instruction, fallback=summary
+            )
 
         result = {
             "task_instruction": task_instruction,
@@ -275,28 +449,68 @@ class CodeAgent:
         logger.info(f"Code execution completed: steps={step_count}")
         return result
 
-    def _generate_summary(
-        self, execution_history: List[Dict], task_instruction: str
+    def _build_summary(
+        self, execution_history: List[Dict], completion_reason: str
     ) -> str:
-        """Generate summary of code execution session."""
+        """Build the session summary from the step results collected during the loop."""
         if not execution_history:
-            logger.info("No execution history to summarize")
             return "No actions were executed."
 
-        logger.info(f"Generated summary for {len(execution_history)} steps")
+        lines = [f"Completion: {completion_reason} after {len(execution_history)} steps"]
 
-        # Build detailed execution context for summary agent
-        execution_context = f"Task: {task_instruction}\n\nExecution Steps:\n"
+        # The agent's own reasoning on its final DONE/FAIL message is the best summary
+        final_step = execution_history[-1]
+        if completion_reason in ("DONE", "FAIL") and final_step.get("thoughts"):
+            lines.append(
+                "Final note: " + truncate_to_tokens(final_step["thoughts"], 300)
+            )
 
+        lines.append("Step results:")
         for step in execution_history:
-            step_num = step["step"]
-            thoughts = step.get("thoughts", "")
-            action = step.get("action", "")
+            for step_result in step.get("results", []):
+                lines.append(f"- {step_result['digest']}")
+
+        logger.info(f"Built summary for {len(execution_history)} steps")
+        return "\n".join(lines)
+
+    def _generate_summary(
+        self,
+        execution_history: List[Dict],
+        task_instruction: str,
+        fallback: Optional[str] = None,
+    ) -> str:
+        """Generate summary of code execution session with an extra LLM pass."""
+        if not execution_history:
+            logger.info("No execution history to summarize")
+            return "No actions were executed."
+
+        # Build detailed execution context for summary agent, newest steps first
+        # so the token budget keeps the most relevant ones
+        step_contexts = []
+        used_tokens = estimate_tokens(task_instruction)
+        for step in reversed(execution_history):
+            step_context = f"\nStep {step['step']}:\n"
+            if step.get("thoughts"):
+                step_context += f"Thoughts: {step['thoughts']}\n"
+            step_context += f"Code: {step.get('action', '')}\n"
+            for step_result in step.get("results", []):
+                step_context += f"Result: {step_result['digest']}\n"
+
+            step_tokens = estimate_tokens(step_context)
+            if used_tokens + step_tokens > self.summary_token_budget:
+                step_contexts.append(
+                    f"\n(Steps 1-{step['step']} omitted to fit the summary budget)\n"
+                )
+                break
+            step_contexts.append(step_context)
+            used_tokens += step_tokens
 
-            execution_context += f"\nStep {step_num}:\n"
-            if thoughts:
-                execution_context += f"Thoughts: {thoughts}\n"
-            execution_context += f"Code: {action}\n"
+        execution_context = f"Task: {task_instruction}\n\nExecution Steps:\n" + "".join(
+            reversed(step_contexts)
+        )
+        logger.info(
+            f"Generating summary for {len(execution_history)} steps (~{estimate_tokens(execution_context)} tokens)"
+        )
 
         # Create summary prompt with same context as coding agent
         summary_prompt = f"""
@@ -315,19 +529,21 @@ Keep the summary under 150 words and use clear, factual language.
 
         # Generate summary using LLM with dedicated summary system prompt
         try:
-            summary_agent = LMMAgent(
+            summary_agent = LLMAgent(
                 engine_params=self.engine_params,
                 system_prompt=PROCEDURAL_MEMORY.CODE_SUMMARY_AGENT_PROMPT,
             )
+            summary_agent.usage_tracker = self.usage_tracker
+            summary_agent.usage_role = "summary"
             summary_agent.add_message(summary_prompt, role="user")
             summary = call_llm_safe(summary_agent, temperature=1)
 
             if not summary or summary.strip() == "":
-                summary = "Summary generation failed - no response from LLM"
+                summary = fallback or "Summary generation failed - no response from LLM"
                 logger.warning("Summary generation failed - empty response from LLM")
 
         except Exception as e:
-            summary = f"Summary generation failed: {str(e)}"
+            summary = fallback or f"Summary generation failed: {str(e)}"
             logger.error(f"Error generating summary: {e}")
 
         return summary
@@ -2,17 +2,35 @@ import re
 from functools import partial
 import logging
 import textwrap
-from typing import Dict, List, Tuple
-import pdb
+from typing import Dict, List, Optional, Tuple
 from utils.grounding import ACI
 from core.model import BaseModule
 from prompt.sys_prompt import PROCEDURAL_MEMORY
-from utils.common_utils import call_llm_safe, split_thinking_response, call_llm_formatted, create_pyautogui_code, parse_code_from_string
-
-from utils.formatters import SINGLE_ACTION_FORMATTER, CODE_VALID_FORMATTER
+from utils.common_utils import call_llm_safe, split_thinking_response, call_llm_formatted, create_action_program, parse_response, estimate_tokens
+from utils.actions import as_program, render_legacy, to_json
+
+from utils.formatters import (
+    SINGLE_ACTION_FORMATTER,
+    CODE_VALID_FORMATTER,
+    MACRO_CODE_VALID_FORMATTER,
+    make_macro_action_formatter,
+)
+from utils.macro import MacroStep, describe_report, extract_macro_calls
+from utils.context_builder import ContextBuilder
+from utils import telemetry
+from utils.usage import UsageTracker
+from utils.logging_setup import echo
 
 logger = logging.getLogger("ComputerAgent.agent.worker")
 
+# generator 消息中各来源的 token 预算和优先级（优先级越低越先被压缩）
+CONTEXT_SECTION_BUDGETS = {
+    "reflection": {"budget": 1500, "priority": 2, "keep": "head"},
+    "notes": {"budget": 1500, "priority": 1, "keep": "tail"},
+    "code_agent_result": {"budget": 2500, "priority": 3, "keep": "both"},
+    "macro_result": {"budget": 500, "priority": 3, "keep": "head"},
+}
+
 
 class Worker(BaseModule):
     def __init__(
@@ -23,6 +41,11 @@ class Worker(BaseModule):
         max_trajectory_length: int = 8,
         enable_reflection: bool = True,
         use_thinking: bool = True,
+        context_token_budget: int = 6000,
+        history_token_budget: int = 60000,
+        pricing: Optional[Dict[str, Dict[str, float]]] = None,
+        macro_mode: bool = False,
+        max_macro_actions: int = 4,
     ):
         """
         Worker 接收主要任务并生成动作，不依赖层级规划。
@@ -40,6 +63,16 @@ class Worker(BaseModule):
                 是否启用反思功能
             use_thinking: bool
                 是否启用“思考模式”
+            context_token_budget: int
+                每一步 generator 消息文本的 token 预算
+            history_token_budget: int
+                长上下文模型下消息历史文本的 token 预算，超出时删除最早的轮次
+            pricing: Optional[Dict[str, Dict[str, float]]]
+                各模型每百万 token 的单价，如 {"gpt-4o": {"prompt": 2.5, "completion": 10}}
+            macro_mode: bool
+                是否允许 generator 每轮输出多个带后置条件的动作（见 utils/macro.py）
+            max_macro_actions: int
+                宏模式下每轮最多的动作数
         """
         super().__init__(worker_engine_params, platform)
         self.grounding_agent = grounding_agent
@@ -48,6 +81,11 @@ class Worker(BaseModule):
 
         self.temperature = worker_engine_params.get("temperature", 0.0)
         self.use_thinking = use_thinking
+        self.context_token_budget = context_token_budget
+        self.history_token_budget = history_token_budget
+        self.usage_tracker = UsageTracker(pricing)
+        self.macro_mode = macro_mode
+        self.max_macro_actions = max_macro_actions if macro_mode else 1
 
         self.reset()
 
@@ -66,7 +104,9 @@ class Worker(BaseModule):
             skipped_actions.append("call_code_agent")
 
         sys_prompt = PROCEDURAL_MEMORY.construct_simple_worker_procedural_memory(
-            type(self.grounding_agent), skipped_actions=skipped_actions
+            type(self.grounding_agent),
+            skipped_actions=skipped_actions,
+            max_actions=self.max_macro_actions,
         ).replace("CURRENT_OS", self.platform)
 
         # 创建生成 agent 和反思 agent
@@ -75,12 +115,24 @@ class Worker(BaseModule):
             PROCEDURAL_MEMORY.REFLECTION_ON_TRAJECTORY
         )
 
+        # 按角色统计各 agent 的 token 用量和费用
+        self.generator_agent.usage_tracker = self.usage_tracker
+        self.generator_agent.usage_role = "generator"
+        self.reflection_agent.usage_tracker = self.usage_tracker
+        self.reflection_agent.usage_role = "reflection"
+        if hasattr(self.grounding_agent, "set_usage_tracker"):
+            self.grounding_agent.set_usage_tracker(self.usage_tracker)
+        self.usage_tracker.start_task()
+        self.task_finished = False
+
         # 初始化状态变量
         self.turn_count = 0
         self.worker_history = []
         self.reflections = []
         self.cost_this_turn = 0
         self.screenshot_inputs = []
+        self.last_macro = None
+        self.last_macro_report = None
 
 
     def flush_messages(self):
@@ -93,6 +145,9 @@ class Worker(BaseModule):
             - 修改 generator、reflection agent 的消息以适应上下文限制
         """
         engine_type = self.engine_params.get("engine_type", "")
+        # 回放时沿用录制时引擎的策略，保证请求与录制时一致
+        if engine_type == "replay":
+            engine_type = self.engine_params.get("recorded_engine_type", "openai")
 
         # 长上下文模型策略：保留所有文本，只保留最新的图片
         if engine_type in ["openai"]:
@@ -109,6 +164,10 @@ class Worker(BaseModule):
                             if img_count > max_images:
                                 del agent.messages[i]["content"][j]
 
+            # 文本也按 token 预算保留：超出时删除最早的轮次，至少保留最新一轮
+            self._trim_history_by_tokens(self.generator_agent, turn_size=2)
+            self._trim_history_by_tokens(self.reflection_agent, turn_size=1)
+
         # 非长上下文模型策略：删除整个轮次消息
         else:
             # generator 消息轮流交替 [user, assistant]，每轮 2 条
@@ -120,6 +179,31 @@ class Worker(BaseModule):
                 self.reflection_agent.messages.pop(1)
 
 
+    def _trim_history_by_tokens(self, agent, turn_size: int):
+        """
+        按估计 token 数删除 agent 最早的消息轮次（保留 system 消息）。
+
+        参数:
+            agent: 需要裁剪的 LLM agent
+            turn_size (int): 每轮包含的消息条数
+        """
+        if agent is None:
+            return
+        message_tokens = [
+            sum(
+                estimate_tokens(part.get("text", ""))
+                for part in message["content"]
+                if part.get("type") == "text"
+            )
+            for message in agent.messages
+        ]
+        total = sum(message_tokens[1:])
+        while total > self.history_token_budget and len(agent.messages) > 1 + turn_size:
+            for _ in range(turn_size):
+                agent.messages.pop(1)
+                total -= message_tokens.pop(1)
+
+
     def _generate_reflection(self, instruction: str, obs: Dict) -> Tuple[str, str]:
         """
         基于当前观察和任务指令生成反思。
@@ -167,11 +251,12 @@ class Worker(BaseModule):
                     image_content=obs["screenshot"],
                     role="user",
                 )
-                full_reflection = call_llm_safe(
-                    self.reflection_agent,
-                    temperature=self.temperature,
-                    use_thinking=self.use_thinking,
-                )
+                with telemetry.span("worker.reflection"):
+                    full_reflection = call_llm_safe(
+                        self.reflection_agent,
+                        temperature=self.temperature,
+                        use_thinking=self.use_thinking,
+                    )
                 reflection, reflection_thoughts = split_thinking_response(
                     full_reflection
                 )
@@ -191,7 +276,15 @@ class Worker(BaseModule):
         返回:
             Tuple[Dict, List]: 包含执行信息的字典和动作列表
         """
-        pdb.set_trace()
+        # 新任务从第 0 轮开始，重新累计任务级用量；reset 后的第一个任务已在 reset 中清零，
+        # 不再清空，以保留其间记录的预热用量
+        if self.turn_count == 0:
+            if self.task_finished:
+                self.usage_tracker.start_task()
+                self.task_finished = False
+        else:
+            self.usage_tracker.start_step()
+
         # 将当前截图和任务指令分配给 grounding agent
         self.grounding_agent.assign_screenshot(obs)
         self.grounding_agent.set_task_instruction(instruction)
@@ -202,7 +295,6 @@ class Worker(BaseModule):
             if self.turn_count > 0
             else "提供了初始屏幕，尚未执行任何动作或已执行完上一个任务的动作。"
         )
-        pdb.set_trace()
         # 在系统提示中加载任务
         if self.turn_count == 0:
             # self.generator_agent.reset()
@@ -213,19 +305,29 @@ class Worker(BaseModule):
             prompt_with_instructions = self.generator_agent.system_prompt.replace(
                 match_result.group(1), instruction
             )
-            print(prompt_with_instructions)
+            echo(prompt_with_instructions)
             self.generator_agent.add_system_prompt(prompt_with_instructions)
         
         # 获取每一步的反思
         reflection, reflection_thoughts = self._generate_reflection(instruction, obs)
         logger.info("REFLECTION THOUGHTS: %s", reflection_thoughts)
         logger.info("REFLECTION: %s", reflection)
+
+        # 按 token 预算拼装 generator 消息，超出时按优先级截断或丢弃
+        context = ContextBuilder(self.context_token_budget)
+        context.add("header", generator_message, required=True)
         if reflection:
-            generator_message += f"REFLECTION: 可以利用以下反思改进前一步动作或整体轨迹：\n{reflection}\n"
-        
-        # 加入 grounding agent 的文本缓冲知识
-        generator_message += (
-            f"\n当前文本缓冲 = [{','.join(self.grounding_agent.notes)}]\n"
+            context.add(
+                "reflection",
+                f"REFLECTION: 可以利用以下反思改进前一步动作或整体轨迹：\n{reflection}\n",
+                **CONTEXT_SECTION_BUDGETS["reflection"],
+            )
+
+        # 加入 grounding agent 的文本缓冲知识（截断时保留最新的内容）
+        context.add(
+            "notes",
+            f"\n当前文本缓冲 = [{','.join(self.grounding_agent.notes)}]\n",
+            **CONTEXT_SECTION_BUDGETS["notes"],
         )
         # logger.info("generator_message: %s", generator_message)
         # pdb.set_trace()
@@ -235,77 +337,37 @@ class Worker(BaseModule):
             and self.grounding_agent.last_code_agent_result is not None
         ):
             code_result = self.grounding_agent.last_code_agent_result
-            generator_message += f"\nCODE AGENT 结果:\n"
-            generator_message += f"任务/子任务指令: {code_result['task_instruction']}\n"
-            generator_message += f"已完成步骤数: {code_result['steps_executed']}\n"
-            generator_message += f"最大步骤数: {code_result['budget']}\n"
-            generator_message += f"完成原因: {code_result['completion_reason']}\n"
-            generator_message += f"总结: {code_result['summary']}\n"
-            if code_result["execution_history"]:
-                generator_message += f"执行历史:\n"
-                for i, step in enumerate(code_result["execution_history"]):
-                    action = step["action"]
-                    # 对代码片段进行格式化
-                    if "```python" in action:
-                        code_start = action.find("```python") + 9
-                        code_end = action.find("```", code_start)
-                        if code_end != -1:
-                            python_code = action[code_start:code_end].strip()
-                            generator_message += f"步骤 {i+1}: \n```python\n{python_code}\n```\n"
-                        else:
-                            generator_message += f"步骤 {i+1}: \n{action}\n"
-                    elif "```bash" in action:
-                        code_start = action.find("```bash") + 7
-                        code_end = action.find("```", code_start)
-                        if code_end != -1:
-                            bash_code = action[code_start:code_end].strip()
-                            generator_message += f"步骤 {i+1}: \n```bash\n{bash_code}\n```\n"
-                        else:
-                            generator_message += f"步骤 {i+1}: \n{action}\n"
-                    else:
-                        generator_message += f"步骤 {i+1}: \n{action}\n"
-            generator_message += "\n"
-
-            # 日志记录 code agent 结果（执行历史截断显示）
-            log_message = f"\nCODE AGENT 结果:\n"
-            log_message += f"任务/子任务指令: {code_result['task_instruction']}\n"
-            log_message += f"已完成步骤数: {code_result['steps_executed']}\n"
-            log_message += f"最大步骤数: {code_result['budget']}\n"
-            log_message += f"完成原因: {code_result['completion_reason']}\n"
-            log_message += f"总结: {code_result['summary']}\n"
-            if code_result["execution_history"]:
-                log_message += f"执行历史 (截断):\n"
-                total_steps = len(code_result["execution_history"])
-                for i, step in enumerate(code_result["execution_history"]):
-                    if i < 3 or i >= total_steps - 2:  # 前三步和最后两步
-                        action = step["action"]
-                        if "```python" in action:
-                            code_start = action.find("```python") + 9
-                            code_end = action.find("```", code_start)
-                            if code_end != -1:
-                                python_code = action[code_start:code_end].strip()
-                                log_message += f"步骤 {i+1}: ```python\n{python_code}\n```\n"
-                            else:
-                                log_message += f"步骤 {i+1}: {action}\n"
-                        elif "```bash" in action:
-                            code_start = action.find("```bash") + 7
-                            code_end = action.find("```", code_start)
-                            if code_end != -1:
-                                bash_code = action[code_start:code_end].strip()
-                                log_message += f"步骤 {i+1}: ```bash\n{bash_code}\n```\n"
-                            else:
-                                log_message += f"步骤 {i+1}: {action}\n"
-                        else:
-                            log_message += f"步骤 {i+1}: {action}\n"
-                    elif i == 3 and total_steps > 5:
-                        log_message += f"... (截断 {total_steps - 5} 步) ...\n"
+            context.add(
+                "code_agent_result",
+                (
+                    f"\nCODE AGENT 结果:\n"
+                    f"任务/子任务指令: {code_result['task_instruction']}\n"
+                    f"已完成步骤数: {code_result['steps_executed']}\n"
+                    f"最大步骤数: {code_result['budget']}\n"
+                    f"完成原因: {code_result['completion_reason']}\n"
+                    f"总结: {code_result['summary']}\n\n"
+                ),
+                **CONTEXT_SECTION_BUDGETS["code_agent_result"],
+            )
 
             logger.info(
-                f"WORKER_CODE_AGENT_RESULT_SECTION - 第 {self.turn_count + 1} 步: Code agent 结果已加入 generator 消息:\n{log_message}"
+                f"WORKER_CODE_AGENT_RESULT_SECTION - 第 {self.turn_count + 1} 步: Code agent 结果已加入 generator 消息"
             )
 
             # 重置 code agent 结果
             self.grounding_agent.last_code_agent_result = None
+
+        # 如果上一轮是宏，加入执行情况（执行了几个动作、在哪个后置条件处停下）
+        if self.last_macro is not None and self.last_macro_report is not None:
+            context.add(
+                "macro_result",
+                f"\n宏执行情况:\n{describe_report(self.last_macro, self.last_macro_report)}\n",
+                **CONTEXT_SECTION_BUDGETS["macro_result"],
+            )
+        self.last_macro = None
+        self.last_macro_report = None
+
+        generator_message, context_report = context.build()
         # pdb.set_trace()
         # 将 generator 消息加入到 agent 历史
         self.generator_agent.add_message(
@@ -313,39 +375,64 @@ class Worker(BaseModule):
         )
 
         # 生成计划和下一步动作
-        format_checkers = [
-            SINGLE_ACTION_FORMATTER,
-            partial(CODE_VALID_FORMATTER, self.grounding_agent, obs),
-        ]
+        if self.macro_mode:
+            format_checkers = [
+                make_macro_action_formatter(self.max_macro_actions),
+                partial(MACRO_CODE_VALID_FORMATTER, self.grounding_agent, obs),
+            ]
+        else:
+            format_checkers = [
+                SINGLE_ACTION_FORMATTER,
+                partial(CODE_VALID_FORMATTER, self.grounding_agent, obs),
+            ]
         
         
-        plan = call_llm_formatted(
-            self.generator_agent,
-            format_checkers,
-            temperature=self.temperature,
-            use_thinking=self.use_thinking,
-        )
+        with telemetry.span("worker.generator"):
+            plan = call_llm_formatted(
+                self.generator_agent,
+                format_checkers,
+                temperature=self.temperature,
+                use_thinking=self.use_thinking,
+            )
         self.worker_history.append(plan)
         self.generator_agent.add_message(plan, role="assistant")
         # logger.info("PLAN:\n %s", plan)   
 
         # 从计划中提取下一步动作
-        plan_code = parse_code_from_string(plan)
-        try:
-            assert plan_code, "计划代码不能为空"
-            exec_code = create_pyautogui_code(self.grounding_agent, plan_code, obs)
-        except Exception as e:
-            logger.error(
-                f"无法执行以下计划代码:\n{plan_code}\n错误: {e}"
-            )
-            exec_code = self.grounding_agent.wait(1.333)  # 如果代码无法执行，则跳过此轮
+        plan_code = parse_response(plan).code
+        macro_steps = None
+        if self.macro_mode:
+            macro_steps = self._create_macro_steps(plan_code, obs)
+            action_program = tuple(action for step in macro_steps for action in step.program)
+        else:
+            try:
+                assert plan_code, "计划代码不能为空"
+                with telemetry.span("worker.grounding"):
+                    action_program = create_action_program(self.grounding_agent, plan_code, obs)
+            except Exception as e:
+                logger.error(
+                    f"无法执行以下计划代码:\n{plan_code}\n错误: {e}"
+                )
+                action_program = as_program(self.grounding_agent.wait(1.333))  # 如果代码无法执行，则跳过此轮
+        # 类型化的动作序列渲染成可 exec 的代码字符串，兼容原有的执行方式
+        exec_code = render_legacy(action_program)
+
+        # 本步和本任务的 token 用量及费用（按角色）
+        usage = {
+            "step": self.usage_tracker.step_totals(),
+            "task": self.usage_tracker.task_totals(),
+        }
+        self.cost_this_turn = usage["step"]["cost"]
 
         executor_info = {
             "plan": plan,
             "plan_code": plan_code,
             "exec_code": exec_code,
+            "action_program": to_json(action_program),
             "reflection": reflection,
             "reflection_thoughts": reflection_thoughts,
+            "context_report": context_report,
+            "usage": usage,
             "code_agent_output": (
                 self.grounding_agent.last_code_agent_result
                 if hasattr(self.grounding_agent, "last_code_agent_result")
@@ -353,12 +440,47 @@ class Worker(BaseModule):
                 else None
             ),
         }
+        # 多个动作时由执行端逐个执行并检查后置条件（utils/macro.run_macro），
+        # 之后通过 record_macro_result 把执行情况交回，下一轮告知 generator
+        if macro_steps is not None and len(macro_steps) > 1:
+            executor_info["macro"] = [step.to_json() for step in macro_steps]
+            self.last_macro = executor_info["macro"]
         # pdb.set_trace()
         self.turn_count += 1
         self.screenshot_inputs.append(obs["screenshot"])
-        self.flush_messages()
+        with telemetry.span("worker.flush_messages"):
+            self.flush_messages()
         if exec_code == 'DONE' or exec_code == 'FAIL':
             self.turn_count = 0
+            self.task_finished = True
         # print("" * 20 + " self.turn_count： "+ str(self.turn_count) + "*" * 20)
-        logger.info("executor_info:\n %s", executor_info) 
+        logger.debug("executor_info:\n %s", executor_info) 
+        if "macro" in executor_info:
+            return executor_info, [render_legacy(step.program) for step in macro_steps]
         return executor_info, [exec_code]
+
+    def _create_macro_steps(self, plan_code: str, obs: Dict) -> List[MacroStep]:
+        """
+        为宏中的每个动作生成动作序列；某个动作无法生成时只保留它之前的动作。
+
+        返回:
+            List[MacroStep]: 至少包含一个动作，全部失败时为一个 wait
+        """
+        steps = []
+        for call, postcondition in extract_macro_calls(plan_code):
+            try:
+                with telemetry.span("worker.grounding"):
+                    program = create_action_program(self.grounding_agent, call, obs)
+            except Exception as e:
+                logger.error(f"无法执行以下计划代码:\n{call}\n错误: {e}")
+                break
+            steps.append(MacroStep(call, program, postcondition))
+        if not steps:
+            steps.append(MacroStep("agent.wait(1.333)", as_program(self.grounding_agent.wait(1.333)), "any"))
+        return steps
+
+    def record_macro_result(self, report: Dict) -> None:
+        """
+        记录执行端运行宏的结果（utils/macro.run_macro 的返回值），下一轮加入 generator 消息。
+        """
+        self.last_macro_report = report
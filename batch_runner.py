@@ -0,0 +1,279 @@
+"""
+批量任务运行器：从 JSONL 读取任务，多个 Agent 会话并发执行，每个会话有独立的
+OSWorldACI、截图与动作执行后端（如各自的 Xvfb 显示器），模型客户端在会话之间共享。
+
+任务文件每行一个任务：{"id": "task-1", "instruction": "...", "max_steps": 15}
+配置文件（JSON）包含 engine_params、engine_params_for_grounding，可选 platform、width、height、
+max_trajectory_length、enable_reflection、enable_local_env、pricing、warmup、prime_cache、
+macro_mode、max_macro_actions。
+
+用法:
+    python batch_runner.py tasks.jsonl --config config.json --output results.jsonl \
+        --sessions 4 --backend xvfb
+"""
+import argparse
+import json
+import logging
+import os
+import pdb
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+from agent.agent import Agent
+from utils.actions import from_json
+from utils.display import LocalDisplay, XvfbDisplay
+from utils.grounding import OSWorldACI
+from utils.local_env import LocalEnv
+from utils.logging_setup import setup_logging
+from utils.macro import MacroStep, run_macro
+
+logger = logging.getLogger("ComputerAgent.batch_runner")
+
+
+class Session:
+    """一个独立的 agent 会话：显示后端 + OSWorldACI + Agent。
+
+    display 为 None 时会话只能处理外部传入截图的 predict 调用（见 server.py），不能自行执行任务。
+    """
+
+    def __init__(self, session_id, config: Dict, display=None):
+        self.session_id = session_id
+        self.display = display
+        platform = config.get("platform", "linux")
+        local_env = None
+        if config.get("enable_local_env"):
+            # 代码在会话自己的显示器上执行（如 Xvfb），而不是运行器所在的桌面
+            x_display = getattr(display, "display", None)
+            local_env = LocalEnv(env={"DISPLAY": x_display} if x_display else None)
+        self.grounding_agent = OSWorldACI(
+            env=local_env,
+            platform=platform,
+            engine_params_for_generation=config["engine_params"],
+            engine_params_for_grounding=config["engine_params_for_grounding"],
+            width=display.width if display is not None else config.get("width", 1920),
+            height=display.height if display is not None else config.get("height", 1080),
+        )
+        self.agent = Agent(
+            config["engine_params"],
+            self.grounding_agent,
+            platform=platform,
+            max_trajectory_length=config.get("max_trajectory_length", 8),
+            enable_reflection=config.get("enable_reflection", True),
+            pricing=config.get("pricing"),
+            warmup=config.get("warmup", False),
+            prime_cache=config.get("prime_cache", False),
+            macro_mode=config.get("macro_mode", False),
+            max_macro_actions=config.get("max_macro_actions", 4),
+        )
+
+    def reset(self) -> None:
+        """开始新任务：重置 agent 及其 OSWorldACI 中与上一个任务相关的状态。"""
+        self.agent.reset()
+
+    def run_task(self, task: Dict, default_max_steps: int) -> Dict:
+        """
+        执行一个任务直到 DONE / FAIL 或达到最大步数。
+
+        返回:
+            Dict: 任务结果，包含状态、步数（LLM 轮数）、执行的动作数、总耗时、模型推理耗时、动作执行耗时和 token 用量
+        """
+        for event in self.iter_task(task, default_max_steps):
+            pass
+        return event["result"]
+
+    def iter_task(self, task: Dict, default_max_steps: int) -> Iterator[Dict]:
+        """
+        逐步执行任务，每执行完一步产出一个 {"event": "step", ...}，
+        最后产出 {"event": "result", "result": 任务结果}。
+        """
+        self.reset()
+        max_steps = task.get("max_steps", default_max_steps)
+        result = {
+            "id": task.get("id"),
+            "instruction": task["instruction"],
+            "session": self.session_id,
+            "status": "max_steps",
+            "steps": 0,
+            "actions": 0,
+            "predict_seconds": 0.0,
+            "execute_seconds": 0.0,
+            "errors": [],
+        }
+        start = time.perf_counter()
+        try:
+            for _ in range(max_steps):
+                obs = {"screenshot": self.display.screenshot()}
+
+                predict_start = time.perf_counter()
+                info, actions = self.agent.predict(instruction=task["instruction"], observation=obs)
+                result["predict_seconds"] += time.perf_counter() - predict_start
+                result["steps"] += 1
+                result["usage"] = info.get("usage", {}).get("task")
+
+                action = actions[0]
+                step = {
+                    "event": "step",
+                    "step": result["steps"],
+                    "plan": info.get("plan"),
+                    "action": action,
+                    "usage": info.get("usage", {}).get("step"),
+                }
+                if action in ("DONE", "FAIL"):
+                    result["status"] = action.lower()
+                    yield step
+                    break
+
+                execute_start = time.perf_counter()
+                if "macro" in info:
+                    # 宏：连续执行多个动作，后置条件不成立时提前停下，执行情况在下一轮告知 generator
+                    outcome = run_macro(
+                        [MacroStep.from_json(item) for item in info["macro"]],
+                        self.display.execute_program,
+                        self.display.screenshot,
+                        obs["screenshot"],
+                    )
+                    self.agent.record_macro_result(outcome)
+                elif "action_program" in info:
+                    outcome = self.display.execute_program(from_json(info["action_program"]))
+                else:
+                    outcome = self.display.execute(action)
+                result["execute_seconds"] += time.perf_counter() - execute_start
+                result["actions"] += outcome.get("executed", 1)
+                step["execution"] = outcome
+                if outcome["status"] != "ok":
+                    result["errors"].append({"step": result["steps"], "error": outcome["error"]})
+                yield step
+        except Exception as e:
+            logger.exception(f"Task {task.get('id')} failed on session {self.session_id}")
+            result["status"] = "error"
+            result["errors"].append({"step": result["steps"], "error": str(e)})
+        result["seconds"] = time.perf_counter() - start
+        yield {"event": "result", "result": result}
+
+
+def load_tasks(path: str) -> List[Dict]:
+    """读取 JSONL 任务文件，缺少 id 的任务按行号编号。"""
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            task.setdefault("id", f"task-{line_num}")
+            tasks.append(task)
+    return tasks
+
+
+def run_batch(
+    tasks: List[Dict],
+    config: Dict,
+    output_path: str,
+    sessions: int = 1,
+    backend: str = "xvfb",
+    first_display: int = 99,
+    max_steps: int = 15,
+) -> List[Dict]:
+    """
+    并发执行任务列表，每完成一个任务就把结果追加写入 output_path。
+
+    参数:
+        tasks (List[Dict]): 任务列表
+        config (Dict): agent 配置
+        output_path (str): 结果文件（JSONL）
+        sessions (int): 并发会话数
+        backend (str): "xvfb" 为每个会话启动独立的虚拟显示器，"local" 使用当前桌面（仅支持 1 个会话）
+        first_display (int): 第一个 Xvfb 显示器编号
+        max_steps (int): 任务未指定 max_steps 时的默认最大步数
+
+    返回:
+        List[Dict]: 按完成顺序排列的任务结果
+    """
+    if backend == "local" and sessions != 1:
+        raise ValueError("local 后端只有一个桌面，只能使用 1 个会话")
+
+    width = config.get("width", 1920)
+    height = config.get("height", 1080)
+    displays = [
+        XvfbDisplay(first_display + i, width, height) if backend == "xvfb" else LocalDisplay(width, height)
+        for i in range(sessions)
+    ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    idle_sessions = queue.Queue()
+    results = []
+    write_lock = threading.Lock()
+    batch_start = time.perf_counter()
+
+    def run_one(task: Dict) -> Dict:
+        session = idle_sessions.get()
+        try:
+            result = session.run_task(task, max_steps)
+        finally:
+            idle_sessions.put(session)
+        with write_lock:
+            results.append(result)
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        logger.info(
+            f"Task {result['id']} finished: {result['status']} in {result['steps']} steps, "
+            f"{result['seconds']:.1f}s ({len(results)}/{len(tasks)})"
+        )
+        return result
+
+    try:
+        for i, display in enumerate(displays):
+            display.start()
+            idle_sessions.put(Session(i, config, display))
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="session") as executor:
+            list(executor.map(run_one, tasks))
+    finally:
+        for display in displays:
+            display.stop()
+
+    elapsed = time.perf_counter() - batch_start
+    logger.info(
+        f"Finished {len(results)} tasks with {sessions} sessions in {elapsed:.1f}s "
+        f"({len(results) / elapsed * 60:.2f} tasks/min)"
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="JSONL 任务文件")
+    parser.add_argument("--config", required=True, help="agent 配置（JSON）")
+    parser.add_argument("--output", default="logs/batch_results.jsonl", help="结果文件（JSONL）")
+    parser.add_argument("--sessions", type=int, default=1, help="并发会话数")
+    parser.add_argument("--backend", choices=["xvfb", "local"], default="xvfb")
+    parser.add_argument("--first-display", type=int, default=99)
+    parser.add_argument("--max-steps", type=int, default=15)
+    args = parser.parse_args()
+
+    # 与 main.py 一致，跳过代码中残留的断点
+    pdb.set_trace = lambda *args, **kwargs: None
+    # 多个会话同时输出时，控制台只保留日志和简短信息，完整的模型回复写入 logs/agent.log
+    setup_logging(quiet=True, console=True)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    results = run_batch(
+        load_tasks(args.tasks),
+        config,
+        args.output,
+        sessions=args.sessions,
+        backend=args.backend,
+        first_display=args.first_display,
+        max_steps=args.max_steps,
+    )
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    print(f"{len(results)} tasks: {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+无桌面回放录制的轨迹，测量 agent 流水线自身的开销（模型调用由录制的回复代替），
+并检查生成的动作是否与录制时一致。
+
+轨迹由 main.py 中的 record_trajectory 选项录制。
+
+用法:
+    python -m benchmarks.bench_replay logs/trajectory.jsonl [--repeat 3]
+"""
+import argparse
+import statistics
+
+from utils.trajectory import replay_trajectory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("trajectory")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    step_times = []
+    for _ in range(args.repeat):
+        report = replay_trajectory(args.trajectory)
+        step_times.extend(report["step_seconds"])
+
+    print(f"steps: {report['steps']} x {args.repeat}")
+    if step_times:
+        print(f"per step: mean {statistics.mean(step_times) * 1e3:.2f} ms, "
+              f"max {max(step_times) * 1e3:.2f} ms")
+    print(f"responses: {report['exact_matches']} exact, {report['fallback_matches']} fallback, "
+          f"{report['unused_calls']} unused")
+    print(f"action mismatches: {len(report['mismatches'])}")
+    for mismatch in report["mismatches"]:
+        print(f"  step {mismatch['step']}:")
+        print(f"    expected: {mismatch['expected']}")
+        print(f"    actual:   {mismatch['actual']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+生成器回复解析的微基准：对比旧实现（每个校验器各自解析）与 parse_response（每个回复解析一次）。
+
+用法:
+    python -m benchmarks.bench_response_parsing [--thought-chars 200000] [--repeat 200]
+"""
+import argparse
+import re
+import time
+
+from utils.common_utils import parse_response
+
+
+def _legacy_parse_code(input_string):
+    matches = re.findall(r"```(?:\w+\s+)?(.*?)```", input_string.strip(), re.DOTALL)
+    return matches[-1] if matches else ""
+
+
+def _legacy_split(full_response):
+    thoughts = full_response.split("<thoughts>")[-1].split("</thoughts>")[0].strip()
+    answer = full_response.split("<answer>")[-1].split("</answer>")[0].strip()
+    return answer, thoughts
+
+
+def _legacy_agent_functions(code):
+    return re.findall(r"(agent\.\w+\(\s*.*\))", code)
+
+
+def legacy_pipeline(response):
+    """旧流程：SINGLE_ACTION、CODE_VALID、THOUGHTS_ANSWER 校验和 worker 各自解析一次。"""
+    len(_legacy_agent_functions(_legacy_parse_code(response))) == 1
+    _legacy_parse_code(response)
+    _legacy_split(response)[1] != ""
+    return _legacy_parse_code(response)
+
+
+def shared_pipeline(response):
+    """新流程：每个回复解析一次，所有校验器和 worker 读取同一份结果。"""
+    len(parse_response(response).agent_calls) == 1
+    parse_response(response).code
+    parse_response(response).thoughts != ""
+    return parse_response(response).code
+
+
+def build_response(thought_chars: int) -> str:
+    # 思考内容中混入代码片段和反引号，模拟 thinking 模型的长输出
+    filler = "分析截图中的按钮位置，考虑 `agent.click` 的参数 (x, y) 是否合适。\n"
+    thoughts = (filler * (thought_chars // len(filler) + 1))[:thought_chars]
+    return (
+        f"<thoughts>\n{thoughts}\n</thoughts>\n\n<answer>\n"
+        "（下一步动作）点击搜索框。\n"
+        "```python\nagent.click(\"页面顶部的搜索框 (输入框)\", 1, \"left\")\n```\n"
+        "</answer>\n"
+    )
+
+
+def bench(func, responses, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            func(response)
+    return (time.perf_counter() - start) / (repeat * len(responses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--thought-chars", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # 每轮构造新的字符串对象，避免跨轮次命中 parse_response 的缓存
+    base = build_response(args.thought_chars)
+    responses = [base + " " * i for i in range(4)]
+
+    assert legacy_pipeline(responses[0]) == shared_pipeline(responses[0])
+
+    legacy = bench(legacy_pipeline, responses, args.repeat)
+    parse_response.cache_clear()
+    shared = bench(
+        lambda r: (parse_response.cache_clear(), shared_pipeline(r)), responses, args.repeat
+    )
+    print(f"response size: {len(base)} chars")
+    print(f"legacy (parse per checker): {legacy * 1e3:.3f} ms/response")
+    print(f"shared (parse once):        {shared * 1e3:.3f} ms/response")
+    print(f"speedup: {legacy / shared:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+测量冷启动开销：在全新的解释器中导入 agent 模块并构建 OSWorldACI 与 Agent，
+报告导入耗时、构建耗时，以及构建完成后已加载的重量级依赖。
+
+每次测量都启动新的子进程，结果取中位数。
+
+用法:
+    python -m benchmarks.bench_startup [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("openai", "backoff", "numpy", "PIL", "pytesseract", "pyautogui")
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+from utils.grounding import OSWorldACI
+from agent.agent import Agent
+imported = time.perf_counter()
+engine_params = {{"engine_type": "openai", "model": "m", "base_url": "http://localhost", "api_key": "k"}}
+grounding_agent = OSWorldACI(
+    env=None,
+    platform="linux",
+    engine_params_for_generation=engine_params,
+    engine_params_for_grounding=dict(engine_params, grounding_width=1000, grounding_height=1000),
+)
+agent = Agent(engine_params, grounding_agent, platform="linux")
+built = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "build_seconds": built - imported,
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(run["import_seconds"] for run in runs) * 1e3
+    build_ms = statistics.median(run["build_seconds"] for run in runs) * 1e3
+    print(f"runs: {args.repeat}")
+    print(f"import: {import_ms:.1f} ms (median)")
+    print(f"build OSWorldACI + Agent: {build_ms:.1f} ms (median)")
+    print(f"heavy modules loaded: {', '.join(runs[-1]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+测量两种输入策略的速度（字符/秒）：一次 pyautogui.write 和剪贴板粘贴，用于调整 PASTE_THRESHOLD。
+
+动作在 ActionExecutor 中执行，耗时按命令取执行进程内的时间（不含管道通信），结果取中位数。
+粘贴的耗时只包括写入剪贴板和粘贴快捷键；保存与恢复剪贴板的耗时单独列在 restore 列，
+其间固定等待的 CLIPBOARD_RESTORE_DELAY 不计入任何一列。
+在当前桌面上运行时按键会发送到获得焦点的窗口，请先打开一个空白文本编辑器并在倒计时内点击它；
+使用 --xvfb 时在独立的 Xvfb 显示器上运行，不会影响当前桌面。
+
+用法:
+    python -m benchmarks.bench_typing [--lengths 16,64,256,1024] [--repeat 3] [--xvfb 99]
+"""
+import argparse
+import statistics
+import time
+
+from utils import actions
+from utils.actions import TypeText, compile_commands
+from utils.display import LocalDisplay, XvfbDisplay
+
+SAMPLE = "id,name,amount; def total(rows): return sum(r[2] for r in rows)  # ASCII text 0123456789 "
+
+
+def _sample_text(length: int) -> str:
+    return (SAMPLE * (length // len(SAMPLE) + 1))[:length]
+
+
+def _strategies(text: str):
+    return {
+        "write": compile_commands((TypeText(text),)),
+        "paste": compile_commands((TypeText(text, clipboard=True),)),
+    }
+
+
+def _split_seconds(commands, command_seconds):
+    """按命令拆分耗时，返回 (输入耗时, 保存与恢复剪贴板的耗时)，sleep 不计入。"""
+    typing = restore = 0.0
+    for command, seconds in zip(commands, command_seconds):
+        if command["op"] in ("clipboard_save", "clipboard_restore"):
+            restore += seconds
+        elif command["op"] != "sleep":
+            typing += seconds
+    return typing, restore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", default="16,64,256,1024", help="逗号分隔的文本长度")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--xvfb", type=int, metavar="DISPLAY_NUM", help="在指定编号的 Xvfb 显示器上运行")
+    parser.add_argument("--delay", type=float, default=5.0, help="在当前桌面运行时开始前的等待秒数")
+    args = parser.parse_args()
+    lengths = [int(length) for length in args.lengths.split(",")]
+
+    display = XvfbDisplay(args.xvfb) if args.xvfb is not None else LocalDisplay()
+    display.start()
+    try:
+        if args.xvfb is None:
+            print(f"按键将发送到当前焦点窗口，请在 {args.delay:.0f} 秒内点击一个空白文本编辑器")
+            time.sleep(args.delay)
+
+        print(
+            f"PASTE_THRESHOLD={actions.PASTE_THRESHOLD} "
+            f"CLIPBOARD_RESTORE_DELAY={actions.CLIPBOARD_RESTORE_DELAY}（不计入耗时）"
+        )
+        print(f"{'length':>8} {'strategy':>8} {'seconds':>9} {'chars/s':>10} {'restore':>9}")
+        for length in lengths:
+            text = _sample_text(length)
+            for name, commands in _strategies(text).items():
+                typing, restore = [], []
+                for _ in range(args.repeat):
+                    outcome = display.executor.run(commands)
+                    if outcome["status"] != "ok":
+                        raise RuntimeError(f"{name} ({length} chars) failed: {outcome['error']}")
+                    seconds = _split_seconds(commands, outcome["command_seconds"])
+                    typing.append(seconds[0])
+                    restore.append(seconds[1])
+                median = statistics.median(typing)
+                restore_column = f"{statistics.median(restore):>9.3f}" if name == "paste" else f"{'-':>9}"
+                print(f"{length:>8} {name:>8} {median:>9.3f} {length / median:>10.0f} {restore_column}")
+    finally:
+        display.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,91 @@
+import functools
 import os
-import backoff
-from openai import OpenAI, APIConnectionError, APIError, RateLimitError
+import threading
+import time
 
+from utils.telemetry import record_usage
 
-class LLMEngineOpenAI:
+
+def _retry_on_api_errors(func):
+    """Retry with exponential backoff on OpenAI API errors.
+
+    openai and backoff are imported on the first call rather than at module import,
+    which keeps them off the startup path of processes that never reach a model call.
+    """
+    retrying = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal retrying
+        if retrying is None:
+            import backoff
+            from openai import APIConnectionError, APIError, RateLimitError
+
+            retrying = backoff.on_exception(
+                backoff.expo, (APIConnectionError, APIError, RateLimitError), max_time=60
+            )(func)
+        return retrying(*args, **kwargs)
+
+    return wrapper
+
+
+# One client per endpoint, shared by every engine (and every concurrent session) in the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(base_url=None, api_key=None, organization=None):
+    """Return the shared OpenAI client for an endpoint so all engines reuse one connection pool."""
+    key = (base_url, api_key, organization)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            kwargs = {"api_key": api_key, "organization": organization}
+            if base_url:
+                kwargs["base_url"] = base_url
+            from openai import OpenAI
+
+            client = OpenAI(**kwargs)
+            _clients[key] = client
+        return client
+
+
+class _UsageMixin:
+    """Keeps the usage block of the latest completion per thread (engines can be shared by worker threads)."""
+
+    @property
+    def last_usage(self):
+        return getattr(self._usage_local, "usage", None)
+
+    def _record_usage(self, usage):
+        self._usage_local.usage = usage
+        record_usage(usage)
+
+    def warmup(self, messages=None):
+        """Open a pooled connection to the endpoint ahead of the first real request.
+
+        Without messages a cheap models listing is issued just to complete the TCP/TLS
+        handshake. With messages a one-token completion is sent so the server can load
+        the prompt prefix into its cache; its usage is recorded like any other completion.
+        Returns the elapsed seconds.
+        """
+        start = time.perf_counter()
+        client = self._get_client()
+        if messages:
+            completion = client.chat.completions.create(
+                model=self.model, messages=messages, max_tokens=1, temperature=0
+            )
+            self._record_usage(completion.usage)
+        else:
+            try:
+                client.models.list()
+            except Exception:
+                # Some servers do not expose /models; any HTTP response still leaves a pooled connection
+                pass
+        return time.perf_counter() - start
+
+
+class LLMEngineOpenAI(_UsageMixin):
     def __init__(
         self,
         base_url=None,
@@ -21,54 +103,37 @@ class LLMEngineOpenAI:
         self.organization = organization
         self.request_interval = 0 if rate_limit == -1 else 60.0 / rate_limit
         self.llm_client = None
+        self._usage_local = threading.local()  # usage of the most recent completion (prompt / completion tokens)
         self.temperature = temperature  # Can force temperature to be the same (in the case of o3 requiring temperature to be 1)
 
-    # 重连接测试
-    @backoff.on_exception(
-        backoff.expo, (APIConnectionError, APIError, RateLimitError), max_time=60
-    )
-
-    def generate(self, messages, temperature=0.0, max_new_tokens=None, **kwargs):
+    def _get_client(self):
         api_key = self.api_key or os.getenv("OPENAI_API_KEY")
-        
         if api_key is None:
             raise ValueError(
                 "An API Key needs to be provided in either the api_key parameter or as an environment variable named OPENAI_API_KEY"
             )
         organization = self.organization or os.getenv("OPENAI_ORG_ID")
         if not self.llm_client:
-            if not self.base_url:
-                self.llm_client = OpenAI(api_key=api_key, organization=organization)
-            else:
-                self.llm_client = OpenAI(base_url=self.base_url, api_key=api_key, organization=organization)
-                
-        return (
-            self.llm_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                # max_completion_tokens=max_new_tokens if max_new_tokens else 4096,
-                temperature=(temperature if self.temperature is None else self.temperature),
-                **kwargs,
-            )
-            .choices[0]
-            .message.content
+            self.llm_client = get_openai_client(self.base_url, api_key, organization)
+        return self.llm_client
+
+    # 重连接测试
+    @_retry_on_api_errors
+
+    def generate(self, messages, temperature=0.0, max_new_tokens=None, **kwargs):
+        completion = self._get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            # max_completion_tokens=max_new_tokens if max_new_tokens else 4096,
+            temperature=(temperature if self.temperature is None else self.temperature),
+            **kwargs,
         )
+        self._record_usage(completion.usage)
+        return completion.choices[0].message.content
 
     def generate_with_thinking(self, messages, temperature=0.0, max_new_tokens=None, **kwargs):
-        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
         extra_body = {"thinking": {"type": "enabled"}}  # Enable thinking mode
-        if api_key is None:
-            raise ValueError(
-                "An API Key needs to be provided in either the api_key parameter or as an environment variable named OPENAI_API_KEY"
-            )
-        organization = self.organization or os.getenv("OPENAI_ORG_ID")
-        if not self.llm_client:
-            if not self.base_url:
-                self.llm_client = OpenAI(api_key=api_key, organization=organization)
-            else:
-                self.llm_client = OpenAI(base_url=self.base_url, api_key=api_key, organization=organization)
-                
-        completion = self.llm_client.chat.completions.create(
+        completion = self._get_client().chat.completions.create(
             model=self.model,
             messages=messages,
             # max_completion_tokens=max_new_tokens if max_new_tokens else 4096,
@@ -77,6 +142,7 @@ class LLMEngineOpenAI:
             **kwargs,
         )
             
+        self._record_usage(completion.usage)
         thoughts = completion.choices[0].message.model_extra['reasoning_content']
         answer = completion.choices[0].message.content
         full_response = (
@@ -86,7 +152,7 @@ class LLMEngineOpenAI:
    
     
 
-class LMMEnginevLLM:
+class LMMEnginevLLM(_UsageMixin):
     def __init__(
         self,
         base_url=None,
@@ -102,21 +168,10 @@ class LMMEnginevLLM:
         self.base_url = base_url
         self.request_interval = 0 if rate_limit == -1 else 60.0 / rate_limit
         self.llm_client = None
+        self._usage_local = threading.local()
         self.temperature = temperature
 
-    @backoff.on_exception(
-        backoff.expo, (APIConnectionError, APIError, RateLimitError), max_time=60
-    )
-
-    def generate(
-        self,
-        messages,
-        temperature=0.0,
-        top_p=0.8,
-        repetition_penalty=1.05,
-        max_new_tokens=2048,
-        **kwargs,
-    ):
+    def _get_client(self):
         api_key = self.api_key or os.getenv("vLLM_API_KEY")
         if api_key is None:
             raise ValueError(
@@ -128,10 +183,23 @@ class LMMEnginevLLM:
                 "An endpoint URL needs to be provided in either the endpoint_url parameter or as an environment variable named vLLM_ENDPOINT_URL"
             )
         if not self.llm_client:
-            self.llm_client = OpenAI(base_url=base_url, api_key=api_key)
+            self.llm_client = get_openai_client(base_url, api_key)
+        return self.llm_client
+
+    @_retry_on_api_errors
+
+    def generate(
+        self,
+        messages,
+        temperature=0.0,
+        top_p=0.8,
+        repetition_penalty=1.05,
+        max_new_tokens=2048,
+        **kwargs,
+    ):
         # Use self.temperature if set, otherwise use the temperature argument
         temp = self.temperature if self.temperature is not None else temperature
-        completion = self.llm_client.chat.completions.create(
+        completion = self._get_client().chat.completions.create(
             model=self.model,
             messages=messages,
             max_tokens=max_new_tokens if max_new_tokens else 4096,
@@ -139,6 +207,7 @@ class LMMEnginevLLM:
             top_p=top_p,
             extra_body={"repetition_penalty": repetition_penalty},
         )
+        self._record_usage(completion.usage)
         return completion.choices[0].message.content
 
     def generate_with_thinking(
@@ -150,22 +219,10 @@ class LMMEnginevLLM:
         max_new_tokens=2048,
         **kwargs,
     ):
-        api_key = self.api_key or os.getenv("vLLM_API_KEY")
         extra_body = {"repetition_penalty": repetition_penalty, "thinking": {"type": "enabled"}}
-        if api_key is None:
-            raise ValueError(
-                "A vLLM API key needs to be provided in either the api_key parameter or as an environment variable named vLLM_API_KEY"
-            )
-        base_url = self.base_url or os.getenv("vLLM_ENDPOINT_URL")
-        if base_url is None:
-            raise ValueError(
-                "An endpoint URL needs to be provided in either the endpoint_url parameter or as an environment variable named vLLM_ENDPOINT_URL"
-            )
-        if not self.llm_client:
-            self.llm_client = OpenAI(base_url=base_url, api_key=api_key)
         # Use self.temperature if set, otherwise use the temperature argument
         temp = self.temperature if self.temperature is not None else temperature
-        completion = self.llm_client.chat.completions.create(
+        completion = self._get_client().chat.completions.create(
             model=self.model,
             messages=messages,
             max_tokens=max_new_tokens if max_new_tokens else 4096,
@@ -174,9 +231,31 @@ class LMMEnginevLLM:
             extra_body=extra_body,
         )
 
+        self._record_usage(completion.usage)
         thoughts = completion.choices[0].message.model_extra['reasoning_content']
         answer = completion.choices[0].message.content
         full_response = (
             f"<thoughts>\n{thoughts}\n</thoughts>\n\n<answer>\n{answer}\n</answer>\n"
         )
-        return full_response
\ No newline at end of file
+        return full_response
+
+
+class LLMEngineReplay:
+    """Serves recorded responses instead of calling a model, used to replay trajectories offline."""
+
+    def __init__(self, source=None, model=None, temperature=None, **kwargs):
+        assert source is not None, "source must be provided"
+        self.source = source
+        self.model = model
+        self.llm_client = None
+        self.temperature = temperature
+
+    def generate(self, messages, temperature=0.0, max_new_tokens=None, **kwargs):
+        return self.source.next_response(self.model, messages)
+
+    def generate_with_thinking(self, messages, temperature=0.0, max_new_tokens=None, **kwargs):
+        return self.source.next_response(self.model, messages)
+
+    def warmup(self, messages=None):
+        # Nothing to connect to; a priming request would also consume a recorded response
+        return 0.0
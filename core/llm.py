@@ -1,6 +1,6 @@
 import base64
-import numpy as np
-from core.engine import LLMEngineOpenAI, LMMEnginevLLM
+import sys
+from core.engine import LLMEngineOpenAI, LLMEngineReplay, LMMEnginevLLM
 import pdb
 
 
@@ -8,6 +8,9 @@ class LLMAgent:
     def __init__(self, engine_params: dict, system_prompt=None, engine=None):
         self.engine_params = engine_params
         self.messages = []  # Empty messages
+        # Optional token accounting: calls made through call_llm_safe are recorded under this role
+        self.usage_tracker = None
+        self.usage_role = None
         if system_prompt:
             for prompt in system_prompt:
                 self.add_system_prompt(prompt)
@@ -22,6 +25,8 @@ class LLMAgent:
                     self.engine = LLMEngineOpenAI(**engine_params)
                 elif engine_type == "vllm":
                     self.engine = LMMEnginevLLM(**engine_params)
+                elif engine_type == "replay":
+                    self.engine = LLMEngineReplay(**engine_params)
                 else:
                     raise ValueError(f"engine_type '{engine_type}' is not supported")
                 
@@ -39,6 +44,20 @@ class LLMAgent:
         else:
             return base64.b64encode(image_content).decode("utf-8")
 
+    def warmup(self, prime=False):
+        """Connect to the engine's endpoint ahead of time; with prime, also send the system prompt for prefix caching.
+
+        The priming completion is billed, so its usage goes to the usage tracker under the "warmup" role.
+        """
+        warmup = getattr(self.engine, "warmup", None)
+        if warmup is None:
+            return 0.0
+        seconds = warmup(self.messages[:1] if prime else None)
+        usage = getattr(self.engine, "last_usage", None)
+        if prime and self.usage_tracker is not None and usage is not None:
+            self.usage_tracker.record("warmup", self.engine.model, usage)
+        return seconds
+
     def reset(self):
         self.messages = [
             {
@@ -101,6 +120,7 @@ class LLMAgent:
             self.engine,
             (
                 LLMEngineOpenAI,
+                LLMEngineReplay,
             ),
         ):
             # infer role from previous message
@@ -117,7 +137,9 @@ class LLMAgent:
                 "content": [{"type": "text", "text": text_content}],
             }
 
-            if isinstance(image_content, np.ndarray) or image_content:
+            # numpy is only consulted if something already imported it; otherwise no ndarray can be passed
+            np = sys.modules.get("numpy")
+            if (np is not None and isinstance(image_content, np.ndarray)) or image_content:
                 # Check if image_content is a list or a single image
                 if isinstance(image_content, list):
                     # If image_content is a list of images, loop through each image
@@ -1,39 +1,16 @@
-import pyautogui
 import io
 from utils.local_env import LocalEnv
 from utils.grounding import OSWorldACI
 from agent.agent import Agent
-import logging
-import os
+from utils import telemetry
+from utils.trajectory import TrajectoryRecorder, agent_config
+from utils.logging_setup import setup_logging
+from utils.action_executor import ActionExecutor
+from utils.actions import compile_commands, from_json
+from utils.macro import MacroStep, run_macro
 import pdb
 
 
-def setup_logging():
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-
-    log_file = os.path.join(log_dir, "agent.log")
-
-    # 🔑 统一的父 logger
-    root_logger = logging.getLogger("ComputerAgent")
-    root_logger.setLevel(logging.INFO)
-
-    # 文件 handler
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    file_handler.setLevel(logging.INFO)
-
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    file_handler.setFormatter(formatter)
-
-    # 防止重复添加 handler
-    if not root_logger.handlers:
-        root_logger.addHandler(file_handler)
-
-
-
-
 def init_computer_agent():
     current_platform = "windows"
 
@@ -87,20 +64,47 @@ def init_computer_agent():
         grounding_agent,
         platform=current_platform,
         max_trajectory_length=8,  # Optional: maximum image turns to keep
-        enable_reflection=True     # Optional: enable reflection agent
+        enable_reflection=True,    # Optional: enable reflection agent
+        warmup=True,               # Optional: connect to the model endpoints in the background on every reset
+        prime_cache=False,         # Optional: also send the system prompts so the server caches their prefix
+        macro_mode=False,          # Optional: allow several actions per turn, checked by a cheap screen-change test
     )
 
     return grounding_agent, agent
 
 
+def take_screenshot() -> bytes:
+    """截取当前屏幕，返回 PNG 字节。"""
+    import pyautogui
+
+    buffered = io.BytesIO()
+    pyautogui.screenshot().save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
 if __name__ == "__main__":
 
     pdb.set_trace = lambda *args, **kwargs: None  # 注释掉所有 pdb.set_trace 调用
 
-    setup_logging()
+    # 日志在后台线程写入 logs/agent.log（按大小轮转）；quiet=True 时控制台不再打印完整的模型回复
+    setup_logging(quiet=False)
+    # 动作在常驻的执行进程中执行（预先导入 pyautogui / pyperclip），与 agent 进程隔离
+    executor = ActionExecutor()
+    executor.start()
     grounding_agent, agent = init_computer_agent()
     print("Computer Agent initialized successfully.")
 
+    # Optional: write per-phase timing / token spans of every step (utils/telemetry.py)
+    telemetry_path = None  # e.g. "logs/spans.jsonl"
+    if telemetry_path:
+        telemetry.add_sink(telemetry.JSONLSink(telemetry_path))
+
+    # Optional: record each step to a trajectory file for offline replay (utils/trajectory.py)
+    record_trajectory = None  # e.g. "logs/trajectory.jsonl"
+    recorder = None
+    if record_trajectory:
+        recorder = TrajectoryRecorder(record_trajectory, config=agent_config(agent)).start()
+
     # instruction = "打开浏览器中的bilibili网站，然后搜索走路摇ZLY相关的视频并播放一个。"
 
     label = 0
@@ -114,10 +118,7 @@ if __name__ == "__main__":
                 label = 1
 
         # Get screenshot.
-        screenshot = pyautogui.screenshot()
-        buffered = io.BytesIO() 
-        screenshot.save(buffered, format="PNG")
-        screenshot_bytes = buffered.getvalue()
+        screenshot_bytes = take_screenshot()
 
         obs = {
         "screenshot": screenshot_bytes,
@@ -125,22 +126,46 @@ if __name__ == "__main__":
         
         # pdb.set_trace()
         info, action = agent.predict(instruction=instruction, observation=obs)
+        if recorder is not None:
+            recorder.record_step(instruction, obs, info, action)
 
         # 打印代理决策信息和执行代码
         print("="*50 + " Agent Info " + "="*50)
         print(info)
         print("\n" + "="*50 + " Agent Action " + "="*50)
-        print(action[0])
+        print("\n".join(action))
 
         # 执行生成的代码（完整完成任务）
         print("\n" + "="*50 + " 开始执行单步任务 " + "="*50)
         # 任务完成返回的是DONE
-        if action[0] != "DONE" and action[0] != "FAIL":
-            exec(action[0])
-            print(f"{action[0]}单步任务执行完成！\n\n")
+        if "macro" in info:
+            # 宏：逐个执行动作，后置条件不成立时停下，执行情况在下一轮告知模型
+            outcome = run_macro(
+                [MacroStep.from_json(item) for item in info["macro"]],
+                lambda program: executor.run(compile_commands(program)),
+                take_screenshot,
+                screenshot_bytes,
+            )
+            agent.record_macro_result(outcome)
+            print(
+                f"宏执行了 {outcome['executed']}/{outcome['total']} 个动作"
+                f"（{outcome['seconds'] * 1e3:.0f} ms）{outcome['stop_reason']}\n\n"
+            )
+        elif action[0] != "DONE" and action[0] != "FAIL":
+            if "action_program" in info:
+                # 执行类型化的动作序列，不经过 exec；没有动作序列时才执行渲染出的代码字符串
+                outcome = executor.run(compile_commands(from_json(info["action_program"])))
+            else:
+                outcome = executor.execute(action[0])
+            if outcome["status"] == "ok":
+                print(f"{action[0]}单步任务执行完成！（{outcome['seconds'] * 1e3:.0f} ms）\n\n")
+            else:
+                print(f"{action[0]}单步任务执行失败：{outcome['error']}\n\n")
         elif action[0] == "DONE":
             label = 0
             print("任务执行完成！\n\n")
         else:
             label = 0
             print(f"任务执行{action[0]}，无法完成！\n\n")
+
+    executor.shutdown()
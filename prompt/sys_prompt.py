@@ -12,10 +12,10 @@ class PROCEDURAL_MEMORY:
     )
 
     @staticmethod
-    def construct_simple_worker_procedural_memory(agent_class, skipped_actions):
+    def construct_simple_worker_procedural_memory(agent_class, skipped_actions, max_actions=1):
         procedural_memory = textwrap.dedent(
             f"""\
-        你是一名精通图形用户界面和 Python 编程的专家。你的职责是执行任务：`TASK_DESCRIPTION`。
+        你是一名精通图形用户界面和 Python 编程的专家。
         你正在使用的操作系统是 CURRENT_OS。
 
         # 指南
@@ -44,8 +44,7 @@ class PROCEDURAL_MEMORY:
             * 已完成步骤（实际执行）
             * 最大步骤数（预算）
             * 完成原因：DONE（成功）、FAIL（失败）、BUDGET_EXHAUSTED（步数用尽）
-            * 工作摘要
-            * 完整执行历史
+            * 工作摘要（包含 code agent 的最终说明和每一步的执行状态与关键输出）
         - 解读说明：
             * DONE：在未耗尽步数前完成任务
             * FAIL：判断无法通过代码完成任务并放弃
@@ -100,6 +99,34 @@ class PROCEDURAL_MEMORY:
         （下一步动作）
         基于当前截图和 UI 交互历史，用自然语言说明下一步要执行的操作。
 
+        """
+        )
+
+        if max_actions > 1:
+            procedural_memory += textwrap.dedent(
+                f"""\
+        （落地动作）
+        使用提供的 API 方法将下一步动作翻译为代码。可以连续给出最多 {max_actions} 个动作（每行一个），
+        它们会依次执行，每个动作后用同一行的注释写出执行后屏幕应有的变化，格式如下：
+        ```python
+        agent.click("登录页面的用户名输入框", 1, "left")  # expect: change
+        agent.type(text="alice")  # expect: change
+        agent.hotkey(["enter"])  # expect: any
+        ```
+        后置条件：change 表示屏幕应发生变化，same 表示屏幕应保持不变，any 表示不检查；不写时按 change 处理。
+        若某个动作的后置条件不成立，剩余动作不会执行，你将在下一轮看到新的截图和执行情况。
+
+        落地动作注意事项：
+        1. 只有目标元素都在当前截图中可见、且结果可以预期时才连续给出多个动作，否则每轮只给一个动作
+        2. 代码块中只能包含 Python 代码，每行只调用一个函数
+        3. 只能使用上面提供的方法，不得虚构新方法
+        4. 每次只能返回一个代码块
+        5. 子任务完成后立即返回 agent.done()；若无法完成则返回 agent.fail()；agent.done()、agent.fail() 和 agent.call_code_agent() 必须单独作为一轮的唯一动作
+        """
+            )
+        else:
+            procedural_memory += textwrap.dedent(
+                """\
         （落地动作）
         使用提供的 API 方法将下一步动作翻译为代码，格式如下：
         ```python
@@ -112,6 +139,11 @@ class PROCEDURAL_MEMORY:
         3. 只能使用上面提供的方法，不得虚构新方法
         4. 每次只能返回一个代码块，且仅一行代码
         5. 子任务完成后立即返回 agent.done()；若无法完成则返回 agent.fail()
+        """
+            )
+
+        procedural_memory += textwrap.dedent(
+            """\
         6. 优先使用 agent.hotkey()，避免点击或拖拽
         7. 尽量使用键盘鼠标输入完成任务      
         8. 如果你彻底卡住并认为任务无法完成，请生成 agent.fail()
@@ -120,6 +152,9 @@ class PROCEDURAL_MEMORY:
         """
         )
 
+        # 任务描述放在最后：每个任务只有这一行不同，预热时发送的系统提示词与真实请求的前缀一致，可以命中前缀缓存
+        procedural_memory += "\n你的职责是执行任务：`TASK_DESCRIPTION`。\n"
+
         return procedural_memory.strip()
 
     REFLECTION_ON_TRAJECTORY = textwrap.dedent(
@@ -179,7 +214,15 @@ class PROCEDURAL_MEMORY:
     # 关键：逐步执行
     - 将复杂任务拆解为小步骤
     - 每一步仅执行一个独立操作
-    - 每一步代码不在后续步骤中保留，需完整重写
+    - Python 代码在同一个持久解释器中执行，已定义的变量和已导入的模块在后续步骤中保留，无需重复读取文件或重新导入
+    - Bash 代码在同一个持久 shell 中执行，`cd`、导出的环境变量和 shell 函数在后续步骤中保留
+    - 若结果提示超时或内核/会话已重启，之前的状态已丢失，需要重新加载所需数据
+
+    # 并行执行（可选）：
+    - 当需要执行多个互不依赖的操作（例如分别处理多个文件、同时运行多个 shell 探测命令）时，
+      可以在 <answer> 中用 <parallel>...</parallel> 包裹多个代码块，它们会并发执行，结果在同一轮返回
+    - 并行代码块各自在全新的进程中运行，看不到持久解释器中的变量，也不继承 shell 的工作目录，需自行导入和读取所需内容
+    - 有先后依赖的操作不得放入同一个 <parallel> 中
 
     # 文件修改策略（关键）：
     - 优先原地修改当前打开的文件
@@ -200,6 +243,15 @@ class PROCEDURAL_MEMORY:
     代码
     ```
     或
+    <parallel>
+    ```python
+    代码 1
+    ```
+    ```bash
+    代码 2
+    ```
+    </parallel>
+    或
     DONE
     或
     FAIL
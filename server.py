@@ -0,0 +1,310 @@
+"""
+本地 agent 服务：常驻进程中维护多个相互隔离的会话（各自的 Agent、OSWorldACI 和缓存），
+模型客户端与连接池在会话之间共享，请求之间不需要重新初始化或启动新进程。
+
+配置文件与 batch_runner.py 相同（JSON），创建会话时可以在请求体中覆盖其中的配置项。
+
+接口（请求与响应均为 JSON）:
+    GET    /health                    服务状态与会话数
+    POST   /sessions                  创建会话，返回 {"session_id": ...}
+    DELETE /sessions/<id>             关闭会话
+    POST   /sessions/<id>/reset       重置会话（开始新任务）
+    POST   /sessions/<id>/predict     {"instruction": ..., "screenshot": base64 PNG}
+                                      -> {"info": ..., "actions": [...]}
+    POST   /sessions/<id>/tasks       {"instruction": ..., "max_steps": 15}，在会话自己的显示后端上执行任务，
+                                      以 NDJSON 流式返回每一步，最后一行为任务结果（需要 --backend local / xvfb）
+
+用法:
+    python server.py --config config.json --port 8765
+    python server.py --config config.json --unix-socket /tmp/computer-agent.sock --backend xvfb
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import pdb
+import re
+import socketserver
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+from batch_runner import Session
+from utils.display import LocalDisplay, XvfbDisplay
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger("ComputerAgent.server")
+
+_SESSION_ROUTE = re.compile(r"^/sessions/([^/]+)(?:/(reset|predict|tasks))?$")
+
+
+class _ServedSession:
+    """服务中的一个会话；同一会话的请求串行执行，不同会话之间并发。"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.lock = threading.Lock()
+
+
+class AgentServer:
+    """与传输方式无关的会话管理，HTTP / Unix socket 请求都转发到这里。"""
+
+    def __init__(self, config: Dict, backend: str = "none", first_display: int = 99, max_steps: int = 15):
+        """
+        参数:
+            config (Dict): 默认的 agent 配置
+            backend (str): 任务执行后端，"none" 只支持 predict，"local" 使用当前桌面（同时只能有 1 个会话），
+                "xvfb" 为每个会话启动独立的虚拟显示器
+            first_display (int): 第一个 Xvfb 显示器编号
+            max_steps (int): 任务未指定 max_steps 时的默认最大步数
+        """
+        if backend not in ("none", "local", "xvfb"):
+            raise ValueError(f"unknown backend: {backend}")
+        self.config = config
+        self.backend = backend
+        self.max_steps = max_steps
+        self.sessions: Dict[str, _ServedSession] = {}
+        self._lock = threading.Lock()
+        self._display_nums = itertools.count(first_display)
+
+    def _create_display(self, width: int, height: int):
+        if self.backend == "xvfb":
+            display = XvfbDisplay(next(self._display_nums), width, height)
+            display.start()
+            return display
+        if self.backend == "local":
+            if self.sessions:
+                raise ValueError("local 后端只有一个桌面，只能同时存在 1 个会话")
+            display = LocalDisplay(width, height)
+            display.start()
+            return display
+        return None
+
+    def create_session(self, overrides: Optional[Dict] = None) -> str:
+        """创建会话，overrides 中的配置项覆盖默认配置，返回会话 id。"""
+        config = dict(self.config, **(overrides or {}))
+        session_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            display = self._create_display(config.get("width", 1920), config.get("height", 1080))
+            try:
+                session = Session(session_id, config, display)
+            except Exception:
+                if display is not None:
+                    display.stop()
+                raise
+            self.sessions[session_id] = _ServedSession(session)
+        logger.info("Created session %s (%d active)", session_id, len(self.sessions))
+        return session_id
+
+    def _get(self, session_id: str) -> _ServedSession:
+        served = self.sessions.get(session_id)
+        if served is None:
+            raise KeyError(f"session {session_id} not found")
+        return served
+
+    def close_session(self, session_id: str) -> None:
+        with self._lock:
+            served = self.sessions.pop(session_id, None)
+        if served is None:
+            raise KeyError(f"session {session_id} not found")
+        with served.lock:
+            if served.session.display is not None:
+                served.session.display.stop()
+        logger.info("Closed session %s (%d active)", session_id, len(self.sessions))
+
+    def reset(self, session_id: str) -> None:
+        served = self._get(session_id)
+        with served.lock:
+            served.session.reset()
+
+    def predict(self, session_id: str, instruction: str, screenshot: bytes) -> Dict:
+        served = self._get(session_id)
+        with served.lock:
+            info, actions = served.session.agent.predict(
+                instruction=instruction, observation={"screenshot": screenshot}
+            )
+        return {"info": info, "actions": actions}
+
+    def iter_task(self, session_id: str, task: Dict) -> Iterator[Dict]:
+        """执行任务并逐步产出事件，执行期间该会话的其他请求会等待。"""
+        served = self._get(session_id)
+        if served.session.display is None:
+            raise ValueError("该服务没有显示后端（--backend none），只能调用 predict")
+        with served.lock:
+            yield from served.session.iter_task(task, self.max_steps)
+
+    def close(self) -> None:
+        """关闭所有会话。"""
+        for session_id in list(self.sessions):
+            try:
+                self.close_session(session_id)
+            except KeyError:
+                pass
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 保持连接，连续的 predict 请求复用同一连接
+
+    @property
+    def agent_server(self) -> AgentServer:
+        return self.server.agent_server
+
+    def address_string(self) -> str:
+        # Unix socket 的 client_address 为空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, events: Iterator[Dict]) -> None:
+        """以 chunked 编码逐行发送 NDJSON 事件。"""
+        # 先取出第一个事件，会话不存在等错误可以在发送 200 之前返回
+        first = next(events)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in itertools.chain([first], events):
+                line = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开后停止任务并释放会话
+            logger.warning("Client disconnected while streaming %s", self.path)
+            self.close_connection = True
+        finally:
+            events.close()
+
+    def _dispatch(self, method: str) -> None:
+        try:
+            if method == "GET" and self.path == "/health":
+                self._send_json(200, {"status": "ok", "sessions": len(self.agent_server.sessions)})
+                return
+            if method == "POST" and self.path == "/sessions":
+                session_id = self.agent_server.create_session(self._read_json())
+                self._send_json(200, {"session_id": session_id})
+                return
+
+            match = _SESSION_ROUTE.match(self.path)
+            if match is None:
+                self._send_json(404, {"error": f"no route for {method} {self.path}"})
+                return
+            session_id, action = match.groups()
+            if method == "DELETE" and action is None:
+                self.agent_server.close_session(session_id)
+                self._send_json(200, {"session_id": session_id})
+            elif method == "POST" and action == "reset":
+                self.agent_server.reset(session_id)
+                self._send_json(200, {"session_id": session_id})
+            elif method == "POST" and action == "predict":
+                request = self._read_json()
+                if "instruction" not in request or "screenshot" not in request:
+                    raise ValueError("predict 需要 instruction 和 screenshot（base64 PNG）")
+                screenshot = base64.b64decode(request["screenshot"])
+                self._send_json(
+                    200, self.agent_server.predict(session_id, request["instruction"], screenshot)
+                )
+            elif method == "POST" and action == "tasks":
+                task = self._read_json()
+                if "instruction" not in task:
+                    raise ValueError("任务需要 instruction")
+                self._stream(self.agent_server.iter_task(session_id, task))
+            else:
+                self._send_json(405, {"error": f"{method} not allowed on {self.path}"})
+        except KeyError as e:
+            self._send_json(404, {"error": str(e.args[0]) if e.args else str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception(f"{method} {self.path} failed")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_DELETE(self) -> None:
+        self._dispatch("DELETE")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(
+    agent_server: AgentServer,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+):
+    """
+    创建 HTTP 服务（每个请求一个线程），指定 unix_socket 时监听 Unix socket 而不是 TCP 端口。
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = ThreadingUnixHTTPServer(unix_socket, AgentRequestHandler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), AgentRequestHandler)
+        httpd.daemon_threads = True
+    httpd.agent_server = agent_server
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", required=True, help="agent 配置（JSON）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="监听 Unix socket 路径（代替 TCP 端口）")
+    parser.add_argument("--backend", choices=["none", "xvfb", "local"], default="none")
+    parser.add_argument("--first-display", type=int, default=99)
+    parser.add_argument("--max-steps", type=int, default=15)
+    args = parser.parse_args()
+
+    # 与 main.py 一致，跳过代码中残留的断点
+    pdb.set_trace = lambda *args, **kwargs: None
+    setup_logging(quiet=True, console=True)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    agent_server = AgentServer(config, args.backend, args.first_display, args.max_steps)
+    httpd = create_server(agent_server, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    logger.info(f"Serving on {address} (backend: {args.backend})")
+    print(f"Computer Agent server listening on {address}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        agent_server.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
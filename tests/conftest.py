@@ -0,0 +1,27 @@
+from typing import List
+
+import pytest
+
+from tests.helpers import ScriptedSource
+
+
+@pytest.fixture
+def replay_config():
+    """构建使用 replay engine 的会话配置，返回 (config, source)。"""
+
+    def build(responses: List[str]):
+        source = ScriptedSource(responses)
+        config = {
+            "engine_params": {"engine_type": "replay", "model": "m", "source": source},
+            "engine_params_for_grounding": {
+                "engine_type": "replay",
+                "model": "g",
+                "source": source,
+                "grounding_width": 1000,
+                "grounding_height": 1000,
+            },
+            "enable_reflection": False,
+        }
+        return config, source
+
+    return build
@@ -0,0 +1,58 @@
+"""测试共用的替身：replay engine 的回复源、不启动显示器的会话后端。"""
+import io
+from typing import Dict, List
+
+from PIL import Image
+
+
+def png(color=(0, 0, 0), size=(1920, 1080)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def answer(*calls: str) -> str:
+    """generator 回复：思考 + 包含给定 agent 调用的代码块。"""
+    code = "\n".join(calls)
+    return f"<thoughts>next</thoughts><answer>step\n```python\n{code}\n```\n</answer>"
+
+
+class ScriptedSource:
+    """replay engine 的回复源：generator 按顺序返回 responses，并记录收到的每组消息。"""
+
+    def __init__(self, responses: List[str]):
+        self.responses = list(responses)
+        self.prompts: List[str] = []
+
+    def next_response(self, model, messages: List[Dict]) -> str:
+        text = "\n".join(
+            part.get("text", "")
+            for message in messages
+            for part in (message["content"] if isinstance(message["content"], list) else [])
+            if part.get("type") == "text"
+        )
+        self.prompts.append(text)
+        return self.responses.pop(0)
+
+
+class FakeDisplay:
+    """不启动显示器的会话后端：截图固定，动作直接返回成功。"""
+
+    width = 1920
+    height = 1080
+
+    def __init__(self):
+        self.programs = []
+
+    def screenshot(self) -> bytes:
+        return png()
+
+    def execute_program(self, program) -> Dict:
+        self.programs.append(program)
+        return {"status": "ok", "error": "", "seconds": 0.0}
+
+    def execute(self, code: str) -> Dict:
+        return {"status": "ok", "error": "", "seconds": 0.0}
+
+    def stop(self) -> None:
+        pass
@@ -0,0 +1,30 @@
+import pytest
+
+from utils.common_utils import estimate_tokens, truncate_to_tokens
+from utils.context_builder import ContextBuilder
+
+MIXED = ("Clicked the Save button in the toolbar. " * 40) + ("已在工具栏中点击保存按钮。" * 40)
+
+
+@pytest.mark.parametrize("keep", ["head", "tail", "both"])
+@pytest.mark.parametrize("budget", [1, 5, 12, 40, 150, 400])
+def test_truncated_text_fits_its_budget(keep, budget):
+    result = truncate_to_tokens(MIXED, budget, keep)
+    assert estimate_tokens(result) <= budget
+
+
+def test_truncation_keeps_the_requested_end():
+    assert truncate_to_tokens(MIXED, 100, "head").startswith("Clicked the Save")
+    assert truncate_to_tokens(MIXED, 100, "tail").endswith("已在工具栏中点击保存按钮。")
+    assert "已省略约" in truncate_to_tokens(MIXED, 100, "both")
+
+
+def test_built_context_fits_the_total_budget():
+    builder = ContextBuilder(600)
+    builder.add("header", "Initial screen provided.\n", required=True)
+    builder.add("reflection", MIXED, budget=300, priority=2, keep="head")
+    builder.add("notes", MIXED, budget=300, priority=1, keep="tail")
+    builder.add("code_agent_result", MIXED, budget=400, priority=3, keep="both")
+    text, report = builder.build()
+    assert estimate_tokens(text) <= 600
+    assert {item["section"] for item in report} == {"reflection", "notes", "code_agent_result"}
@@ -0,0 +1,63 @@
+import sys
+import textwrap
+import time
+
+import pytest
+
+from utils.python_kernel import PythonKernel
+
+
+@pytest.fixture
+def kernel():
+    kernel = PythonKernel(timeout=10, preload_modules=())
+    kernel.start()
+    yield kernel
+    kernel.shutdown()
+
+
+def test_output_written_to_fds_is_captured(kernel):
+    result = kernel.execute(
+        textwrap.dedent(
+            """
+            import os, subprocess, sys
+            print("from print")
+            os.system("echo from_child")
+            subprocess.run(["sh", "-c", "echo to_stderr >&2"])
+            os.write(1, b"raw fd write\\n")
+            print("last line")
+            """
+        )
+    )
+    assert result["status"] == "ok"
+    assert result["output"] == "from print\nfrom_child\nraw fd write\nlast line\n"
+    assert result["error"] == "to_stderr\n"
+
+
+def test_output_between_steps_is_not_attributed_to_the_next_step(kernel):
+    kernel.execute("import subprocess; subprocess.Popen(['sh', '-c', 'sleep 0.2; echo late'])")
+    time.sleep(1)
+    assert kernel.execute("print('second')")["output"] == "second\n"
+
+
+def test_variables_persist_and_tracebacks_go_to_stderr(kernel):
+    kernel.execute("value = 41")
+    assert kernel.execute("print(value + 1)")["output"] == "42\n"
+    result = kernel.execute("raise ValueError('boom')")
+    assert result["status"] == "error"
+    assert "ValueError: boom" in result["error"]
+
+
+def test_step_timeout_starts_after_slow_preload(tmp_path):
+    (tmp_path / "slow_preload.py").write_text("import time\ntime.sleep(3)\n")
+    kernel = PythonKernel(
+        timeout=1,
+        preload_modules=("slow_preload",),
+        env={"PYTHONPATH": f"{tmp_path}:{':'.join(sys.path)}"},
+    )
+    kernel.start()
+    try:
+        result = kernel.execute("print('ready')")
+    finally:
+        kernel.shutdown()
+    assert result["status"] == "ok"
+    assert result["output"] == "ready\n"
@@ -0,0 +1,58 @@
+import base64
+import http.client
+import json
+import threading
+
+import pytest
+
+from server import AgentServer, create_server
+from tests.helpers import answer, png
+
+
+@pytest.fixture
+def served(replay_config):
+    """在随机端口上启动服务（无显示后端），返回 (请求函数, 回复源)。"""
+    config, source = replay_config(
+        [
+            answer('agent.save_to_knowledge(["first-task-secret"])'),
+            answer("agent.done()"),
+        ]
+    )
+    agent_server = AgentServer(config)
+    httpd = create_server(agent_server, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=30)
+        connection.request(method, path, body=json.dumps(body or {}), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+        connection.close()
+        return response.status, payload
+
+    yield request, source
+    httpd.shutdown()
+    httpd.server_close()
+    agent_server.close()
+
+
+def test_reset_endpoint_clears_previous_task_state(served):
+    request, source = served
+    status, created = request("POST", "/sessions")
+    assert status == 200
+    session_path = f"/sessions/{created['session_id']}"
+    screenshot = base64.b64encode(png()).decode()
+
+    status, _ = request("POST", f"{session_path}/predict", {"instruction": "remember", "screenshot": screenshot})
+    assert status == 200
+
+    status, _ = request("POST", f"{session_path}/reset")
+    assert status == 200
+
+    source.prompts.clear()
+    status, result = request("POST", f"{session_path}/predict", {"instruction": "next task", "screenshot": screenshot})
+    assert status == 200
+    assert result["actions"] == ["DONE"]
+    assert "next task" in source.prompts[0]
+    assert "first-task-secret" not in source.prompts[0]
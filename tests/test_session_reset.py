@@ -0,0 +1,33 @@
+from batch_runner import Session
+from tests.helpers import FakeDisplay, answer
+
+
+def test_second_task_starts_without_first_task_state(replay_config):
+    config, source = replay_config(
+        [
+            answer('agent.save_to_knowledge(["first-task-secret"])'),
+            answer("agent.done()"),
+            answer("agent.done()"),
+        ]
+    )
+    session = Session("s0", config, FakeDisplay())
+
+    first = session.run_task({"id": "t1", "instruction": "remember something"}, 5)
+    assert first["status"] == "done"
+    assert "first-task-secret" in session.grounding_agent.notes
+    session.grounding_agent.last_code_agent_result = {
+        "task_instruction": "first-task-code",
+        "steps_executed": 1,
+        "budget": 20,
+        "completion_reason": "DONE",
+        "summary": "first-task-summary",
+    }
+
+    source.prompts.clear()
+    second = session.run_task({"id": "t2", "instruction": "do something else"}, 5)
+    assert second["status"] == "done"
+    prompt = source.prompts[0]
+    assert "do something else" in prompt
+    assert "first-task-secret" not in prompt
+    assert "first-task-summary" not in prompt
+    assert session.grounding_agent.notes == []
@@ -0,0 +1,38 @@
+from agent.agent import Agent
+from tests.helpers import answer, png
+from utils.grounding import OSWorldACI
+
+
+def build_agent(config):
+    grounding_agent = OSWorldACI(
+        env=None,
+        platform="linux",
+        engine_params_for_generation=config["engine_params"],
+        engine_params_for_grounding=config["engine_params_for_grounding"],
+    )
+    return Agent(config["engine_params"], grounding_agent, platform="linux", enable_reflection=False)
+
+
+def test_primed_system_prompt_is_a_prefix_of_the_first_request(replay_config):
+    config, source = replay_config([answer("agent.done()")])
+    agent = build_agent(config)
+    # start_warmup(prime=True) 发送的就是 generator 当前的系统提示词
+    primed = agent.executor.generator_agent.messages[0]["content"][0]["text"]
+
+    agent.predict(instruction="open the settings page", observation={"screenshot": png()})
+    sent = agent.executor.generator_agent.messages[0]["content"][0]["text"]
+
+    task_line = "你的职责是执行任务：`open the settings page`。"
+    assert sent.endswith(task_line)
+    shared = sent[: -len(task_line)]
+    assert primed.startswith(shared)
+    assert len(shared) > 0.9 * len(sent)
+
+
+def test_warmup_does_not_build_the_grounding_model(replay_config):
+    config, _ = replay_config([])
+    agent = build_agent(config)
+    handle = agent.start_warmup(prime=True)
+    handle.wait(5)
+    assert "grounding_model" not in vars(agent.grounding_agent)
+    assert handle.errors == {}
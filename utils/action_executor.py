@@ -0,0 +1,226 @@
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("ComputerAgent.utils.action_executor")
+
+# 执行进程启动时预先导入的模块，动作代码中的 import 只是一次 sys.modules 查找
+DEFAULT_PRELOAD_MODULES = ("pyautogui", "pyperclip")
+
+
+def _run_command(command: Dict, namespace: Dict) -> None:
+    """执行一条结构化命令。"""
+    op = command["op"]
+    if op == "exec":
+        exec(compile(command["code"], "<action>", "exec"), namespace)
+    elif op == "pyautogui":
+        getattr(namespace["pyautogui"], command["fn"])(
+            *command.get("args", ()), **command.get("kwargs", {})
+        )
+    elif op == "clipboard":
+        namespace["pyperclip"].copy(command["text"])
+    elif op == "clipboard_save":
+        try:
+            namespace["_saved_clipboard"] = namespace["pyperclip"].paste()
+        except Exception:
+            # 读不到剪贴板（如没有可用的剪贴板程序）时不恢复，不影响粘贴本身
+            namespace.pop("_saved_clipboard", None)
+    elif op == "clipboard_restore":
+        if "_saved_clipboard" in namespace:
+            namespace["pyperclip"].copy(namespace.pop("_saved_clipboard"))
+    elif op == "sleep":
+        time.sleep(command["seconds"])
+    else:
+        raise ValueError(f"unknown action op: {op}")
+
+
+def _executor_main(conn, preload_modules: Iterable[str], env: Optional[Dict[str, str]]):
+    """执行进程主循环：依次执行收到的命令列表，返回状态和耗时。"""
+    if env:
+        os.environ.update(env)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__, "time": time}
+    for module_name in preload_modules:
+        try:
+            namespace[module_name] = __import__(module_name)
+        except Exception:
+            # 缺少显示器等情况下导入失败，留到执行时再报告
+            pass
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        start = time.perf_counter()
+        command_seconds: List[float] = []
+        error = ""
+        for command in request["commands"]:
+            command_start = time.perf_counter()
+            try:
+                _run_command(command, namespace)
+            except BaseException as e:
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                break
+            finally:
+                command_seconds.append(time.perf_counter() - command_start)
+
+        conn.send(
+            {
+                "status": "error" if error else "ok",
+                "error": error,
+                "seconds": time.perf_counter() - start,
+                "command_seconds": command_seconds,
+            }
+        )
+
+
+class ActionExecutor:
+    """长驻的动作执行进程，通过管道接收结构化的动作命令。
+
+    pyautogui / pyperclip 在进程启动时导入一次，之后每步不再有导入开销；
+    动作的副作用（全局状态、崩溃）与 agent 进程隔离，超时或崩溃时自动重启。
+
+    命令格式:
+        {"op": "exec", "code": "pyautogui.click(10, 20)"}          执行动作代码
+        {"op": "pyautogui", "fn": "click", "args": [10, 20], "kwargs": {}}
+        {"op": "clipboard", "text": "..."}                          写入剪贴板
+        {"op": "clipboard_save"} / {"op": "clipboard_restore"}    保存 / 恢复剪贴板原有内容
+        {"op": "sleep", "seconds": 0.5}
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        preload_modules: Iterable[str] = DEFAULT_PRELOAD_MODULES,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        """
+        参数:
+            timeout (float): 单次执行的默认超时时间，单位秒
+            preload_modules (Iterable[str]): 执行进程启动时预先导入的模块
+            env (Optional[Dict[str, str]]): 执行进程额外的环境变量，如 {"DISPLAY": ":99"}
+        """
+        self.timeout = timeout
+        self.preload_modules = tuple(preload_modules)
+        self.env = env
+
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+
+    def start(self) -> None:
+        """启动执行进程（已在运行时不做任何事）。"""
+        if self.is_alive():
+            return
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_executor_main,
+            args=(child_conn, self.preload_modules, self.env),
+            daemon=True,
+        )
+        self._process.start()
+        # 关闭父进程中的子端，子进程退出时父端才能收到 EOF
+        child_conn.close()
+        self._conn = parent_conn
+        logger.info(f"Action executor started, pid={self._process.pid}")
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def shutdown(self) -> None:
+        """关闭执行进程。"""
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        if self._process is not None:
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            logger.info(f"Action executor stopped, pid={self._process.pid}")
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def restart(self) -> None:
+        """强制结束当前执行进程并启动一个新的。"""
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self.start()
+
+    def run(self, commands: List[Dict], timeout: Optional[float] = None) -> Dict:
+        """
+        依次执行一组命令，遇到错误时停止。
+
+        参数:
+            commands (List[Dict]): 结构化命令列表
+            timeout (Optional[float]): 本次执行的超时时间，默认使用 self.timeout
+
+        返回:
+            Dict: {"status": "ok" / "error", "error", "seconds": 执行进程内耗时,
+                   "command_seconds": 每条命令耗时, "roundtrip_seconds": 含管道通信的总耗时}
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+
+        if not self.is_alive():
+            if self._process is not None:
+                logger.warning("Action executor is not running, restarting")
+                self.restart()
+            else:
+                self.start()
+
+        try:
+            self._conn.send({"commands": commands})
+        except (BrokenPipeError, OSError):
+            logger.warning("Action executor pipe is broken, restarting")
+            self.restart()
+            self._conn.send({"commands": commands})
+
+        if not self._conn.poll(timeout):
+            logger.warning(f"Action timed out after {timeout}s, restarting executor")
+            self.restart()
+            return {
+                "status": "error",
+                "error": f"TimeoutExpired: 动作执行超过 {timeout} 秒，执行进程已重启",
+                "seconds": timeout,
+                "command_seconds": [],
+                "roundtrip_seconds": time.perf_counter() - start,
+            }
+
+        try:
+            reply = self._conn.recv()
+        except (EOFError, OSError):
+            self._process.join(timeout=1)
+            exit_code = self._process.exitcode
+            logger.warning(f"Action executor crashed (exit code {exit_code}), restarting")
+            self.restart()
+            return {
+                "status": "error",
+                "error": f"执行进程异常退出（exit code {exit_code}），已重启",
+                "seconds": time.perf_counter() - start,
+                "command_seconds": [],
+                "roundtrip_seconds": time.perf_counter() - start,
+            }
+
+        reply["roundtrip_seconds"] = time.perf_counter() - start
+        return reply
+
+    def execute(self, code: str, timeout: Optional[float] = None) -> Dict:
+        """执行 agent 生成的动作代码。"""
+        return self.run([{"op": "exec", "code": code}], timeout)
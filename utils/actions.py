@@ -0,0 +1,292 @@
+"""
+动作的中间表示：OSWorldACI 的每个 agent action 返回一组类型化的操作（ActionProgram），
+执行时再编译成 pyautogui 调用。
+
+- render_legacy：渲染成原来的可 exec 代码字符串（main.py、轨迹回放等沿用）
+- compile_commands：编译成 ActionExecutor 的结构化命令，不经过 exec
+- to_json / from_json：序列化，用于记录、缓存和远程执行
+"""
+from typing import Dict, Iterable, List, NamedTuple, Tuple, Union
+
+# 输入策略：超过 PASTE_THRESHOLD 个字符（或包含非 ASCII 字符）时写入剪贴板后粘贴，耗时与长度无关；
+# 否则用一次 pyautogui.write 逐键输入。阈值可用 python -m benchmarks.bench_typing 测量后调整。
+PASTE_THRESHOLD = 64
+# 粘贴后等待目标应用读取剪贴板，再恢复原有内容
+CLIPBOARD_RESTORE_DELAY = 0.2
+
+
+class Click(NamedTuple):
+    x: int
+    y: int
+    clicks: int = 1
+    button: str = "left"
+    hold_keys: Tuple[str, ...] = ()
+
+
+class Move(NamedTuple):
+    x: int
+    y: int
+    duration: float = 0.0
+
+
+class Drag(NamedTuple):
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    duration: float = 1.0
+    button: str = "left"
+    hold_keys: Tuple[str, ...] = ()
+
+
+class Scroll(NamedTuple):
+    x: int
+    y: int
+    clicks: int
+    horizontal: bool = False
+
+
+class Key(NamedTuple):
+    """按键：combo 为 True 时作为组合键同时按下（hotkey），否则依次按下（press）。"""
+
+    keys: Tuple[str, ...]
+    hold_keys: Tuple[str, ...] = ()
+    combo: bool = True
+    interval: float = 0.0
+
+
+class TypeText(NamedTuple):
+    """
+    输入文本：clipboard 为 True 时先写入剪贴板再用 paste_keys 粘贴（用于非 ASCII 文本和长文本），
+    restore_clipboard 为 True 时粘贴后恢复剪贴板原有内容；否则逐键输入。
+    """
+
+    text: str
+    clipboard: bool = False
+    paste_keys: Tuple[str, ...] = ("ctrl", "v")
+    restore_clipboard: bool = True
+
+
+class Sleep(NamedTuple):
+    seconds: float
+
+
+class Script(NamedTuple):
+    """无法用上面的操作表达的原始 Python 代码（如切换窗口、写入表格单元格）。"""
+
+    code: str
+
+
+class CodeAgentCall(NamedTuple):
+    """code agent 已在生成动作时执行完毕，环境中只需等待其副作用生效。"""
+
+    task: str
+    completion_reason: str = ""
+    wait: float = 2.222
+
+
+class Signal(NamedTuple):
+    """不需要执行的控制信号：DONE、FAIL、WAIT。"""
+
+    name: str
+
+
+Action = Union[Click, Move, Drag, Scroll, Key, TypeText, Sleep, Script, CodeAgentCall, Signal]
+ActionProgram = Tuple[Action, ...]
+
+ACTION_TYPES = {
+    "click": Click,
+    "move": Move,
+    "drag": Drag,
+    "scroll": Scroll,
+    "key": Key,
+    "type": TypeText,
+    "sleep": Sleep,
+    "script": Script,
+    "code_agent": CodeAgentCall,
+    "signal": Signal,
+}
+_TYPE_NAMES = {cls: name for name, cls in ACTION_TYPES.items()}
+
+SIGNALS = ("DONE", "FAIL", "WAIT")
+
+
+def as_program(value) -> ActionProgram:
+    """把 agent action 的返回值统一成 ActionProgram；旧式的代码字符串包装成 Script / Signal。"""
+    if isinstance(value, str):
+        return (Signal(value),) if value in SIGNALS else (Script(value),)
+    if isinstance(value, tuple) and type(value) in _TYPE_NAMES:
+        return (value,)
+    return tuple(value)
+
+
+def text_input(text: str, paste_keys: Tuple[str, ...] = ("ctrl", "v")) -> TypeText:
+    """按文本长度和字符选择输入方式：非 ASCII 或超过 PASTE_THRESHOLD 个字符时粘贴，否则逐键输入。"""
+    paste = len(text) > PASTE_THRESHOLD or any(ord(char) > 127 for char in text)
+    return TypeText(text, clipboard=paste, paste_keys=paste_keys)
+
+
+def signal_of(program: ActionProgram):
+    """程序只包含一个控制信号时返回信号名，否则返回 None。"""
+    if len(program) == 1 and isinstance(program[0], Signal):
+        return program[0].name
+    return None
+
+
+# ---------------------------------------------------------------------------
+# 结构化命令（ActionExecutor）
+# ---------------------------------------------------------------------------
+
+
+def _call(fn: str, *args, **kwargs) -> Dict:
+    return {"op": "pyautogui", "fn": fn, "args": list(args), "kwargs": kwargs}
+
+
+def _with_held_keys(hold_keys: Iterable[str], commands: List[Dict]) -> List[Dict]:
+    return (
+        [_call("keyDown", key) for key in hold_keys]
+        + commands
+        + [_call("keyUp", key) for key in hold_keys]
+    )
+
+
+def _compile(action: Action) -> List[Dict]:
+    if isinstance(action, Click):
+        return _with_held_keys(
+            action.hold_keys,
+            [_call("click", action.x, action.y, clicks=action.clicks, button=action.button)],
+        )
+    if isinstance(action, Move):
+        return [_call("moveTo", action.x, action.y, duration=action.duration)]
+    if isinstance(action, Drag):
+        return [_call("moveTo", action.x1, action.y1)] + _with_held_keys(
+            action.hold_keys,
+            [
+                _call("dragTo", action.x2, action.y2, duration=action.duration, button=action.button),
+                _call("mouseUp"),
+            ],
+        )
+    if isinstance(action, Scroll):
+        return [
+            _call("moveTo", action.x, action.y),
+            {"op": "sleep", "seconds": 0.5},
+            _call("hscroll" if action.horizontal else "vscroll", action.clicks),
+        ]
+    if isinstance(action, Key):
+        if action.combo:
+            kwargs = {"interval": action.interval} if action.interval else {}
+            press = _call("hotkey", *action.keys, **kwargs)
+        else:
+            press = _call("press", list(action.keys))
+        return _with_held_keys(action.hold_keys, [press])
+    if isinstance(action, TypeText):
+        if action.clipboard:
+            paste = [{"op": "clipboard", "text": action.text}, _call("hotkey", *action.paste_keys)]
+            if not action.restore_clipboard:
+                return paste
+            return (
+                [{"op": "clipboard_save"}]
+                + paste
+                + [{"op": "sleep", "seconds": CLIPBOARD_RESTORE_DELAY}, {"op": "clipboard_restore"}]
+            )
+        return [_call("write", action.text)]
+    if isinstance(action, Sleep):
+        return [{"op": "sleep", "seconds": action.seconds}]
+    if isinstance(action, CodeAgentCall):
+        return [{"op": "sleep", "seconds": action.wait}]
+    if isinstance(action, Script):
+        return [{"op": "exec", "code": action.code}]
+    if isinstance(action, Signal):
+        return []
+    raise TypeError(f"unknown action: {action!r}")
+
+
+def compile_commands(program: ActionProgram) -> List[Dict]:
+    """编译成 ActionExecutor.run 接收的结构化命令列表。"""
+    commands = []
+    for action in program:
+        commands.extend(_compile(action))
+    return commands
+
+
+# ---------------------------------------------------------------------------
+# 旧式代码字符串
+# ---------------------------------------------------------------------------
+
+
+def _render_call(command: Dict) -> str:
+    args = [repr(arg) for arg in command["args"]]
+    args += [f"{key}={value!r}" for key, value in command["kwargs"].items()]
+    return f"pyautogui.{command['fn']}({', '.join(args)})"
+
+
+def _render_command(command: Dict) -> str:
+    op = command["op"]
+    if op == "pyautogui":
+        return _render_call(command)
+    if op == "clipboard":
+        return f"pyperclip.copy({command['text']!r})"
+    if op == "clipboard_save":
+        return "_saved_clipboard = pyperclip.paste()"
+    if op == "clipboard_restore":
+        return "pyperclip.copy(_saved_clipboard)"
+    if op == "sleep":
+        return f"time.sleep({command['seconds']!r})"
+    raise ValueError(f"cannot render command op inline: {op}")
+
+
+def render_legacy(program: ActionProgram) -> str:
+    """
+    渲染成可直接 exec 的 pyautogui 代码字符串（与改造前 agent action 返回的字符串等价）。
+    只包含控制信号时返回信号名（"DONE" / "FAIL" / "WAIT"）。
+    """
+    signal = signal_of(program)
+    if signal is not None:
+        return signal
+
+    blocks: List[str] = []
+    statements: List[str] = []
+    for action in program:
+        if isinstance(action, Script):
+            if statements:
+                blocks.append("; ".join(statements))
+                statements = []
+            blocks.append(action.code)
+        else:
+            statements.extend(_render_command(command) for command in _compile(action))
+    if statements:
+        blocks.append("; ".join(statements))
+
+    body = "\n".join(blocks)
+    imports = []
+    if "pyautogui." in body:
+        imports.append("import pyautogui")
+    if "pyperclip." in body:
+        imports.append("import pyperclip")
+    if "time." in body:
+        imports.append("import time")
+    return "; ".join(imports + [body]) if imports else body
+
+
+# ---------------------------------------------------------------------------
+# 序列化
+# ---------------------------------------------------------------------------
+
+
+def to_json(program: ActionProgram) -> List[Dict]:
+    """序列化为 [{"type": "click", "x": ..., ...}, ...]。"""
+    return [{"type": _TYPE_NAMES[type(action)], **action._asdict()} for action in program]
+
+
+def from_json(items: List[Dict]) -> ActionProgram:
+    """由 to_json 的结果还原 ActionProgram。"""
+    program = []
+    for item in items:
+        fields = dict(item)
+        cls = ACTION_TYPES[fields.pop("type")]
+        for key, value in fields.items():
+            # JSON 中的元组字段是列表
+            if isinstance(value, list):
+                fields[key] = tuple(value)
+        program.append(cls(**fields))
+    return tuple(program)
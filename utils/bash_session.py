@@ -0,0 +1,272 @@
+import logging
+import os
+import queue
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from utils.output_capture import DEFAULT_MAX_OUTPUT_BYTES, OutputCapture
+
+logger = logging.getLogger("ComputerAgent.utils.bash_session")
+
+
+class BashSession:
+    """长驻的 Bash 进程（无 PTY），在同一个 shell 中依次执行命令。
+
+    每条命令写入临时脚本后通过 `source` 执行，因此 `cd`、导出的环境变量和 shell 函数
+    在命令之间保留。命令结束后输出一行哨兵文本（包含退出码）作为分隔。
+    """
+
+    def __init__(
+        self,
+        timeout: int = 30,
+        login: bool = True,
+        max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+        spill_dir: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        """
+        参数:
+            timeout (int): 单条命令的默认超时时间，单位秒
+            login (bool): 是否以 login shell 启动（只在会话启动时加载一次 profile）
+            max_output_bytes (int): 每条命令输出保留的字节上限
+            spill_dir (Optional[str]): 超出上限时完整输出日志的目录
+            env (Optional[Dict[str, str]]): Bash 进程额外的环境变量，如 {"DISPLAY": ":99"}
+        """
+        self.timeout = timeout
+        self.login = login
+        self.max_output_bytes = max_output_bytes
+        self.spill_dir = spill_dir
+        self.env = env
+
+        self._process = None
+        self._chunks = None
+        self._reader = None
+        self._script_dir = None
+        self._sentinel = None
+        self._sentinel_pattern = None
+
+    def start(self) -> None:
+        """启动 Bash 进程（已在运行时不做任何事）。"""
+        if self.is_alive():
+            return
+
+        if self.login:
+            args = ["/bin/bash", "--login", "-s"]
+        else:
+            args = ["/bin/bash", "--noprofile", "--norc", "-s"]
+        self._process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,  # stderr 合并到 stdout，与一次性执行时一致
+            start_new_session=(os.name == "posix"),
+            env={**os.environ, **self.env} if self.env else None,
+        )
+        self._script_dir = tempfile.mkdtemp(prefix="code_agent_bash_")
+        self._sentinel = f"__CODE_AGENT_DONE_{uuid.uuid4().hex}__"
+        self._sentinel_pattern = re.compile(
+            rb"\n" + re.escape(self._sentinel.encode()) + rb" (-?\d+)\n"
+        )
+
+        # 后台线程持续读取输出，主线程按超时从队列取数据
+        self._chunks = queue.Queue()
+        self._reader = threading.Thread(
+            target=self._read_output,
+            args=(self._process.stdout, self._chunks),
+            daemon=True,
+        )
+        self._reader.start()
+
+        # 丢弃 login profile 的输出，保证第一条命令的输出干净
+        self._write_sentinel_command(":")
+        state, _ = self._collect(self.timeout, OutputCapture(0))
+        if state != "done":
+            logger.warning(f"Bash session startup did not finish cleanly: {state}")
+        logger.info(f"Bash session started, pid={self._process.pid}")
+
+    @staticmethod
+    def _read_output(stream, chunks: queue.Queue) -> None:
+        while True:
+            data = os.read(stream.fileno(), 65536)
+            if not data:
+                chunks.put(None)
+                break
+            chunks.put(data)
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _kill(self) -> None:
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            try:
+                if hasattr(os, "killpg"):
+                    # 结束整个进程组，包括命令启动的子进程
+                    os.killpg(self._process.pid, signal.SIGKILL)
+                else:
+                    self._process.kill()
+            except ProcessLookupError:
+                pass
+        self._process.wait()
+        for stream in (self._process.stdin, self._process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def shutdown(self) -> None:
+        """关闭 Bash 进程并清理临时脚本目录。"""
+        if self._process is not None:
+            if self._process.poll() is None:
+                try:
+                    self._process.stdin.write(b"exit\n")
+                    self._process.stdin.flush()
+                    self._process.wait(timeout=2)
+                except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                    pass
+            self._kill()
+            logger.info(f"Bash session stopped, pid={self._process.pid}")
+        if self._script_dir is not None:
+            shutil.rmtree(self._script_dir, ignore_errors=True)
+        self._process = None
+        self._script_dir = None
+
+    def restart(self) -> None:
+        """强制结束当前 shell 并启动一个新的 shell。"""
+        self._kill()
+        if self._script_dir is not None:
+            shutil.rmtree(self._script_dir, ignore_errors=True)
+        self._process = None
+        self._script_dir = None
+        self.start()
+
+    def run(self, code: str, timeout: Optional[int] = None) -> Dict:
+        """在会话中执行一段 Bash 代码。
+
+        参数:
+            code (str): 要执行的 Bash 代码
+            timeout (Optional[int]): 本次执行的超时时间，默认使用 self.timeout
+
+        返回:
+            Dict: 与 LocalController.run_bash_script 相同结构的结果字典
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        if not self.is_alive():
+            if self._process is not None:
+                logger.warning("Bash session is not running, restarting")
+                self.restart()
+            else:
+                self.start()
+
+        script_path = os.path.join(self._script_dir, f"{uuid.uuid4().hex}.sh")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(code)
+            f.write("\n")
+
+        try:
+            # stdin 重定向到 /dev/null，避免命令读走后续的控制指令
+            self._write_sentinel_command(f"source '{script_path}' < /dev/null")
+        except (BrokenPipeError, OSError):
+            logger.warning("Bash session pipe is broken, restarting")
+            self.restart()
+            return self.run(code, timeout)
+
+        capture = OutputCapture(self.max_output_bytes, self.spill_dir)
+        try:
+            state, returncode = self._collect(timeout, capture)
+        finally:
+            capture.close()
+            try:
+                os.remove(script_path)
+            except OSError:
+                pass
+
+        output = capture.getvalue()
+        extra = {
+            "truncated": capture.truncated,
+            "log_paths": [capture.log_path] if capture.log_path else [],
+        }
+        if state == "timeout":
+            logger.warning(f"Bash command timed out after {timeout}s, restarting session")
+            self.restart()
+            return {
+                "status": "error",
+                "returncode": -1,
+                "output": output,
+                "error": (
+                    f"TimeoutExpired: 命令执行超过 {timeout} 秒，"
+                    "shell 会话已重启，工作目录和环境变量已重置"
+                ),
+                **extra,
+            }
+        if state == "exited":
+            # shell 进程退出（例如代码中调用了 exit）
+            logger.warning(f"Bash session exited (exit code {returncode}), restarting")
+            self.restart()
+            return {
+                "status": "ok" if returncode == 0 else "error",
+                "returncode": returncode,
+                "output": output,
+                "error": "shell 会话已退出并重启，工作目录和环境变量已重置",
+                **extra,
+            }
+        return {
+            "status": "ok" if returncode == 0 else "error",
+            "returncode": returncode,
+            "output": output,
+            "error": "",
+            **extra,
+        }
+
+    def _write_sentinel_command(self, command: str) -> None:
+        self._process.stdin.write(
+            (
+                f"{command}; printf '\\n%s %d\\n' '{self._sentinel}' \"$?\"\n"
+            ).encode("utf-8")
+        )
+        self._process.stdin.flush()
+
+    def _collect(
+        self, timeout: float, capture: OutputCapture
+    ) -> Tuple[str, Optional[int]]:
+        """读取输出直到出现哨兵行、超时或 shell 退出，命令输出流式写入 capture。
+
+        返回:
+            Tuple[str, Optional[int]]: 状态（done/timeout/exited）和退出码
+        """
+        # 末尾可能是尚未读完的哨兵行，暂不写入 capture
+        hold_back = len(self._sentinel) + 24
+        pending = bytearray()
+        deadline = time.monotonic() + timeout
+        while True:
+            match = self._sentinel_pattern.search(pending)
+            if match:
+                capture.write(bytes(pending[: match.start()]))
+                return "done", int(match.group(1))
+            if len(pending) > hold_back:
+                capture.write(bytes(pending[:-hold_back]))
+                del pending[:-hold_back]
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                capture.write(bytes(pending))
+                return "timeout", None
+
+            try:
+                chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                continue
+
+            if chunk is None:
+                capture.write(bytes(pending))
+                return "exited", self._process.wait()
+            pending.extend(chunk)
@@ -1,11 +1,14 @@
 import re
 import time
-from io import BytesIO
-from PIL import Image
+from functools import lru_cache
 import pdb
-from typing import Tuple, Dict
+from typing import Dict, Optional, Tuple
 
 from prompt.sys_prompt import PROCEDURAL_MEMORY
+from utils import telemetry
+from utils.actions import ActionProgram, as_program, render_legacy
+from utils.trajectory import record_llm_call
+from utils.logging_setup import echo
 
 import logging
 
@@ -13,10 +16,10 @@ import logging
 logger = logging.getLogger("ComputerAgent.utils.common_utils")
 
 
-def create_pyautogui_code(agent, code: str, obs: Dict) -> str:
+def create_action_program(agent, code: str, obs: Dict) -> ActionProgram:
     """
     使用当前 observation（截图）对输入的代码进行 eval，
-    生成基于 pyautogui 的可执行代码字符串。
+    生成动作的中间表示（见 utils/actions.py）。
 
     参数:
         agent (ACI): 用于执行 grounding 的 agent
@@ -24,7 +27,7 @@ def create_pyautogui_code(agent, code: str, obs: Dict) -> str:
         obs (Dict): 当前环境观测，必须包含 screenshot
 
     返回:
-        exec_code (str): 生成的 pyautogui 可执行代码字符串
+        ActionProgram: 类型化的动作序列
 
     异常:
         Exception: 当 eval 执行失败时抛出
@@ -32,8 +35,17 @@ def create_pyautogui_code(agent, code: str, obs: Dict) -> str:
     # 为 agent 设置当前截图，用于坐标 / OCR grounding
     agent.assign_screenshot(obs)
     # 执行代码字符串（通常会调用 agent 的 action 方法）
-    exec_code = eval(code)
-    return exec_code
+    return as_program(eval(code))
+
+
+def create_pyautogui_code(agent, code: str, obs: Dict) -> str:
+    """
+    与 create_action_program 相同，但返回渲染后的 pyautogui 可执行代码字符串。
+
+    异常:
+        Exception: 当 eval 执行失败时抛出
+    """
+    return render_legacy(create_action_program(agent, code, obs))
 
 
 def call_llm_safe(
@@ -54,27 +66,49 @@ def call_llm_safe(
     max_retries = 3  # 最大重试次数
     attempt = 0
     response = ""
-
-    while attempt < max_retries:
-        try:
-            # pdb.set_trace()
-            response = agent.get_response(
-                temperature=temperature, use_thinking=use_thinking, **kwargs
-            )
-            assert response is not None, "LLM 返回结果不能为空"
-            print(f"LLM 调用成功，返回结果: {response}")
-            # logger.info(f"LLM 调用成功，返回结果: {response}")
-            break
-        except Exception as e:
-            attempt += 1
-            print(f"第 {attempt} 次调用失败: {e}")
-            if attempt == max_retries:
-                print("已达到最大重试次数，放弃调用")
-        time.sleep(1.0)
+    messages = kwargs.get("messages") or agent.messages
+
+    with telemetry.span("llm.call", model=getattr(agent.engine, "model", None)) as llm_span:
+        if telemetry.enabled():
+            llm_span.set("image_bytes", telemetry.image_bytes(messages))
+            llm_span.set("llm_calls", 1)
+        while attempt < max_retries:
+            try:
+                # pdb.set_trace()
+                response = agent.get_response(
+                    temperature=temperature, use_thinking=use_thinking, **kwargs
+                )
+                assert response is not None, "LLM 返回结果不能为空"
+                record_llm_call(agent, messages, response)
+                usage_tracker = getattr(agent, "usage_tracker", None)
+                usage = getattr(agent.engine, "last_usage", None)
+                if usage_tracker is not None and usage is not None:
+                    usage_tracker.record(agent.usage_role, agent.engine.model, usage)
+                echo(f"LLM 调用成功，返回结果: {response}")
+                # logger.info(f"LLM 调用成功，返回结果: {response}")
+                break
+            except Exception as e:
+                attempt += 1
+                llm_span.add("retries")
+                print(f"第 {attempt} 次调用失败: {e}")
+                if attempt == max_retries:
+                    print("已达到最大重试次数，放弃调用")
+            time.sleep(1.0)
 
     return response if response is not None else ""
 
 
+def _between(text: str, start_tag: str, end_tag: str) -> str:
+    """
+    取最后一个 start_tag 之后、第一个 end_tag 之前的内容（不存在 start_tag 时从开头取），
+    与 text.split(start_tag)[-1].split(end_tag)[0] 等价但不创建中间列表。
+    """
+    start = text.rfind(start_tag)
+    start = 0 if start == -1 else start + len(start_tag)
+    end = text.find(end_tag, start)
+    return text[start:] if end == -1 else text[start:end]
+
+
 def split_thinking_response(full_response: str) -> Tuple[str, str]:
     """
     从包含 <thoughts> 和 <answer> 标签的响应中，
@@ -89,15 +123,85 @@ def split_thinking_response(full_response: str) -> Tuple[str, str]:
     """
     try:
         # 提取思考内容
-        thoughts = full_response.split("<thoughts>")[-1].split("</thoughts>")[0].strip()
+        thoughts = _between(full_response, "<thoughts>", "</thoughts>").strip()
         # 提取最终回答
-        answer = full_response.split("<answer>")[-1].split("</answer>")[0].strip()
+        answer = _between(full_response, "<answer>", "</answer>").strip()
         return answer, thoughts
     except Exception:
         # 如果解析失败，直接返回原始内容
         return full_response, ""
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的 token 数，不依赖具体 tokenizer。
+
+    ASCII 字符约 4 个算 1 个 token，中文等非 ASCII 字符按每字 1 个 token 计算。
+
+    参数:
+        text (str): 待估计的文本
+
+    返回:
+        int: 估计的 token 数
+    """
+    if not text:
+        return 0
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return (ascii_count + 3) // 4 + (len(text) - ascii_count)
+
+
+def _take_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """取文本开头（或结尾）估计不超过 max_tokens 的最长前缀（或后缀）的近似值。"""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    # 先按比例换算为字符数，超出时继续缩短（中英文混排时各部分的 token 密度不同）
+    count = len(text) * max(0, max_tokens) // total
+    while count > 0:
+        piece = text[-count:] if from_end else text[:count]
+        tokens = estimate_tokens(piece)
+        if tokens <= max_tokens:
+            return piece
+        count = min(count - 1, count * max_tokens // tokens)
+    return ""
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    按估计的 token 数截断文本，并插入截断标记；截断标记计入上限，结果的估计 token 数不超过 max_tokens。
+
+    参数:
+        text (str): 待截断的文本
+        max_tokens (int): 保留的 token 上限
+        keep (str): 保留哪一部分，"head"（开头）、"tail"（结尾）或 "both"（开头和结尾）
+
+    返回:
+        str: 截断后的文本，未超出上限时原样返回；上限连截断标记都容纳不下时只返回能容纳的部分
+    """
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+
+    def marker(omitted: int) -> str:
+        return f"...[已省略约 {omitted} tokens]..."
+
+    # 省略的 token 数不超过 total，按 total 估算标记（含两侧换行）占用的 token
+    content_budget = max_tokens - estimate_tokens(f"\n{marker(total)}\n")
+    if content_budget <= 0:
+        return marker(total) if estimate_tokens(marker(total)) <= max_tokens else ""
+
+    if keep == "both":
+        head = _take_tokens(text, content_budget // 2)
+        tail = _take_tokens(text, content_budget - content_budget // 2, from_end=True)
+        omitted = total - estimate_tokens(head) - estimate_tokens(tail)
+        return head + f"\n{marker(omitted)}\n" + tail
+    if keep == "tail":
+        tail = _take_tokens(text, content_budget, from_end=True)
+        return f"{marker(total - estimate_tokens(tail))}\n" + tail
+    head = _take_tokens(text, content_budget)
+    return head + f"\n{marker(total - estimate_tokens(head))}"
+
+
 def call_llm_formatted(generator, format_checkers, **kwargs):
     """
     调用 LLM 并确保输出格式符合要求，不符合则给反馈并重试。
@@ -124,7 +228,10 @@ def call_llm_formatted(generator, format_checkers, **kwargs):
 
     while attempt < max_retries:
         response = call_llm_safe(generator, messages=messages, **kwargs)
-        logger.info(f"第 {attempt} 次生成器返回结果: {response}")
+        logger.info("第 %d 次生成器返回结果: %s", attempt, response)
+
+        # 每个回复只解析一次，格式校验器通过 parse_response 共享解析结果
+        parse_response(response)
 
         # 收集格式错误反馈
         feedback_msgs = []
@@ -137,6 +244,8 @@ def call_llm_formatted(generator, format_checkers, **kwargs):
         if not feedback_msgs:
             break
 
+        telemetry.current_span().add("format_retries")
+
         logger.error(
             f"格式错误（第 {attempt} 次），模型 {generator.engine.model} 返回: {response}，"
             f"问题: {', '.join(feedback_msgs)}"
@@ -179,6 +288,11 @@ def call_llm_formatted(generator, format_checkers, **kwargs):
     return response
 
 
+# 预编译的解析正则，避免每次调用重新编译
+CODE_BLOCK_PATTERN = re.compile(r"```(?:\w+\s+)?(.*?)```", re.DOTALL)
+AGENT_CALL_START_PATTERN = re.compile(r"\bagent\.\w+\(")
+
+
 def parse_code_from_string(input_string):
     """
     从字符串中解析出被三反引号 ``` 包裹的代码块，
@@ -192,24 +306,48 @@ def parse_code_from_string(input_string):
     """
 
     # logger.info("正在从字符串中解析代码块: %s", input_string)
-    
-    input_string = input_string.strip()
 
-    # 匹配 ```code``` 或 ```python code``` 形式
-    pattern = r"```(?:\w+\s+)?(.*?)```"
+    # 匹配 ```code``` 或 ```python code``` 形式，只取最后一个代码块（通常是最终 grounded action）
+    last_match = None
+    for last_match in CODE_BLOCK_PATTERN.finditer(input_string.strip()):
+        pass
+    return last_match.group(1) if last_match else ""
 
-    matches = re.findall(pattern, input_string, re.DOTALL)
-    if len(matches) == 0:
-        return ""
 
-    # 只取最后一个代码块（通常是最终 grounded action）
-    return matches[-1]
+def _find_call_end(code: str, open_index: int) -> int:
+    """
+    从左括号位置开始扫描，返回与之匹配的右括号之后的位置（跳过字符串字面量）。
+    未闭合时返回 -1。
+    """
+    depth = 0
+    quote = None
+    i = open_index
+    length = len(code)
+    while i < length:
+        char = code[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return -1
 
 
 def extract_agent_functions(code):
     """
     从代码字符串中提取所有 agent.xxx(...) 形式的函数调用。
 
+    按括号配对确定每个调用的结束位置，同一行中的多个调用会被分别提取。
+
     参数:
         code (str): 需要分析的代码字符串
 
@@ -217,5 +355,178 @@ def extract_agent_functions(code):
         list[str]: 匹配到的 agent 方法调用列表
     """
     # logger.info("正在从代码中提取 agent 函数调用: %s", code)
-    pattern = r"(agent\.\w+\(\s*.*\))"
-    return re.findall(pattern, code)
+    calls = []
+    position = 0
+    while True:
+        match = AGENT_CALL_START_PATTERN.search(code, position)
+        if not match:
+            break
+        end = _find_call_end(code, match.end() - 1)
+        if end == -1:
+            break
+        calls.append(code[match.start():end])
+        position = end
+    return calls
+
+
+class ParsedResponse:
+    """
+    一次 LLM 输出的解析结果，所有格式校验器和 worker 共享同一份。
+
+    属性:
+        raw (str): 原始输出
+        answer (str): <answer> 标签中的内容
+        thoughts (str): <thoughts> 标签中的内容
+        code (str): 最后一个代码块的内容
+        agent_calls (list[str]): 代码块中的 agent.xxx(...) 调用
+    """
+
+    __slots__ = ("raw", "answer", "thoughts", "code", "agent_calls")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.answer, self.thoughts = split_thinking_response(raw)
+        self.code = parse_code_from_string(raw)
+        self.agent_calls = extract_agent_functions(self.code)
+
+
+@lru_cache(maxsize=16)
+def parse_response(response: str) -> ParsedResponse:
+    """
+    解析 LLM 输出，同一个字符串只解析一次（后续调用直接命中缓存）。
+
+    参数:
+        response (str): LLM 输出
+
+    返回:
+        ParsedResponse: 解析结果
+    """
+    return ParsedResponse(response)
+
+
+# 定位模型输出中常见的坐标格式，按可信度从高到低排列
+_NUMBER = r"(-?\d+(?:\.\d+)?)"
+_SEP = r"\s*[,\s]\s*"
+COORDINATE_PATTERNS = [
+    # <point>x y</point>、<point>(x, y)</point>
+    (
+        "point_tag",
+        1.0,
+        re.compile(r"<point>\s*\(?\s*" + _NUMBER + _SEP + _NUMBER + r"\s*\)?\s*</point>"),
+    ),
+    # UI-TARS 风格的 <|box_start|>(x1,y1),(x2,y2)<|box_end|>，取框中心
+    (
+        "box_tag",
+        0.95,
+        re.compile(
+            r"<\|box_start\|>\s*\(\s*" + _NUMBER + _SEP + _NUMBER + r"\s*\)\s*,?\s*(?:\(\s*"
+            + _NUMBER + _SEP + _NUMBER + r"\s*\))?\s*<\|box_end\|>"
+        ),
+    ),
+    # JSON：{"point_2d": [x, y]}、{"bbox_2d": [x1, y1, x2, y2]}、{"x": .., "y": ..}
+    (
+        "json_point",
+        0.9,
+        re.compile(r"\"(?:point|point_2d|coordinate|coords)\"\s*:\s*\[\s*" + _NUMBER + r"\s*,\s*" + _NUMBER + r"\s*\]"),
+    ),
+    (
+        "json_bbox",
+        0.9,
+        re.compile(
+            r"\"(?:bbox|bbox_2d|box)\"\s*:\s*\[\s*" + _NUMBER + r"\s*,\s*" + _NUMBER
+            + r"\s*,\s*" + _NUMBER + r"\s*,\s*" + _NUMBER + r"\s*\]"
+        ),
+    ),
+    (
+        "json_xy",
+        0.9,
+        re.compile(r"\"x\"\s*:\s*" + _NUMBER + r"\s*,\s*\"y\"\s*:\s*" + _NUMBER),
+    ),
+    # [x1, y1, x2, y2]，取框中心
+    (
+        "bbox",
+        0.8,
+        re.compile(
+            r"\[\s*" + _NUMBER + r"\s*,\s*" + _NUMBER + r"\s*,\s*" + _NUMBER
+            + r"\s*,\s*" + _NUMBER + r"\s*\]"
+        ),
+    ),
+    # (x, y) 或 [x, y]
+    (
+        "pair",
+        0.8,
+        re.compile(r"[\(\[]\s*" + _NUMBER + r"\s*,\s*" + _NUMBER + r"\s*[\)\]]"),
+    ),
+]
+BARE_NUMBER_PATTERN = re.compile(_NUMBER)
+
+
+class CoordinateParse:
+    """
+    定位模型输出的坐标解析结果。
+
+    属性:
+        x (float): 横坐标
+        y (float): 纵坐标
+        confidence (float): 解析可信度（0~1），取决于匹配到的格式以及是否存在多个不一致的候选
+        source (str): 匹配到的格式名称
+    """
+
+    __slots__ = ("x", "y", "confidence", "source")
+
+    def __init__(self, x: float, y: float, confidence: float, source: str):
+        self.x = x
+        self.y = y
+        self.confidence = confidence
+        self.source = source
+
+    def point(self) -> list:
+        """返回取整后的 [x, y]。"""
+        return [round(self.x), round(self.y)]
+
+    def __repr__(self) -> str:
+        return f"CoordinateParse(x={self.x}, y={self.y}, confidence={self.confidence}, source={self.source!r})"
+
+
+def _match_center(match) -> Tuple[float, float]:
+    """将匹配到的点或框（四个数）换算为点坐标。"""
+    values = [float(group) for group in match.groups() if group is not None]
+    if len(values) == 4:
+        return (values[0] + values[2]) / 2, (values[1] + values[3]) / 2
+    return values[0], values[1]
+
+
+def parse_coordinates(response: str) -> Optional[CoordinateParse]:
+    """
+    从定位模型的输出中解析坐标。
+
+    忽略 </think> 之前的思考内容，按 COORDINATE_PATTERNS 的顺序匹配结构化格式；
+    同一格式出现多个不一致的结果时降低可信度。都不匹配时退回到前两个数字，可信度较低。
+
+    参数:
+        response (str): 定位模型输出
+
+    返回:
+        Optional[CoordinateParse]: 解析结果，无法解析时返回 None
+    """
+    if not response:
+        return None
+    think_end = response.rfind("</think>")
+    if think_end != -1:
+        response = response[think_end + len("</think>"):]
+
+    for source, confidence, pattern in COORDINATE_PATTERNS:
+        match = pattern.search(response)
+        if match is None:
+            continue
+        x, y = _match_center(match)
+        second = pattern.search(response, match.end())
+        if second is not None and _match_center(second) != (x, y):
+            confidence *= 0.75
+        return CoordinateParse(x, y, confidence, source)
+
+    numbers = BARE_NUMBER_PATTERN.findall(response)
+    if len(numbers) < 2:
+        return None
+    confidence = 0.5 if len(numbers) == 2 else 0.2
+    return CoordinateParse(float(numbers[0]), float(numbers[1]), confidence, "numbers")
@@ -0,0 +1,117 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from utils.common_utils import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger("ComputerAgent.utils.context_builder")
+
+
+class ContextBuilder:
+    """按 token 预算拼装 prompt 文本。
+
+    每个来源（反思、文本缓冲、code agent 结果等）作为一个 section 加入，
+    可以单独设置预算；总量超出 total_budget 时按优先级从低到高压缩或丢弃，
+    并记录每个 section 被截断 / 丢弃的情况。
+    """
+
+    def __init__(self, total_budget: int):
+        """
+        参数:
+            total_budget (int): 拼装结果的估计 token 上限
+        """
+        self.total_budget = total_budget
+        self.sections: List[Dict] = []
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        budget: Optional[int] = None,
+        priority: int = 0,
+        keep: str = "head",
+        required: bool = False,
+    ) -> None:
+        """
+        加入一个 section，按加入顺序拼接。
+
+        参数:
+            name (str): section 名称，用于报告
+            text (str): section 文本，为空时忽略
+            budget (Optional[int]): 该 section 自身的 token 上限，None 表示不单独限制
+            priority (int): 优先级，总量超出时优先压缩数值小的 section
+            keep (str): 截断时保留的部分，见 truncate_to_tokens
+            required (bool): 为 True 时该 section 不参与压缩
+        """
+        if not text:
+            return
+        self.sections.append(
+            {
+                "name": name,
+                "text": text,
+                "tokens": estimate_tokens(text),
+                "budget": budget,
+                "priority": priority,
+                "keep": keep,
+                "required": required,
+            }
+        )
+
+    def build(self) -> Tuple[str, List[Dict]]:
+        """
+        按预算拼装文本。
+
+        返回:
+            Tuple[str, List[Dict]]: 拼装后的文本，以及被截断或丢弃的 section 报告
+                （每项包含 section、action、original_tokens、kept_tokens）
+        """
+        report = []
+        texts = {}
+
+        # 先按各 section 自身的预算截断
+        for index, section in enumerate(self.sections):
+            text = section["text"]
+            if section["budget"] is not None and section["tokens"] > section["budget"]:
+                text = truncate_to_tokens(text, section["budget"], section["keep"])
+            texts[index] = text
+
+        total = sum(estimate_tokens(text) for text in texts.values())
+
+        # 总量超出时按优先级从低到高压缩，压缩不够则整段丢弃
+        if total > self.total_budget:
+            candidates = sorted(
+                (i for i, s in enumerate(self.sections) if not s["required"]),
+                key=lambda i: self.sections[i]["priority"],
+            )
+            for index in candidates:
+                if total <= self.total_budget:
+                    break
+                current = estimate_tokens(texts[index])
+                allowed = current - (total - self.total_budget)
+                if allowed < 100:
+                    texts[index] = ""
+                    total -= current
+                else:
+                    texts[index] = truncate_to_tokens(
+                        texts[index], allowed, self.sections[index]["keep"]
+                    )
+                    total -= current - estimate_tokens(texts[index])
+
+        for index, section in enumerate(self.sections):
+            if texts[index] == section["text"]:
+                continue
+            kept = estimate_tokens(texts[index])
+            report.append(
+                {
+                    "section": section["name"],
+                    "action": "dropped" if not texts[index] else "truncated",
+                    "original_tokens": section["tokens"],
+                    "kept_tokens": kept,
+                }
+            )
+
+        if report:
+            logger.info(
+                "Context sections adjusted to fit %d tokens: %s", self.total_budget, report
+            )
+
+        return "".join(texts[i] for i in range(len(self.sections))), report
@@ -0,0 +1,142 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict, Optional
+
+from utils.action_executor import ActionExecutor
+from utils.actions import ActionProgram, compile_commands
+
+logger = logging.getLogger("ComputerAgent.utils.display")
+
+
+class LocalDisplay:
+    """当前桌面：用 pyautogui 截图，动作在常驻的执行进程中执行（与 main.py 相同）。
+
+    同一进程只有一个桌面，因此只能用于单个会话。
+    """
+
+    def __init__(self, width: int = 1920, height: int = 1080):
+        self.width = width
+        self.height = height
+        self.executor = ActionExecutor()
+
+    def start(self) -> None:
+        self.executor.start()
+
+    def stop(self) -> None:
+        self.executor.shutdown()
+
+    def screenshot(self) -> bytes:
+        """截取当前屏幕，返回 PNG 字节。"""
+        import pyautogui
+
+        buffered = io.BytesIO()
+        pyautogui.screenshot().save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    def execute(self, code: str, timeout: Optional[float] = None) -> Dict:
+        """执行 agent 生成的 pyautogui 代码，返回状态和耗时。"""
+        return self.executor.execute(code, timeout)
+
+    def execute_program(self, program: ActionProgram, timeout: Optional[float] = None) -> Dict:
+        """以结构化命令执行动作序列（不经过 exec），返回状态和耗时。"""
+        return self.executor.run(compile_commands(program), timeout)
+
+
+class XvfbDisplay:
+    """独立的 Xvfb 虚拟显示器，供并发会话使用。
+
+    每个实例启动一个 Xvfb 进程；截图通过 X 连接抓取，
+    动作在设置了 DISPLAY 的常驻执行进程中执行，互不干扰。
+    """
+
+    def __init__(
+        self,
+        display_num: int,
+        width: int = 1920,
+        height: int = 1080,
+        depth: int = 24,
+        startup_timeout: float = 10.0,
+    ):
+        """
+        参数:
+            display_num (int): 显示器编号，对应 DISPLAY=":<display_num>"
+            width (int): 屏幕宽度
+            height (int): 屏幕高度
+            depth (int): 颜色深度
+            startup_timeout (float): 等待 Xvfb 就绪的最长时间，单位秒
+        """
+        self.display_num = display_num
+        self.display = f":{display_num}"
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.executor = ActionExecutor(env={"DISPLAY": self.display})
+
+    def start(self) -> None:
+        """启动 Xvfb 并等待 X socket 出现。"""
+        if self.process is not None and self.process.poll() is None:
+            return
+        if shutil.which("Xvfb") is None:
+            raise RuntimeError("未找到 Xvfb，请先安装（如 apt install xvfb）")
+
+        self.process = subprocess.Popen(
+            [
+                "Xvfb",
+                self.display,
+                "-screen",
+                "0",
+                f"{self.width}x{self.height}x{self.depth}",
+                "-nolisten",
+                "tcp",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        socket_path = f"/tmp/.X11-unix/X{self.display_num}"
+        deadline = time.monotonic() + self.startup_timeout
+        while not os.path.exists(socket_path):
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Xvfb {self.display} 启动失败，退出码 {self.process.returncode}")
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Xvfb {self.display} 启动超时")
+            time.sleep(0.05)
+        logger.info(f"Started Xvfb on {self.display} ({self.width}x{self.height})")
+        # pyautogui 在导入时连接 DISPLAY，因此执行进程在 Xvfb 就绪后再启动
+        self.executor.start()
+
+    def stop(self) -> None:
+        """关闭执行进程和 Xvfb。"""
+        self.executor.shutdown()
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def screenshot(self) -> bytes:
+        """截取虚拟显示器，返回 PNG 字节。"""
+        from PIL import ImageGrab
+
+        buffered = io.BytesIO()
+        ImageGrab.grab(xdisplay=self.display).save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    def execute(self, code: str, timeout: Optional[float] = 60) -> Dict:
+        """在指向该显示器的执行进程中执行 agent 生成的 pyautogui 代码，返回状态和耗时。"""
+        return self.executor.execute(code, timeout)
+
+    def execute_program(self, program: ActionProgram, timeout: Optional[float] = 60) -> Dict:
+        """以结构化命令执行动作序列（不经过 exec），返回状态和耗时。"""
+        return self.executor.run(compile_commands(program), timeout)
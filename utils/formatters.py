@@ -1,9 +1,8 @@
 from utils.common_utils import (
-    split_thinking_response,
-    create_pyautogui_code,
-    parse_code_from_string,
-    extract_agent_functions,
+    create_action_program,
+    parse_response,
 )
+from utils.macro import extract_macro_calls, macro_error
 
 import logging
 
@@ -12,12 +11,9 @@ logger = logging.getLogger("ComputerAgent.utils.formatters")
 
 
 # 校验：代码响应中必须且只能包含一个 agent action
+# 所有校验器通过 parse_response 读取同一份解析结果，每个回复只解析一次
 single_action_check = (
-    lambda response: len(
-        extract_agent_functions(
-            parse_code_from_string(response)
-        )
-    ) == 1
+    lambda response: len(parse_response(response).agent_calls) == 1
 )
 
 # 单一 action 校验失败时的错误提示
@@ -33,18 +29,28 @@ SINGLE_ACTION_FORMATTER = lambda response: (
 
 
 def _attempt_code_creation(agent, code, obs):
-    """尝试根据响应代码生成一段 pyautogui 代码"""
+    """尝试根据响应代码生成动作序列"""
     try:
-        return create_pyautogui_code(agent, code, obs)
+        return create_action_program(agent, code, obs)
     except Exception:
         return None
 
 
+def make_macro_action_formatter(max_actions):
+    """宏模式的动作数量校验格式器：1 到 max_actions 个 agent action，done / fail / call_code_agent 只能单独出现。"""
+
+    def check(response):
+        error = macro_error(parse_response(response).agent_calls, max_actions)
+        return error is None, f"Incorrect code: {error}"
+
+    return check
+
+
 # 校验：agent action 是否为合法函数，且参数符合文档字符串中定义的范围
 code_valid_check = (
     lambda agent, obs, response: _attempt_code_creation(
         agent,
-        parse_code_from_string(response),
+        parse_response(response).code,
         obs,
     )
     is not None
@@ -61,8 +67,25 @@ CODE_VALID_FORMATTER = lambda agent, obs, response: (
     code_valid_error_msg,
 )
 
+def _attempt_macro_creation(agent, code, obs):
+    """逐个尝试生成宏中每个动作的动作序列，任一失败返回 None"""
+    programs = []
+    for call, _ in extract_macro_calls(code):
+        program = _attempt_code_creation(agent, call, obs)
+        if program is None:
+            return None
+        programs.append(program)
+    return programs
+
+
+# 宏模式的代码合法性校验格式器：每个 agent action 都必须合法
+MACRO_CODE_VALID_FORMATTER = lambda agent, obs, response: (
+    _attempt_macro_creation(agent, parse_response(response).code, obs) is not None,
+    code_valid_error_msg,
+)
+
 # 校验：响应中必须包含非空的 <thoughts>...</thoughts> 和 <answer>...</answer> 标签
-thoughts_answer_tag_check = lambda response: split_thinking_response(response)[1] != ""
+thoughts_answer_tag_check = lambda response: parse_response(response).thoughts != ""
 thoughts_answer_tag_error_msg = "Incorrect response: The response must contain both <thoughts>...</thoughts> and <answer>...</answer> tags."
 THOUGHTS_ANSWER_TAG_FORMATTER = lambda response: (
     thoughts_answer_tag_check(response),
@@ -70,7 +93,7 @@ THOUGHTS_ANSWER_TAG_FORMATTER = lambda response: (
 )
 
 integer_answer_check = (
-    lambda response: split_thinking_response(response)[0].strip().isdigit()
+    lambda response: parse_response(response).answer.strip().isdigit()
 )
 integer_answer_error_msg = (
     "Incorrect response: The <answer>...</answer> tag must contain a single integer."
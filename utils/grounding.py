@@ -1,20 +1,43 @@
 import re
-from collections import defaultdict
-from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple
-
-import pytesseract
-from PIL import Image
-from pytesseract import Output
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from prompt.sys_prompt import PROCEDURAL_MEMORY
 from core.llm import LLMAgent
-from utils.common_utils import call_llm_safe
+from utils.actions import (
+    Click,
+    CodeAgentCall,
+    Drag,
+    Key,
+    Scroll,
+    Script,
+    Signal,
+    Sleep,
+    TypeText,
+    text_input,
+)
+from utils.common_utils import call_llm_safe, parse_coordinates
 from agent.code_agent import CodeAgent
+from utils import telemetry
+from utils.logging_setup import echo
+from utils.ocr_index import OCRIndex
 import logging
 
+if TYPE_CHECKING:
+    # numpy / PIL / pytesseract are imported on first use (see the lazy properties of OSWorldACI)
+    from utils.grounding_cache import GroundingCache
+    from utils.ocr import OCREngine, OCRResult
+
 logger = logging.getLogger("ComputerAgent.utils.grounding")
 
+# Grounding outputs parsed below this confidence are re-asked before being used
+GROUNDING_MIN_CONFIDENCE = 0.5
+GROUNDING_RETRY_PROMPT = (
+    "Your previous answer did not contain a clear coordinate. "
+    "Output only the coordinate of one point in the format (x, y)."
+)
+
 
 class ACI:
     def __init__(self):
@@ -187,6 +210,9 @@ class OSWorldACI(ACI):
         height: int = 1080,
         code_agent_budget: int = 20,
         code_agent_engine_params: Dict = None,
+        ocr_config: Dict = None,
+        enable_grounding_cache: bool = True,
+        grounding_retries: int = 2,
     ):
         super().__init__()
 
@@ -205,125 +231,252 @@ class OSWorldACI(ACI):
         # Screenshot used during ACI execution
         self.obs = None
 
-        # Configure the visual grounding model responsible for coordinate generation
-        self.grounding_model = LLMAgent(engine_params_for_grounding)
+        # The grounding model, text span agent, code agent, grounding cache and OCR engine are
+        # built on first use, so a step that never needs one of them never pays for it
+        self.engine_params_for_generation = engine_params_for_generation
         self.engine_params_for_grounding = engine_params_for_grounding
-
-        # Configure text grounding agent
-        self.text_span_agent = LLMAgent(
-            engine_params=engine_params_for_generation,
-            system_prompt=PROCEDURAL_MEMORY.PHRASE_TO_WORD_COORDS_PROMPT,
-        )
-
-        # Configure code agent
-        code_agent_engine_params = (
-            code_agent_engine_params or engine_params_for_generation
-        )
-        self.code_agent = CodeAgent(code_agent_engine_params, code_agent_budget)
+        self.grounding_retries = grounding_retries
+        self.enable_grounding_cache = enable_grounding_cache
+        self.code_agent_budget = code_agent_budget
+        self.code_agent_engine_params = code_agent_engine_params or engine_params_for_generation
+        # Tiled OCR engine config for text grounding, e.g. ocr_config={"lang": "chi_sim+eng"}
+        self.ocr_config = ocr_config or {}
+        self.usage_tracker = None
 
         # Store task instruction for code agent
         self.current_task_instruction = None
         self.last_code_agent_result = None
 
-    # Given the state and worker's referring expression, use the grounding model to generate (x,y)
-    def generate_coords(self, ref_expr: str, obs: Dict) -> List[int]:
-
-        # Reset the grounding model state
-        self.grounding_model.reset()
+        # OCR results and phrase index of the current frame, built at most once per screenshot
+        self._ocr_cache_key = None
+        self._ocr_cache = None
+
+    # Visual grounding model responsible for coordinate generation
+    @cached_property
+    def grounding_model(self) -> LLMAgent:
+        grounding_model = LLMAgent(self.engine_params_for_grounding)
+        grounding_model.usage_tracker = self.usage_tracker
+        grounding_model.usage_role = "grounding"
+        return grounding_model
+
+    # Cross-step cache of grounded points, validated against the image patch around each point
+    @cached_property
+    def grounding_cache(self) -> Optional["GroundingCache"]:
+        if not self.enable_grounding_cache:
+            return None
+        from utils.grounding_cache import GroundingCache
+
+        return GroundingCache(
+            (
+                self.engine_params_for_grounding["grounding_width"],
+                self.engine_params_for_grounding["grounding_height"],
+            )
+        )
 
-        # Configure the context, UI-TARS demo does not use system prompt
-        prompt = f"Query:{ref_expr}\nOutput only the coordinate of one point in your response.\n"
-        self.grounding_model.add_message(
-            text_content=prompt, image_content=obs["screenshot"], put_text_last=True
+    # Text grounding agent, only needed when OCR cannot resolve a phrase locally
+    @cached_property
+    def text_span_agent(self) -> LLMAgent:
+        text_span_agent = LLMAgent(
+            engine_params=self.engine_params_for_generation,
+            system_prompt=PROCEDURAL_MEMORY.PHRASE_TO_WORD_COORDS_PROMPT,
         )
+        text_span_agent.usage_tracker = self.usage_tracker
+        text_span_agent.usage_role = "text_span"
+        return text_span_agent
 
-        # Generate and parse coordinates
-        response = call_llm_safe(self.grounding_model)
-        print("RAW GROUNDING MODEL RESPONSE:", response)
-        numericals = re.findall(r"\d+", response)
-        assert len(numericals) >= 2
-        return [int(numericals[0]), int(numericals[1])]
+    @cached_property
+    def code_agent(self) -> CodeAgent:
+        code_agent = CodeAgent(self.code_agent_engine_params, self.code_agent_budget)
+        code_agent.usage_tracker = self.usage_tracker
+        code_agent.agent.usage_tracker = self.usage_tracker
+        return code_agent
 
-    # Calls pytesseract to generate word level bounding boxes for text grounding
-    def get_ocr_elements(self, b64_image_data: str) -> Tuple[str, List]:
-        image = Image.open(BytesIO(b64_image_data))
-        image_data = pytesseract.image_to_data(image, output_type=Output.DICT)
-
-        # Clean text by removing leading and trailing spaces and non-alphabetical characters, but keeping punctuation
-        for i, word in enumerate(image_data["text"]):
-            image_data["text"][i] = re.sub(
-                r"^[^a-zA-Z\s.,!?;:\-\+]+|[^a-zA-Z\s.,!?;:\-\+]+$", "", word
+    @cached_property
+    def ocr_engine(self) -> "OCREngine":
+        from utils.ocr import OCREngine
+
+        return OCREngine(**self.ocr_config)
+
+    # Given the state and worker's referring expression, use the grounding model to generate (x,y)
+    def generate_coords(self, ref_expr: str, obs: Dict) -> List[int]:
+        with telemetry.span("grounding.coords") as coords_span:
+            if self.grounding_cache is not None:
+                coords = self.grounding_cache.lookup(ref_expr, obs["screenshot"])
+                coords_span.set("cache_hit", coords is not None)
+                if coords is not None:
+                    return coords
+
+            # Reset the grounding model state
+            self.grounding_model.reset()
+
+            # Configure the context, UI-TARS demo does not use system prompt
+            prompt = f"Query:{ref_expr}\nOutput only the coordinate of one point in your response.\n"
+            self.grounding_model.add_message(
+                text_content=prompt, image_content=obs["screenshot"], put_text_last=True
             )
 
-        ocr_elements = []
-        ocr_table = "Text Table:\nWord id\tText\n"
-        # Obtain the <id, text, group number, word number> for each valid element
-        grouping_map = defaultdict(list)
-        ocr_id = 0
-        for i in range(len(image_data["text"])):
-            block_num = image_data["block_num"][i]
-            if image_data["text"][i]:
-                grouping_map[block_num].append(image_data["text"][i])
-                ocr_table += f"{ocr_id}\t{image_data['text'][i]}\n"
-                ocr_elements.append(
-                    {
-                        "id": ocr_id,
-                        "text": image_data["text"][i],
-                        "group_num": block_num,
-                        "word_num": len(grouping_map[block_num]),
-                        "left": image_data["left"][i],
-                        "top": image_data["top"][i],
-                        "width": image_data["width"][i],
-                        "height": image_data["height"][i],
-                    }
-                )
-                ocr_id += 1
+            # Generate and parse coordinates
+            coords = self._ground_with_retries(self.grounding_model.messages)
+            if self.grounding_cache is not None:
+                self.grounding_cache.store(ref_expr, coords, obs["screenshot"])
+            return coords
+
+    # Resolve several referring expressions against the same frame, returning coordinates in input order
+    def generate_coords_batch(self, ref_exprs: List[str], obs: Dict) -> List[List[int]]:
+        with telemetry.span("grounding.coords_batch", queries=len(ref_exprs)) as batch_span:
+            results = [None] * len(ref_exprs)
+            if self.grounding_cache is not None:
+                for i, ref_expr in enumerate(ref_exprs):
+                    results[i] = self.grounding_cache.lookup(ref_expr, obs["screenshot"])
+            pending = [i for i, coords in enumerate(results) if coords is None]
+            batch_span.set("cache_hits", len(ref_exprs) - len(pending))
+            if len(pending) <= 1:
+                for i in pending:
+                    results[i] = self.generate_coords(ref_exprs[i], obs)
+                return results
+
+            # Encode the screenshot once; every query reuses the same message prefix and image part
+            self.grounding_model.reset()
+            self.grounding_model.add_message(
+                text_content="", image_content=obs["screenshot"], put_text_last=True
+            )
+            prefix = self.grounding_model.messages[:-1]
+            image_message = self.grounding_model.messages[-1]
+
+            def ground(ref_expr: str) -> List[int]:
+                prompt = f"Query:{ref_expr}\nOutput only the coordinate of one point in your response.\n"
+                message = {
+                    "role": image_message["role"],
+                    "content": [
+                        {"type": "text", "text": prompt} if part["type"] == "text" else part
+                        for part in image_message["content"]
+                    ],
+                }
+                # Worker threads do not inherit the span stack, so attach to the batch span explicitly
+                with telemetry.span("grounding.coords", parent=batch_span):
+                    coords = self._ground_with_retries(prefix + [message])
+                if self.grounding_cache is not None:
+                    self.grounding_cache.store(ref_expr, coords, obs["screenshot"])
+                return coords
+
+            with ThreadPoolExecutor(max_workers=min(len(pending), 8)) as executor:
+                grounded = executor.map(ground, [ref_exprs[i] for i in pending])
+                for i, coords in zip(pending, grounded):
+                    results[i] = coords
+            return results
+
+    # Query the grounding model, re-asking only the grounding call when its output cannot be parsed
+    def _ground_with_retries(self, messages: List[Dict]) -> List[int]:
+        best = None
+        for attempt in range(self.grounding_retries + 1):
+            response = call_llm_safe(self.grounding_model, messages=messages)
+            echo(f"RAW GROUNDING MODEL RESPONSE: {response}")
+            parsed = parse_coordinates(response)
+            if parsed is not None and (best is None or parsed.confidence > best.confidence):
+                best = parsed
+            if parsed is not None and parsed.confidence >= GROUNDING_MIN_CONFIDENCE:
+                telemetry.current_span().set("confidence", parsed.confidence)
+                return parsed.point()
+            logger.warning(
+                f"Unreliable grounding output (attempt {attempt + 1}, parsed {parsed}): {response!r}"
+            )
+            messages = messages + [
+                {"role": "assistant", "content": [{"type": "text", "text": response}]},
+                {"role": "user", "content": [{"type": "text", "text": GROUNDING_RETRY_PROMPT}]},
+            ]
 
-        return ocr_table, ocr_elements
+        # Fall back to the most confident parse of any attempt rather than failing the whole step
+        if best is not None:
+            telemetry.current_span().set("confidence", best.confidence)
+            return best.point()
+        raise ValueError(f"Could not parse coordinates from grounding output: {response!r}")
+
+    # Calls pytesseract to generate word level bounding boxes for text grounding
+    def get_ocr_elements(
+        self, b64_image_data: str, roi: Optional[Tuple[int, int, int, int]] = None
+    ) -> "OCRResult":
+        return self.ocr_engine.recognize(b64_image_data, roi=roi)
+
+    # OCR the screenshot once per frame and index the words for local phrase matching
+    def get_frame_ocr(
+        self, screenshot, roi: Optional[Tuple[int, int, int, int]] = None
+    ) -> Tuple["OCRResult", OCRIndex]:
+        key = self._ocr_cache_key
+        if key is None or key[0] is not screenshot or key[1] != roi:
+            with telemetry.span("grounding.ocr") as ocr_span:
+                ocr_result = self.get_ocr_elements(screenshot, roi=roi)
+                ocr_span.set("words", len(ocr_result))
+            self._ocr_cache = (ocr_result, OCRIndex(ocr_result.texts))
+            self._ocr_cache_key = (screenshot, roi)
+        return self._ocr_cache
 
     # Given the state and worker's text phrase, generate the coords of the first/last word in the phrase
     def generate_text_coords(
-        self, phrase: str, obs: Dict, alignment: str = ""
+        self,
+        phrase: str,
+        obs: Dict,
+        alignment: str = "",
+        roi: Optional[Tuple[int, int, int, int]] = None,
     ) -> List[int]:
+        with telemetry.span("grounding.text_coords") as text_span:
+            ocr_result, ocr_index = self.get_frame_ocr(obs["screenshot"], roi=roi)
+
+            # Exact or unambiguous near-exact matches are resolved without the LLM
+            text_id = ocr_index.resolve(phrase, alignment)
+            text_span.set("resolved_locally", text_id is not None)
+            if text_id is not None:
+                logger.info(f"Resolved phrase {phrase!r} locally to word id {text_id}")
+                return ocr_result.word_coords(text_id, alignment)
+
+            alignment_prompt = ""
+            if alignment == "start":
+                alignment_prompt = "**Important**: Output the word id of the FIRST word in the provided phrase.\n"
+            elif alignment == "end":
+                alignment_prompt = "**Important**: Output the word id of the LAST word in the provided phrase.\n"
+
+            # Load LLM prompt
+            self.text_span_agent.reset()
+            self.text_span_agent.add_message(
+                alignment_prompt + "Phrase: " + phrase + "\n" + ocr_result.table, role="user"
+            )
+            self.text_span_agent.add_message(
+                "Screenshot:\n", image_content=obs["screenshot"], role="user"
+            )
 
-        ocr_table, ocr_elements = self.get_ocr_elements(obs["screenshot"])
-
-        alignment_prompt = ""
-        if alignment == "start":
-            alignment_prompt = "**Important**: Output the word id of the FIRST word in the provided phrase.\n"
-        elif alignment == "end":
-            alignment_prompt = "**Important**: Output the word id of the LAST word in the provided phrase.\n"
-
-        # Load LLM prompt
-        self.text_span_agent.reset()
-        self.text_span_agent.add_message(
-            alignment_prompt + "Phrase: " + phrase + "\n" + ocr_table, role="user"
-        )
-        self.text_span_agent.add_message(
-            "Screenshot:\n", image_content=obs["screenshot"], role="user"
-        )
-
-        # Obtain the target element
-        response = call_llm_safe(self.text_span_agent)
-        print("TEXT SPAN AGENT RESPONSE:", response)
-        numericals = re.findall(r"\d+", response)
-        if len(numericals) > 0:
-            text_id = int(numericals[-1])
-        else:
-            text_id = 0
-        elem = ocr_elements[text_id]
-
-        # Compute the element coordinates
-        if alignment == "start":
-            coords = [elem["left"], elem["top"] + (elem["height"] // 2)]
-        elif alignment == "end":
-            coords = [elem["left"] + elem["width"], elem["top"] + (elem["height"] // 2)]
-        else:
-            coords = [
-                elem["left"] + (elem["width"] // 2),
-                elem["top"] + (elem["height"] // 2),
-            ]
-        return coords
+            # Obtain the target element
+            response = call_llm_safe(self.text_span_agent)
+            echo(f"TEXT SPAN AGENT RESPONSE: {response}")
+            numericals = re.findall(r"\d+", response)
+            if len(numericals) > 0:
+                text_id = int(numericals[-1])
+            else:
+                text_id = 0
+            return ocr_result.word_coords(text_id, alignment)
+
+    # Record token usage of the grounding, text span and code agents under their own roles
+    def set_usage_tracker(self, usage_tracker) -> None:
+        # Sub-agents that are not built yet pick the tracker up when they are created
+        self.usage_tracker = usage_tracker
+        for name in ("grounding_model", "text_span_agent"):
+            if name in self.__dict__:
+                self.__dict__[name].usage_tracker = usage_tracker
+        if "code_agent" in self.__dict__:
+            self.code_agent.usage_tracker = usage_tracker
+            self.code_agent.agent.usage_tracker = usage_tracker
+
+    def reset(self) -> None:
+        """Clear per-task state so a new task does not see the previous task's notes, code agent result or caches.
+
+        Sub-agents that are already built are kept; only what they remember about the last task is dropped.
+        """
+        self.notes = []
+        self.obs = None
+        self.current_task_instruction = None
+        self.last_code_agent_result = None
+        self._ocr_cache_key = None
+        self._ocr_cache = None
+        if self.__dict__.get("grounding_cache") is not None:
+            self.grounding_cache.clear()
 
     def assign_screenshot(self, obs: Dict):
         self.obs = obs
@@ -342,6 +495,15 @@ class OSWorldACI(ACI):
             round(coordinates[1] * self.height / grounding_height),
         ]
 
+    # Open the system launcher with a hotkey, type the name and confirm
+    def _launcher_search(self, launcher_keys: Tuple[str, ...], name: str):
+        return (
+            Key(launcher_keys, interval=0.5),
+            TypeText(name),
+            Key(("enter",), combo=False),
+            Sleep(1.0),
+        )
+
     @agent_action
     def click(
         self,
@@ -359,16 +521,8 @@ class OSWorldACI(ACI):
         """
         coords1 = self.generate_coords(element_description, self.obs)
         x, y = self.resize_coordinates(coords1)
-        command = "import pyautogui; "
-
         # TODO: specified duration?
-        for k in hold_keys:
-            command += f"pyautogui.keyDown({repr(k)}); "
-        command += f"""import pyautogui; pyautogui.click({x}, {y}, clicks={num_clicks}, button={repr(button_type)}); """
-        for k in hold_keys:
-            command += f"pyautogui.keyUp({repr(k)}); "
-        # Return pyautoguicode to click on the element
-        return command
+        return (Click(x, y, num_clicks, button_type, tuple(hold_keys)),)
 
     @agent_action
     def switch_applications(self, app_code):
@@ -377,11 +531,11 @@ class OSWorldACI(ACI):
             app_code:str the code name of the application to switch to from the provided list of open applications
         """
         if self.platform == "darwin":
-            return f"import pyautogui; import time; pyautogui.hotkey('command', 'space', interval=0.5); pyautogui.typewrite({repr(app_code)}); pyautogui.press('enter'); time.sleep(1.0)"
+            return self._launcher_search(("command", "space"), app_code)
         elif self.platform == "linux":
-            return UBUNTU_APP_SETUP.replace("APP_NAME", app_code)
+            return (Script(UBUNTU_APP_SETUP.replace("APP_NAME", app_code)),)
         elif self.platform == "windows":
-            return f"import pyautogui; import time; pyautogui.hotkey('win', 'd', interval=0.5); pyautogui.typewrite({repr(app_code)}); pyautogui.press('enter'); time.sleep(1.0)"
+            return self._launcher_search(("win", "d"), app_code)
         else:
             assert (
                 False
@@ -393,17 +547,17 @@ class OSWorldACI(ACI):
         Args:
             app_or_filename:str, the name of the application or filename to open
         """
-        if self.platform == "linux":
-            return f"import pyautogui; pyautogui.hotkey('win'); time.sleep(0.5); pyautogui.write({repr(app_or_filename)}); time.sleep(1.0); pyautogui.hotkey('enter'); time.sleep(0.5)"
-        elif self.platform == "darwin":
-            return f"import pyautogui; import time; pyautogui.hotkey('command', 'space', interval=0.5); pyautogui.typewrite({repr(app_or_filename)}); pyautogui.press('enter'); time.sleep(1.0)"
-        elif self.platform == "windows":
+        if self.platform in ("linux", "windows"):
             return (
-                "import pyautogui; import time; "
-                "pyautogui.hotkey('win'); time.sleep(0.5); "
-                f"pyautogui.write({repr(app_or_filename)}); time.sleep(1.0); "
-                "pyautogui.press('enter'); time.sleep(0.5)"
+                Key(("win",)),
+                Sleep(0.5),
+                TypeText(app_or_filename),
+                Sleep(1.0),
+                Key(("enter",), combo=False),
+                Sleep(0.5),
             )
+        elif self.platform == "darwin":
+            return self._launcher_search(("command", "space"), app_or_filename)
         else:
             assert (
                 False
@@ -424,42 +578,25 @@ class OSWorldACI(ACI):
             overwrite:bool, Assign it to True if the text should overwrite the existing text, otherwise assign it to False. Using this argument clears all text in an element.
             enter:bool, Assign it to True if the enter key should be pressed after typing the text, otherwise assign it to False.
         """
-        command = "import pyautogui; "
-        command += (
-            "\ntry:\n"
-            "    import pyperclip\n"
-            "except ImportError:\n"
-            "    import subprocess\n"
-            "    subprocess.run('echo \"osworld-public-evaluation\" | sudo -S apt-get install -y xclip xsel', shell=True, check=True)\n"
-            "    subprocess.check_call([subprocess.sys.executable, '-m', 'pip', 'install', 'pyperclip'])\n"
-            "    import pyperclip\n\n"
-        )
+        modifier = "command" if self.platform == "darwin" else "ctrl"
+        program = []
 
         if element_description is not None:
             coords1 = self.generate_coords(element_description, self.obs)
             x, y = self.resize_coordinates(coords1)
-            command += f"pyautogui.click({x}, {y}); "
+            program.append(Click(x, y))
 
         if overwrite:
-            command += (
-                f"pyautogui.hotkey({repr('command' if self.platform == 'darwin' else 'ctrl')}, 'a'); "
-                "pyautogui.press('backspace'); "
-            )
-
-        # Check if text contains Unicode characters that pyautogui.write() can't handle
-        has_unicode = any(ord(char) > 127 for char in text)
+            program.append(Key((modifier, "a")))
+            program.append(Key(("backspace",), combo=False))
 
-        if has_unicode:
-            # Use clipboard method for Unicode characters
-            command += f"pyperclip.copy({repr(text)}); "
-            command += f"pyautogui.hotkey({repr('command' if self.platform == 'darwin' else 'ctrl')}, 'v'); "
-        else:
-            # Use regular pyautogui.write() for ASCII text
-            command += f"pyautogui.write({repr(text)}); "
+        # pyautogui.write() cannot type Unicode characters and sends one key at a time,
+        # so Unicode and long text are pasted through the clipboard instead
+        program.append(text_input(text, paste_keys=(modifier, "v")))
 
         if enter:
-            command += "pyautogui.press('enter'); "
-        return command
+            program.append(Key(("enter",), combo=False))
+        return tuple(program)
 
     @agent_action
     def save_to_knowledge(self, text: List[str]):
@@ -468,7 +605,7 @@ class OSWorldACI(ACI):
             text:List[str] the text to save to the knowledge
         """
         self.notes.extend(text)
-        return """WAIT"""
+        return (Signal("WAIT"),)
 
     @agent_action
     def drag_and_drop(
@@ -480,24 +617,13 @@ class OSWorldACI(ACI):
             ending_description:str, a very detailed description of where to end the drag action. This description should be at least a full sentence.
             hold_keys:List list of keys to hold while dragging
         """
-        coords1 = self.generate_coords(starting_description, self.obs)
-        coords2 = self.generate_coords(ending_description, self.obs)
+        coords1, coords2 = self.generate_coords_batch(
+            [starting_description, ending_description], self.obs
+        )
         x1, y1 = self.resize_coordinates(coords1)
         x2, y2 = self.resize_coordinates(coords2)
-
-        command = "import pyautogui; "
-
-        command += f"pyautogui.moveTo({x1}, {y1}); "
         # TODO: specified duration?
-        for k in hold_keys:
-            command += f"pyautogui.keyDown({repr(k)}); "
-        command += f"pyautogui.dragTo({x2}, {y2}, duration=1., button='left'); pyautogui.mouseUp(); "
-        for k in hold_keys:
-            command += f"pyautogui.keyUp({repr(k)}); "
-
-        # Return pyautoguicode to drag and drop the elements
-
-        return command
+        return (Drag(x1, y1, x2, y2, hold_keys=tuple(hold_keys)),)
 
     @agent_action
     def highlight_text_span(
@@ -515,13 +641,7 @@ class OSWorldACI(ACI):
         coords2 = self.generate_text_coords(ending_phrase, self.obs, alignment="end")
         x1, y1 = coords1
         x2, y2 = coords2
-
-        command = "import pyautogui; "
-        command += f"pyautogui.moveTo({x1}, {y1}); "
-        command += f"pyautogui.dragTo({x2}, {y2}, duration=1., button='{button}'); pyautogui.mouseUp(); "
-
-        # Return pyautoguicode to drag and drop the elements
-        return command
+        return (Drag(x1, y1, x2, y2, button=button),)
 
     @agent_action
     def set_cell_values(
@@ -534,8 +654,12 @@ class OSWorldACI(ACI):
             app_name: str, The name of the spreadsheet application. For example, "Some_sheet.xlsx".
             sheet_name: str, The name of the sheet in the spreadsheet. For example, "Sheet1".
         """
-        return SET_CELL_VALUES_CMD.format(
-            cell_values=cell_values, app_name=app_name, sheet_name=sheet_name
+        return (
+            Script(
+                SET_CELL_VALUES_CMD.format(
+                    cell_values=cell_values, app_name=app_name, sheet_name=sheet_name
+                )
+            ),
         )
 
     @agent_action
@@ -595,11 +719,11 @@ class OSWorldACI(ACI):
             logger.info("GROUNDING AGENT: Code Agent Call Finished")
             logger.info("=" * 50)
 
-            # Return code to be executed in the environment
-            return "import time; time.sleep(2.222)"
+            # The code already ran; the environment only waits for its effects to settle
+            return (CodeAgentCall(task_to_execute, result["completion_reason"]),)
         else:
             logger.warning("No task instruction available for code agent call")
-            return "import time; time.sleep(1.111)"
+            return (Sleep(1.111),)
 
     @agent_action
     def scroll(self, element_description: str, clicks: int, shift: bool = False):
@@ -612,10 +736,7 @@ class OSWorldACI(ACI):
         coords1 = self.generate_coords(element_description, self.obs)
         x, y = self.resize_coordinates(coords1)
 
-        if shift:
-            return f"import pyautogui; import time; pyautogui.moveTo({x}, {y}); time.sleep(0.5); pyautogui.hscroll({clicks})"
-        else:
-            return f"import pyautogui; import time; pyautogui.moveTo({x}, {y}); time.sleep(0.5); pyautogui.vscroll({clicks})"
+        return (Scroll(x, y, clicks, horizontal=shift),)
 
     @agent_action
     def hotkey(self, keys: List):
@@ -623,9 +744,7 @@ class OSWorldACI(ACI):
         Args:
             keys:List the keys to press in combination in a list format (e.g. ['ctrl', 'c'])
         """
-        # add quotes around the keys
-        keys = [f"'{key}'" for key in keys]
-        return f"import pyautogui; pyautogui.hotkey({', '.join(keys)})"
+        return (Key(tuple(keys)),)
 
     @agent_action
     def hold_and_press(self, hold_keys: List, press_keys: List):
@@ -635,15 +754,7 @@ class OSWorldACI(ACI):
             press_keys:List, list of keys to press in a sequence
         """
 
-        press_keys_str = "[" + ", ".join([f"'{key}'" for key in press_keys]) + "]"
-        command = "import pyautogui; "
-        for k in hold_keys:
-            command += f"pyautogui.keyDown({repr(k)}); "
-        command += f"pyautogui.press({press_keys_str}); "
-        for k in hold_keys:
-            command += f"pyautogui.keyUp({repr(k)}); "
-
-        return command
+        return (Key(tuple(press_keys), tuple(hold_keys), combo=False),)
 
     @agent_action
     def wait(self, time: float):
@@ -651,14 +762,14 @@ class OSWorldACI(ACI):
         Args:
             time:float the amount of time to wait in seconds
         """
-        return f"""import time; time.sleep({time})"""
+        return (Sleep(time),)
 
     @agent_action
     def done(self):
         """End the current task with a success. Use this when you believe the entire task has been fully completed."""
-        return """DONE"""
+        return (Signal("DONE"),)
 
     @agent_action
     def fail(self):
         """End the current task with a failure. Use this when you believe the entire task is impossible to complete."""
-        return """FAIL"""
+        return (Signal("FAIL"),)
@@ -0,0 +1,139 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("ComputerAgent.utils.grounding_cache")
+
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_expression(ref_expr: str) -> str:
+    """归一化指代表达式：忽略大小写、多余空白和结尾标点。"""
+    return _SPACE_PATTERN.sub(" ", ref_expr).strip().rstrip(".。!！").casefold()
+
+
+class GroundingCache:
+    """跨步骤的定位结果缓存。
+
+    以归一化后的指代表达式为键，保存定位模型返回的坐标，以及截图上该点周围小块区域的指纹。
+    之后的查询若在当前截图的同一位置上指纹仍然一致，直接返回缓存坐标，否则回退到定位模型。
+    """
+
+    def __init__(
+        self,
+        grounding_size: Tuple[int, int],
+        max_entries: int = 256,
+        patch_radius: int = 24,
+        grid_size: int = 12,
+        max_difference: float = 0.04,
+    ):
+        """
+        参数:
+            grounding_size (Tuple[int, int]): 定位模型输出坐标的分辨率 (宽, 高)
+            max_entries (int): 最多缓存的表达式数量，超出时淘汰最久未使用的
+            patch_radius (int): 指纹区域的半径（截图像素）
+            grid_size (int): 指纹区域缩放到的边长
+            max_difference (float): 指纹平均灰度差（0~1）不超过该值时视为一致
+        """
+        self.grounding_size = grounding_size
+        self.max_entries = max_entries
+        self.patch_radius = patch_radius
+        self.grid_size = grid_size
+        self.max_difference = max_difference
+        self.entries: "OrderedDict[str, Tuple[List[int], Tuple[int, int], np.ndarray]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 当前帧的灰度图，同一张截图只解码一次
+        self._frame_key = None
+        self._frame = None
+
+    def _gray_frame(self, screenshot: bytes) -> np.ndarray:
+        with self._lock:
+            if self._frame_key is not screenshot:
+                image = Image.open(BytesIO(screenshot)).convert("L")
+                self._frame = np.asarray(image)
+                self._frame_key = screenshot
+            return self._frame
+
+    def _fingerprint(self, frame: np.ndarray, pixel: Tuple[int, int]) -> Optional[np.ndarray]:
+        """取 pixel 周围的区域并缩放为 grid_size x grid_size 的灰度指纹；区域超出截图时返回 None。"""
+        x, y = pixel
+        r = self.patch_radius
+        height, width = frame.shape
+        if x - r < 0 or y - r < 0 or x + r > width or y + r > height:
+            return None
+        patch = Image.fromarray(frame[y - r : y + r, x - r : x + r])
+        patch = patch.resize((self.grid_size, self.grid_size), Image.BOX)
+        return np.asarray(patch, dtype=np.float32) / 255.0
+
+    def lookup(self, ref_expr: str, screenshot: bytes) -> Optional[List[int]]:
+        """
+        查询缓存。
+
+        参数:
+            ref_expr (str): 指代表达式
+            screenshot (bytes): 当前截图
+
+        返回:
+            Optional[List[int]]: 命中时返回缓存的定位坐标，否则返回 None
+        """
+        key = normalize_expression(ref_expr)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        coords, pixel, fingerprint = entry
+        current = self._fingerprint(self._gray_frame(screenshot), pixel)
+        if current is None or float(np.abs(current - fingerprint).mean()) > self.max_difference:
+            self.misses += 1
+            with self._lock:
+                self.entries.pop(key, None)
+            return None
+
+        self.hits += 1
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        logger.info(f"Grounding cache hit for {ref_expr!r}: {coords}")
+        return list(coords)
+
+    def store(self, ref_expr: str, coords: List[int], screenshot: bytes) -> None:
+        """
+        保存定位结果及其所在区域的指纹。
+
+        参数:
+            ref_expr (str): 指代表达式
+            coords (List[int]): 定位模型返回的坐标
+            screenshot (bytes): 定位时的截图
+        """
+        frame = self._gray_frame(screenshot)
+        height, width = frame.shape
+        pixel = (
+            round(coords[0] * width / self.grounding_size[0]),
+            round(coords[1] * height / self.grounding_size[1]),
+        )
+        fingerprint = self._fingerprint(frame, pixel)
+        if fingerprint is None:
+            return
+        key = normalize_expression(ref_expr)
+        with self._lock:
+            self.entries[key] = (list(coords), pixel, fingerprint)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存。"""
+        with self._lock:
+            self.entries.clear()
+            self._frame_key = None
+            self._frame = None
@@ -1,6 +1,70 @@
+import os
 import subprocess
 import sys
-from typing import Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from utils.bash_session import BashSession
+from utils.logging_setup import echo
+from utils.output_capture import DEFAULT_MAX_OUTPUT_BYTES, OutputCapture
+from utils.python_kernel import PythonKernel
+
+
+def _pump(stream, capture: OutputCapture) -> None:
+    """把子进程输出流逐块写入 capture，直到流结束。"""
+    while True:
+        data = os.read(stream.fileno(), 65536)
+        if not data:
+            break
+        capture.write(data)
+
+
+def run_streaming(
+    args: List[str],
+    timeout: Optional[float],
+    captures: Tuple[OutputCapture, OutputCapture],
+    env: Optional[Dict[str, str]] = None,
+) -> Optional[int]:
+    """启动子进程并流式收集 stdout / stderr，不在内存中缓存完整输出。
+
+    参数:
+        args (List[str]): 命令及参数
+        timeout (Optional[float]): 最大执行时间，单位秒
+        captures (Tuple[OutputCapture, OutputCapture]): stdout 和 stderr 的收集器，
+            两者为同一个对象时 stderr 合并到 stdout
+        env (Optional[Dict[str, str]]): 子进程额外的环境变量
+
+    返回:
+        Optional[int]: 进程退出码，超时返回 None（进程已被结束）
+    """
+    stdout_capture, stderr_capture = captures
+    merged = stdout_capture is stderr_capture
+    proc = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if merged else subprocess.PIPE,
+        env={**os.environ, **env} if env else None,
+    )
+    pumps = [threading.Thread(target=_pump, args=(proc.stdout, stdout_capture), daemon=True)]
+    if not merged:
+        pumps.append(
+            threading.Thread(target=_pump, args=(proc.stderr, stderr_capture), daemon=True)
+        )
+    for pump in pumps:
+        pump.start()
+
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        returncode = None
+    for pump in pumps:
+        pump.join(timeout=5)
+    for capture in {id(c): c for c in captures}.values():
+        capture.close()
+    return returncode
 
 
 class LocalController:
@@ -9,43 +73,84 @@ class LocalController:
     警告：执行任意代码是危险的。请仅在受信任环境和可信输入下使用。
     """
 
-    def run_bash_script(self, code: str, timeout: int = 30) -> Dict:
-        """在本地执行 Bash 脚本。
-
+    def __init__(
+        self,
+        python_timeout: int = 60,
+        memory_limit_mb: Optional[int] = None,
+        max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+        output_log_dir: Optional[str] = None,
+        max_parallel_workers: int = 4,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        """
         参数:
-            code (str): 要执行的 Bash 代码
-            timeout (int): 最大执行时间，单位秒，默认 30 秒
-
-        返回:
-            Dict: 包含执行状态、输出、错误信息的字典
+            python_timeout (int): Python 单步执行的默认超时时间，单位秒
+            memory_limit_mb (Optional[int]): 持久化 Python 内核的内存上限（MB），None 表示不限制
+            max_output_bytes (int): 每步输出返回给 agent 的字节上限，超出时只保留开头和结尾
+            output_log_dir (Optional[str]): 超出上限时完整输出日志的目录，默认系统临时目录
+            max_parallel_workers (int): run_batch 同时运行的最大进程数
+            env (Optional[Dict[str, str]]): 代码执行进程额外的环境变量，如会话显示器的 {"DISPLAY": ":99"}
         """
-        try:
-            proc = subprocess.run(
-                ["/bin/bash", "-lc", code],  # 启动 login shell 执行代码
-                capture_output=True,  # 捕获 stdout 和 stderr
-                text=True,  # 输出为文本
-                timeout=timeout,  # 超时限制
+        self.python_timeout = python_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_output_bytes = max_output_bytes
+        self.output_log_dir = output_log_dir
+        self.max_parallel_workers = max_parallel_workers
+        self.env = env
+        # 会话期间使用的持久化 Python 内核和 Bash 会话，未开启会话时为 None
+        self.python_kernel: Optional[PythonKernel] = None
+        self.bash_session: Optional[BashSession] = None
+
+    def _new_capture(self) -> OutputCapture:
+        return OutputCapture(self.max_output_bytes, self.output_log_dir)
+
+    def start_session(self) -> None:
+        """开启一个代码执行会话：启动持久化 Python 内核和 Bash 会话，状态在各步骤之间保留。"""
+        if self.python_kernel is None:
+            self.python_kernel = PythonKernel(
+                timeout=self.python_timeout,
+                memory_limit_mb=self.memory_limit_mb,
+                max_output_bytes=self.max_output_bytes,
+                spill_dir=self.output_log_dir,
+                env=self.env,
             )
-            output = (proc.stdout or "") + (proc.stderr or "")
+        self.python_kernel.start()
+        if self.bash_session is None:
+            self.bash_session = BashSession(
+                max_output_bytes=self.max_output_bytes,
+                spill_dir=self.output_log_dir,
+                env=self.env,
+            )
+        self.bash_session.start()
 
-            # 打印执行输出（调试用）
-            print("BASH OUTPUT =======================================")
-            print(output)
-            print("BASH OUTPUT =======================================")
+    def end_session(self) -> None:
+        """结束代码执行会话，关闭持久化 Python 内核和 Bash 会话。"""
+        if self.python_kernel is not None:
+            self.python_kernel.shutdown()
+            self.python_kernel = None
+        if self.bash_session is not None:
+            self.bash_session.shutdown()
+            self.bash_session = None
 
+    def _run_bash_once(self, code: str, timeout: Optional[float]) -> Dict:
+        """在一个新的 login shell 中执行 Bash 代码（不使用会话）。"""
+        try:
+            capture = self._new_capture()
+            # 启动 login shell 执行代码，stderr 合并到 stdout
+            returncode = run_streaming(
+                ["/bin/bash", "-lc", code], timeout, (capture, capture), self.env
+            )
             return {
-                "status": "ok" if proc.returncode == 0 else "error",
-                "returncode": proc.returncode,
-                "output": output,
-                "error": "",
-            }
-        except subprocess.TimeoutExpired as e:
-            # Bash 执行超时
-            return {
-                "status": "error",
-                "returncode": -1,
-                "output": e.stdout or "",
-                "error": f"TimeoutExpired: {str(e)}",
+                "status": "ok" if returncode == 0 else "error",
+                "returncode": -1 if returncode is None else returncode,
+                "output": capture.getvalue(),
+                "error": (
+                    f"TimeoutExpired: 命令执行超过 {timeout} 秒"
+                    if returncode is None
+                    else ""
+                ),
+                "truncated": capture.truncated,
+                "log_paths": [capture.log_path] if capture.log_path else [],
             }
         except Exception as e:
             # 其他异常
@@ -56,30 +161,24 @@ class LocalController:
                 "error": str(e),
             }
 
-    def run_python_script(self, code: str) -> Dict:
-        """在本地执行 Python 脚本。
-
-        参数:
-            code (str): 要执行的 Python 代码
-
-        返回:
-            Dict: 包含执行状态、输出、错误信息的字典
-        """
+    def _run_python_once(self, code: str, timeout: Optional[float]) -> Dict:
+        """在一个新的解释器进程中执行 Python 代码（不使用会话）。"""
         try:
-            proc = subprocess.run(
-                [sys.executable, "-c", code],  # 使用当前 Python 解释器执行代码
-                capture_output=True,  # 捕获 stdout 和 stderr
-                text=True,  # 输出为文本
+            stdout, stderr = self._new_capture(), self._new_capture()
+            # 使用当前 Python 解释器执行代码
+            return_code = run_streaming(
+                [sys.executable, "-c", code], timeout, (stdout, stderr), self.env
             )
-            # 打印执行输出（调试用）
-            print("PYTHON OUTPUT =======================================")
-            print(proc.stdout or "")
-            print("PYTHON OUTPUT =======================================")
+            error = stderr.getvalue()
+            if return_code is None:
+                error += f"\nTimeoutExpired: 代码执行超过 {timeout} 秒"
             return {
-                "status": "ok" if proc.returncode == 0 else "error",
-                "return_code": proc.returncode,
-                "output": proc.stdout or "",
-                "error": proc.stderr or "",
+                "status": "ok" if return_code == 0 else "error",
+                "return_code": -1 if return_code is None else return_code,
+                "output": stdout.getvalue(),
+                "error": error,
+                "truncated": stdout.truncated or stderr.truncated,
+                "log_paths": [c.log_path for c in (stdout, stderr) if c.log_path],
             }
         except Exception as e:
             # 异常处理
@@ -90,10 +189,104 @@ class LocalController:
                 "error": str(e),
             }
 
+    def run_batch(
+        self, blocks: List[Tuple[str, str]], timeout: Optional[float] = None
+    ) -> List[Dict]:
+        """并发执行多段相互独立的代码，按输入顺序返回结果。
+
+        每段代码在独立的新进程中执行，不共享会话中的变量和工作目录；
+        同时运行的进程数不超过 max_parallel_workers。
+
+        参数:
+            blocks (List[Tuple[str, str]]): (代码类型, 代码) 列表，类型为 python 或 bash
+            timeout (Optional[float]): 每段代码的最大执行时间，默认按类型使用 30 / python_timeout 秒
+
+        返回:
+            List[Dict]: 与 blocks 顺序一致的执行结果
+        """
+
+        def run_block(block: Tuple[str, str]) -> Dict:
+            code_type, code = block
+            if code_type == "bash":
+                return self._run_bash_once(code, 30 if timeout is None else timeout)
+            if code_type == "python":
+                return self._run_python_once(
+                    code, self.python_timeout if timeout is None else timeout
+                )
+            return {"status": "error", "error": f"Unknown code type: {code_type}"}
+
+        if not blocks:
+            return []
+        workers = max(1, min(self.max_parallel_workers, len(blocks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_block, blocks))
+
+        # 打印执行输出（调试用），安静模式下大段输出不打印
+        for index, result in enumerate(results):
+            echo(
+                f"BATCH BLOCK {index + 1} OUTPUT =======================================\n"
+                f"{result.get('output', '')}"
+            )
+        return results
+
+    def run_bash_script(self, code: str, timeout: int = 30) -> Dict:
+        """在本地执行 Bash 脚本。
+
+        会话期间在持久化 Bash 会话中执行（保留工作目录、环境变量和函数），
+        否则启动一个新的 login shell。输出流式收集，超过上限时截断并写入日志文件。
+
+        参数:
+            code (str): 要执行的 Bash 代码
+            timeout (int): 最大执行时间，单位秒，默认 30 秒
+
+        返回:
+            Dict: 包含执行状态、输出、错误信息的字典
+        """
+        if self.bash_session is not None:
+            result = self.bash_session.run(code, timeout=timeout)
+        else:
+            result = self._run_bash_once(code, timeout)
+
+        # 打印执行输出（调试用），安静模式下大段输出不打印
+        echo(
+            f"BASH OUTPUT =======================================\n"
+            f"{result['output']}\n"
+            "BASH OUTPUT ======================================="
+        )
+        return result
+
+    def run_python_script(self, code: str, timeout: Optional[int] = None) -> Dict:
+        """在本地执行 Python 脚本。
+
+        会话期间在持久化内核中执行（保留变量），否则启动一个新的解释器进程。
+        输出流式收集，超过上限时截断并写入日志文件。
+
+        参数:
+            code (str): 要执行的 Python 代码
+            timeout (Optional[int]): 最大执行时间，单位秒，默认使用 python_timeout
+
+        返回:
+            Dict: 包含执行状态、输出、错误信息的字典
+        """
+        timeout = self.python_timeout if timeout is None else timeout
+
+        if self.python_kernel is not None:
+            result = self.python_kernel.execute(code, timeout=timeout)
+        else:
+            result = self._run_python_once(code, timeout)
+
+        # 打印执行输出（调试用），安静模式下大段输出不打印
+        echo(
+            f"PYTHON OUTPUT =======================================\n"
+            f"{result['output']}\n"
+            "PYTHON OUTPUT ======================================="
+        )
+        return result
+
 
 class LocalEnv:
     """简单环境，提供一个与 CodeAgent 兼容的控制器。"""
 
-    def __init__(self):
+    def __init__(self, **controller_kwargs):
         # 创建本地控制器实例
-        self.controller = LocalController()
+        self.controller = LocalController(**controller_kwargs)
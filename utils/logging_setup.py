@@ -0,0 +1,113 @@
+import atexit
+import copy
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+# 安静模式下，超过该长度的控制台输出（完整的模型回复、代码输出等）不再打印
+QUIET_ECHO_LIMIT = 300
+
+_quiet = False
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """只把日志记录放入队列，消息格式化留给后台线程。
+
+    标准 QueueHandler 会在调用线程上格式化消息；这里只提前生成异常堆栈文本，
+    msg 和 args 原样交给后台线程，因此传入的参数在记录后不应再被修改。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    log_dir: str = "logs",
+    level: int = logging.INFO,
+    max_bytes: int = 20 * 1024 * 1024,
+    backup_count: int = 5,
+    quiet: bool = False,
+    console: bool = False,
+) -> QueueListener:
+    """
+    为 "ComputerAgent" logger 配置异步日志：调用线程只把记录放入队列，
+    后台线程负责格式化并写入按大小轮转的日志文件。
+
+    参数:
+        log_dir (str): 日志目录，日志写入 <log_dir>/agent.log
+        level (int): 日志级别，低于该级别的调用不会构造日志记录
+        max_bytes (int): 单个日志文件的大小上限，超出后轮转
+        backup_count (int): 保留的历史日志文件数
+        quiet (bool): 安静模式，控制台不再打印大段输出，见 echo
+        console (bool): 是否同时把日志输出到控制台
+
+    返回:
+        QueueListener: 后台日志线程，进程退出时自动调用 stop_logging 停止
+    """
+    global _listener, _queue_handler
+    set_quiet(quiet)
+
+    root_logger = logging.getLogger("ComputerAgent")
+    root_logger.setLevel(level)
+    # 防止重复配置
+    if _listener is not None:
+        return _listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, "agent.log"),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(formatter)
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(log_queue)
+    root_logger.addHandler(_queue_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """写完队列中剩余的日志并停止后台线程。"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger("ComputerAgent").removeHandler(_queue_handler)
+    _queue_handler = None
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def set_quiet(quiet: bool) -> None:
+    """开启或关闭安静模式。"""
+    global _quiet
+    _quiet = quiet
+
+
+def echo(text: str) -> None:
+    """打印到控制台；安静模式下超过 QUIET_ECHO_LIMIT 的大段内容直接丢弃。"""
+    if _quiet and len(text) > QUIET_ECHO_LIMIT:
+        return
+    print(text)
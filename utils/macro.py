@@ -0,0 +1,255 @@
+"""
+宏模式：generator 一次输出多个 agent action，每个动作可以带一个后置条件，
+执行端连续执行这些动作，只有廉价的屏幕变化检查不通过时才停下来重新观察（交给下一轮 LLM）。
+
+代码块中的写法（后置条件写在同一行的注释里，省略时为 change）:
+    agent.click("用户名输入框", 1, "left")  # expect: change
+    agent.type(text="alice")                 # expect: change
+    agent.hotkey(["enter"])                  # expect: any
+
+后置条件:
+    change  动作后屏幕应发生变化（在 change_timeout 内轮询截图）
+    same    动作后屏幕应保持不变（如保存快捷键不应弹出对话框）
+    any     不检查
+"""
+import io
+import logging
+import re
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.actions import ActionProgram, from_json, to_json
+from utils.common_utils import AGENT_CALL_START_PATTERN, _find_call_end
+
+logger = logging.getLogger("ComputerAgent.utils.macro")
+
+POSTCONDITIONS = ("change", "same", "any")
+DEFAULT_POSTCONDITION = "change"
+
+# 只能单独出现在一轮中的动作：信号类动作，以及在生成动作时就会执行的 code agent
+STANDALONE_ACTIONS = ("done", "fail", "call_code_agent")
+
+POSTCONDITION_PATTERN = re.compile(r"[ \t]*#[ \t]*expect:[ \t]*(\w+)")
+ACTION_NAME_PATTERN = re.compile(r"agent\.(\w+)\(")
+
+# 屏幕变化检查：长宽各缩小 THUMBNAIL_REDUCE 倍的灰度图上，统计差异超过容差的像素数。
+# 解码 PNG 的耗时远大于比较本身，缩小倍数不宜过大，否则输入几个字符这样的小变化会被平均掉；
+# MIN_CHANGED_PIXELS 要大于闪烁的光标（约 1x10 像素）
+THUMBNAIL_REDUCE = 2
+PIXEL_TOLERANCE = 24
+MIN_CHANGED_PIXELS = 24
+
+
+class MacroStep(NamedTuple):
+    """宏中的一个动作：原始 agent 调用、grounding 后的动作序列和后置条件。"""
+
+    call: str
+    program: ActionProgram
+    postcondition: str = DEFAULT_POSTCONDITION
+
+    def to_json(self) -> Dict:
+        return {
+            "call": self.call,
+            "action_program": to_json(self.program),
+            "postcondition": self.postcondition,
+        }
+
+    @classmethod
+    def from_json(cls, item: Dict) -> "MacroStep":
+        return cls(item["call"], from_json(item["action_program"]), item["postcondition"])
+
+
+def extract_macro_calls(code: str) -> List[Tuple[str, str]]:
+    """
+    从代码块中提取 agent.xxx(...) 调用及其同一行注释中的后置条件。
+
+    返回:
+        List[Tuple[str, str]]: [(调用, 后置条件), ...]，未写或无法识别的后置条件按 change 处理
+    """
+    calls = []
+    position = 0
+    while True:
+        match = AGENT_CALL_START_PATTERN.search(code, position)
+        if not match:
+            break
+        end = _find_call_end(code, match.end() - 1)
+        if end == -1:
+            break
+        postcondition = DEFAULT_POSTCONDITION
+        comment = POSTCONDITION_PATTERN.match(code, end)
+        if comment and comment.group(1).lower() in POSTCONDITIONS:
+            postcondition = comment.group(1).lower()
+        calls.append((code[match.start():end], postcondition))
+        position = end
+    return calls
+
+
+def action_name(call: str) -> str:
+    """agent.click(...) -> "click"。"""
+    match = ACTION_NAME_PATTERN.match(call)
+    return match.group(1) if match else ""
+
+
+def macro_error(calls: List[str], max_actions: int) -> Optional[str]:
+    """校验一轮中的动作列表，合法时返回 None，否则返回错误说明。"""
+    if not calls:
+        return "代码块中必须至少包含一个 agent action。"
+    if len(calls) > max_actions:
+        return f"每轮最多只能包含 {max_actions} 个 agent action。"
+    if len(calls) > 1:
+        standalone = [name for name in map(action_name, calls) if name in STANDALONE_ACTIONS]
+        if standalone:
+            return f"agent.{standalone[0]}() 必须单独作为一轮的唯一动作。"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# 屏幕变化检查
+# ---------------------------------------------------------------------------
+
+
+def screen_thumbnail(screenshot: bytes):
+    """PNG 截图 -> 灰度缩略图（PIL Image）。"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(screenshot)) as image:
+        return image.convert("L").reduce(THUMBNAIL_REDUCE)
+
+
+def changed_pixels(before, after) -> int:
+    """两张缩略图中差异超过 PIXEL_TOLERANCE 的像素数。"""
+    from PIL import ImageChops
+
+    histogram = ImageChops.difference(before, after).histogram()
+    return sum(histogram[PIXEL_TOLERANCE + 1:])
+
+
+def screen_changed(before, after) -> bool:
+    return changed_pixels(before, after) >= MIN_CHANGED_PIXELS
+
+
+# ---------------------------------------------------------------------------
+# 执行
+# ---------------------------------------------------------------------------
+
+
+def run_macro(
+    steps: List[MacroStep],
+    execute: Callable[[ActionProgram], Dict],
+    screenshot: Callable[[], bytes],
+    first_screenshot: Optional[bytes] = None,
+    change_timeout: float = 2.0,
+    poll_seconds: float = 0.2,
+    settle_seconds: float = 0.5,
+) -> Dict:
+    """
+    连续执行宏中的动作，每个动作执行后检查其后置条件，不通过时停止（剩余动作留给下一轮重新规划）。
+    最后一个动作不检查，下一轮的截图会重新观察。
+
+    参数:
+        steps (List[MacroStep]): 宏动作
+        execute (Callable): 执行一个动作序列并返回 ActionExecutor 格式的结果，如 display.execute_program
+        screenshot (Callable): 截图函数，返回 PNG 字节
+        first_screenshot (Optional[bytes]): 生成宏时的截图，作为第一个动作的对照
+        change_timeout (float): 等待 change 条件成立的最长时间，单位秒
+        poll_seconds (float): 等待 change 时的截图间隔
+        settle_seconds (float): 检查 same 条件前的等待时间
+
+    返回:
+        Dict: {"status": "ok" / "error", "error", "seconds", "executed", "total",
+               "stopped_at": 未通过后置条件或执行失败的动作序号（全部执行完为 None）,
+               "stop_reason", "check_seconds": 屏幕检查耗时, "outcomes": 每个动作的执行结果}
+    """
+    start = time.perf_counter()
+    report = {
+        "status": "ok",
+        "error": "",
+        "executed": 0,
+        "total": len(steps),
+        "stopped_at": None,
+        "stop_reason": "",
+        "check_seconds": 0.0,
+        "outcomes": [],
+    }
+    before = screen_thumbnail(first_screenshot) if first_screenshot else None
+
+    for index, step in enumerate(steps):
+        is_last = index == len(steps) - 1
+        if before is None and step.postcondition != "any" and not is_last:
+            check_start = time.perf_counter()
+            before = screen_thumbnail(screenshot())
+            report["check_seconds"] += time.perf_counter() - check_start
+
+        outcome = execute(step.program)
+        report["outcomes"].append(outcome)
+        report["executed"] += 1
+        if outcome["status"] != "ok":
+            report.update(status="error", error=outcome["error"], stopped_at=index, stop_reason="error")
+            break
+        if is_last:
+            break
+        if step.postcondition == "any":
+            before = None
+            continue
+
+        check_start = time.perf_counter()
+        passed, after = _check_postcondition(
+            step.postcondition, before, screenshot, change_timeout, poll_seconds, settle_seconds
+        )
+        report["check_seconds"] += time.perf_counter() - check_start
+        if not passed:
+            report.update(
+                stopped_at=index,
+                stop_reason=(
+                    "screen_unchanged" if step.postcondition == "change" else "screen_changed"
+                ),
+            )
+            logger.info(
+                "Macro stopped after action %d/%d (%s): %s",
+                index + 1,
+                len(steps),
+                report["stop_reason"],
+                step.call,
+            )
+            break
+        before = after
+
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _check_postcondition(postcondition, before, screenshot, change_timeout, poll_seconds, settle_seconds):
+    """返回 (是否通过, 动作后的缩略图)。"""
+    if postcondition == "same":
+        time.sleep(settle_seconds)
+        after = screen_thumbnail(screenshot())
+        return not screen_changed(before, after), after
+
+    deadline = time.perf_counter() + change_timeout
+    while True:
+        after = screen_thumbnail(screenshot())
+        if screen_changed(before, after):
+            return True, after
+        if time.perf_counter() >= deadline:
+            return False, after
+        time.sleep(poll_seconds)
+
+
+def describe_report(steps: List[Dict], report: Dict) -> str:
+    """把执行结果写成给 generator 的说明，steps 为 executor_info["macro"]。"""
+    lines = [f"上一轮的 {report['total']} 个动作中已执行 {report['executed']} 个。"]
+    stopped_at = report.get("stopped_at")
+    if stopped_at is not None:
+        call = steps[stopped_at]["call"] if stopped_at < len(steps) else ""
+        if report["stop_reason"] == "error":
+            reason = f"执行出错：{report['error']}"
+        elif report["stop_reason"] == "screen_unchanged":
+            reason = "执行后屏幕没有变化（预期 change）"
+        else:
+            reason = "执行后屏幕发生了变化（预期 same）"
+        lines.append(f"第 {stopped_at + 1} 个动作 {call} {reason}，后续动作未执行。")
+        skipped = [step["call"] for step in steps[stopped_at + 1:]]
+        if skipped:
+            lines.append("未执行的动作: " + "; ".join(skipped))
+        lines.append("请根据当前截图重新判断下一步。")
+    return "\n".join(lines)
@@ -0,0 +1,406 @@
+import logging
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pytesseract
+from PIL import Image
+from pytesseract import Output
+
+logger = logging.getLogger("ComputerAgent.utils.ocr")
+
+# 去掉词首尾的非文字字符（数字、符号等），保留常见标点；\w 覆盖中文等非拉丁文字
+_CLEAN_CHAR = r"(?:[^\w\s.,!?;:\-\+]|[\d_])"
+_CLEAN_PATTERN = re.compile(rf"^{_CLEAN_CHAR}+|{_CLEAN_CHAR}+$")
+# 其中的 ASCII 字符，纯 ASCII 的词直接用 numpy 向量化去除，不必逐词匹配正则
+_CLEAN_ASCII = "".join(char for char in map(chr, range(1, 128)) if re.fullmatch(_CLEAN_CHAR, char))
+
+# 重叠区域内两个框的 IoU 超过该值且文本相同时视为同一个词
+DEDUP_IOU_THRESHOLD = 0.5
+
+# 默认最多切成的分块数（2x2）：分块越多，重叠区域重复识别的像素越多
+DEFAULT_MAX_TILES = 4
+
+
+def _clean_words(words: Sequence[str]) -> np.ndarray:
+    """去掉每个词首尾的非文字字符，结果与逐词执行 _CLEAN_PATTERN.sub 相同。
+
+    先对所有词按 _CLEAN_ASCII 一次性去除首尾字符；只有包含非 ASCII 字符的词
+    （中文、特殊符号等）可能还要继续去除，这部分再逐词匹配正则。
+    """
+    words = np.asarray(words, dtype=str)
+    cleaned = np.char.strip(words, _CLEAN_ASCII)
+    # 按 UCS-4 码点查看字符数组，任一码点大于 127 即包含非 ASCII 字符
+    codepoints = words.view(np.uint32).reshape(len(words), words.itemsize // 4)
+    non_ascii = (codepoints > 127).any(axis=1)
+    for index in np.flatnonzero(non_ascii):
+        cleaned[index] = _CLEAN_PATTERN.sub("", str(cleaned[index]))
+    return cleaned
+
+
+class OCRResult:
+    """列式存储的 OCR 结果：词文本为列表，位置和分组信息为并行的 NumPy 数组。
+
+    只保留清洗后非空的词，下标即词 id。给 LLM 使用的词表文本在第一次访问 table 时才生成。
+    """
+
+    __slots__ = ("texts", "left", "top", "width", "height", "group_num", "word_num", "_table")
+
+    def __init__(
+        self,
+        texts: List[str],
+        left: np.ndarray,
+        top: np.ndarray,
+        width: np.ndarray,
+        height: np.ndarray,
+        group_num: np.ndarray,
+        word_num: np.ndarray,
+    ):
+        self.texts = texts
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.group_num = group_num
+        self.word_num = word_num
+        self._table = None
+
+    @classmethod
+    def from_tesseract(cls, image_data: Dict) -> "OCRResult":
+        """由 pytesseract.image_to_data(output_type=DICT) 的结果构建。"""
+        cleaned = _clean_words(image_data["text"])
+        keep = np.char.str_len(cleaned) > 0
+        texts = cleaned[keep].tolist()
+
+        def column(name: str) -> np.ndarray:
+            return np.asarray(image_data[name], dtype=np.int32)[keep]
+
+        group_num = column("block_num")
+        return cls(
+            texts=texts,
+            left=column("left"),
+            top=column("top"),
+            width=column("width"),
+            height=column("height"),
+            group_num=group_num,
+            word_num=_rank_within_groups(group_num),
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: int) -> Dict:
+        """以字典形式返回单个词，字段与旧的 ocr_elements 一致。"""
+        if index < 0:
+            index += len(self.texts)
+        return {
+            "id": index,
+            "text": self.texts[index],
+            "group_num": int(self.group_num[index]),
+            "word_num": int(self.word_num[index]),
+            "left": int(self.left[index]),
+            "top": int(self.top[index]),
+            "width": int(self.width[index]),
+            "height": int(self.height[index]),
+        }
+
+    @property
+    def table(self) -> str:
+        """给 LLM 使用的词表文本（延迟生成并缓存）。"""
+        if self._table is None:
+            rows = "".join(f"{i}\t{text}\n" for i, text in enumerate(self.texts))
+            self._table = "Text Table:\nWord id\tText\n" + rows
+        return self._table
+
+    def word_coords(self, index: int, alignment: str = "") -> List[int]:
+        """
+        计算词的屏幕坐标。
+
+        参数:
+            index (int): 词 id
+            alignment (str): "start" 取词左边缘，"end" 取词右边缘，否则取词中心
+
+        返回:
+            List[int]: [x, y]
+        """
+        left = int(self.left[index])
+        width = int(self.width[index])
+        y = int(self.top[index]) + int(self.height[index]) // 2
+        if alignment == "start":
+            return [left, y]
+        if alignment == "end":
+            return [left + width, y]
+        return [left + width // 2, y]
+
+
+def _rank_within_groups(groups: np.ndarray) -> np.ndarray:
+    """计算每个元素在所属分组中的序号（从 1 开始，保持原顺序）。"""
+    if groups.size == 0:
+        return groups.copy()
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    sizes = np.diff(np.r_[starts, groups.size])
+    ranks = np.arange(groups.size) - np.repeat(starts, sizes) + 1
+    word_num = np.empty_like(groups)
+    word_num[order] = ranks
+    return word_num
+
+
+def _grid_shape(width: int, height: int, tiles: int) -> Tuple[int, int]:
+    """把 tiles 个分块排成 (列数, 行数)，较多的一边分给更长的边。"""
+    tiles = max(tiles, 1)
+    short = max(math.isqrt(tiles), 1)
+    long = tiles // short
+    return (long, short) if width >= height else (short, long)
+
+
+def _spans(length: int, count: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    把长度为 length 的一维区间等分成 count 段，相邻段重叠约 overlap 像素。
+
+    返回:
+        List[Tuple[int, int, int, int]]: (start, end, core_start, core_end)，
+            core 为该段独占的区域（相邻段以重叠区域中线为界），所有 core 恰好覆盖整个区间
+    """
+    # 每段至少是重叠宽度的 2 倍，否则不再细分（如很小的 ROI）
+    count = max(1, min(count, length // (2 * overlap) if overlap > 0 else count))
+    if count == 1:
+        return [(0, length, 0, length)]
+    size = min(length, math.ceil((length + (count - 1) * overlap) / count))
+    starts = [round(i * (length - size) / (count - 1)) for i in range(count)]
+    ends = [start + size for start in starts]
+    core_bounds = [0] + [(ends[i] + starts[i + 1]) // 2 for i in range(count - 1)] + [length]
+    return [
+        (starts[i], ends[i], core_bounds[i], core_bounds[i + 1]) for i in range(count)
+    ]
+
+
+def _split_tiles(
+    width: int, height: int, grid: Tuple[int, int], overlap: int
+) -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int, int]]]:
+    """
+    把 width x height 的区域切成 grid=(列数, 行数) 个相互重叠的分块（行优先）。
+
+    返回:
+        List: [(分块 (left, top, right, bottom), 独占区域 (left, top, right, bottom)), ...]
+    """
+    return [
+        ((left, top, right, bottom), (core_left, core_top, core_right, core_bottom))
+        for top, bottom, core_top, core_bottom in _spans(height, grid[1], overlap)
+        for left, right, core_left, core_right in _spans(width, grid[0], overlap)
+    ]
+
+
+def _ocr_tile(
+    image: Image.Image,
+    box: Tuple[int, int, int, int],
+    core: Tuple[int, int, int, int],
+    lang: str,
+    config: str,
+    scale: float,
+) -> Dict[str, np.ndarray]:
+    """
+    对一个分块做 OCR，坐标换算回原图。
+
+    每个词只归属于中心点落在其独占区域（core）内的分块，其他分块识别到的同一个词直接丢弃；
+    只有在归属分块中仍贴着分块内部边缘（比重叠区域还宽、确实被截断）的词才丢弃。
+    """
+    left, top, right, bottom = box
+    tile = image.crop(box)
+    if scale != 1.0:
+        tile = tile.resize(
+            (round(tile.width * scale), round(tile.height * scale)), Image.LANCZOS
+        )
+    data = pytesseract.image_to_data(tile, lang=lang, config=config, output_type=Output.DICT)
+
+    columns = {
+        name: np.round(np.asarray(data[name], dtype=np.float64) / scale).astype(np.int32)
+        for name in ("left", "top", "width", "height")
+    }
+    columns["left"] += left
+    columns["top"] += top
+    columns["block_num"] = np.asarray(data["block_num"], dtype=np.int32)
+
+    x0, y0 = columns["left"], columns["top"]
+    x1, y1 = x0 + columns["width"], y0 + columns["height"]
+    center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    core_left, core_top, core_right, core_bottom = core
+    owned = (
+        (center_x >= core_left) & (center_x < core_right)
+        & (center_y >= core_top) & (center_y < core_bottom)
+    )
+
+    full_width, full_height = image.size
+    cut = np.zeros(len(x0), dtype=bool)
+    if left > 0:
+        cut |= x0 <= left
+    if top > 0:
+        cut |= y0 <= top
+    if right < full_width:
+        cut |= x1 >= right
+    if bottom < full_height:
+        cut |= y1 >= bottom
+
+    keep = owned & ~cut
+    columns = {name: column[keep] for name, column in columns.items()}
+    columns["text"] = [word for word, kept in zip(data["text"], keep) if kept]
+    return columns
+
+
+def _dedupe_mask(columns: Dict[str, np.ndarray], texts: Sequence[str]) -> np.ndarray:
+    """标记重叠区域内被多个分块重复识别的非空词，保留先出现的那个。"""
+    n = len(texts)
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+
+    x0, y0 = columns["left"], columns["top"]
+    x1, y1 = x0 + columns["width"], y0 + columns["height"]
+    areas = np.maximum(columns["width"], 0) * np.maximum(columns["height"], 0)
+    order = np.argsort(x0, kind="stable")
+    sorted_x0 = x0[order]
+    max_width = int(columns["width"].max())
+
+    for i in range(n):
+        if not keep[i]:
+            continue
+        # 只和水平方向可能相交的框比较
+        lo, hi = np.searchsorted(sorted_x0, [x0[i] - max_width, x1[i]])
+        others = order[lo:hi]
+        others = others[(others > i) & keep[others]]
+        if others.size == 0:
+            continue
+        inter_w = np.minimum(x1[i], x1[others]) - np.maximum(x0[i], x0[others])
+        inter_h = np.minimum(y1[i], y1[others]) - np.maximum(y0[i], y0[others])
+        inter = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+        union = areas[i] + areas[others] - inter
+        iou = np.divide(inter, union, out=np.zeros(len(others)), where=union > 0)
+        for j in others[iou >= DEDUP_IOU_THRESHOLD]:
+            if texts[i] and texts[j] == texts[i]:
+                keep[j] = False
+    return keep
+
+
+class OCREngine:
+    """分块并行的 OCR 引擎。
+
+    把截图切成相互重叠的分块，在线程池中并行调用 tesseract，再合并各分块的词框并去重。
+    pytesseract 每次调用都会启动独立的 tesseract 进程，线程池即可用满多核。
+    """
+
+    def __init__(
+        self,
+        lang: str = "eng",
+        tile_size: Optional[Tuple[int, int]] = None,
+        overlap: int = 200,
+        max_tiles: int = DEFAULT_MAX_TILES,
+        max_workers: Optional[int] = None,
+        grayscale: bool = False,
+        scale: float = 1.0,
+        config: str = "",
+    ):
+        """
+        参数:
+            lang (str): tesseract 语言包，如 "eng"、"chi_sim+eng"
+            tile_size (Optional[Tuple[int, int]]): 分块的近似宽高（像素），默认按截图大小和并行数推算
+                （并行数 >= 4 时 1080p 截图切成 2x2）
+            overlap (int): 相邻分块的重叠宽度，应不小于界面中常见单词的宽度，不超过它的词不会被截断
+            max_tiles (int): 未指定 tile_size 时最多切成的分块数
+            max_workers (Optional[int]): 并行分块数，默认取 CPU 核数
+            grayscale (bool): OCR 前是否转为灰度图，默认关闭，保持原图作为 tesseract 的输入
+            scale (float): OCR 前的放大倍数，小字号界面可以设为 2
+            config (str): 额外传给 tesseract 的参数
+        """
+        self.lang = lang
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.grayscale = grayscale
+        self.scale = scale
+        self.config = config
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="ocr"
+            )
+        return self._executor
+
+    def _grid(self, width: int, height: int) -> Tuple[int, int]:
+        """分块的 (列数, 行数)：指定 tile_size 时按其推算，否则按并行数（不超过 max_tiles）排列。"""
+        if self.tile_size is not None:
+            step_x = max(self.tile_size[0] - self.overlap, 1)
+            step_y = max(self.tile_size[1] - self.overlap, 1)
+            return (
+                max(1, math.ceil((width - self.overlap) / step_x)),
+                max(1, math.ceil((height - self.overlap) / step_y)),
+            )
+        return _grid_shape(width, height, min(self.max_workers, self.max_tiles))
+
+    def recognize(
+        self, image_bytes: bytes, roi: Optional[Tuple[int, int, int, int]] = None
+    ) -> OCRResult:
+        """
+        对截图做 OCR，返回词级别的列式结果，坐标均相对于整张截图。
+
+        参数:
+            image_bytes (bytes): PNG 等格式的截图字节
+            roi (Optional[Tuple[int, int, int, int]]): 只识别该区域 (left, top, right, bottom)
+
+        返回:
+            OCRResult: OCR 结果
+        """
+        image = Image.open(BytesIO(image_bytes))
+        if self.grayscale:
+            image = image.convert("L")
+        else:
+            image.load()
+
+        left, top = 0, 0
+        if roi is not None:
+            left, top = max(roi[0], 0), max(roi[1], 0)
+            image = image.crop((left, top, min(roi[2], image.width), min(roi[3], image.height)))
+
+        tiles = _split_tiles(image.width, image.height, self._grid(image.width, image.height), self.overlap)
+        args = (self.lang, self.config, self.scale)
+        if len(tiles) == 1 or self.max_workers == 1:
+            parts = [_ocr_tile(image, box, core, *args) for box, core in tiles]
+        else:
+            executor = self._get_executor()
+            parts = list(executor.map(lambda tile: _ocr_tile(image, *tile, *args), tiles))
+        logger.debug("OCR finished on %d tile(s) of %dx%d", len(tiles), image.width, image.height)
+
+        # 各分块的段落编号互不相干，加上偏移避免合并后混在一起
+        block_offset = 0
+        for part in parts:
+            if part["block_num"].size:
+                part["block_num"] += block_offset
+                block_offset = int(part["block_num"].max()) + 1
+
+        merged = {
+            name: np.concatenate([part[name] for part in parts])
+            for name in ("left", "top", "width", "height", "block_num")
+        }
+        merged["left"] += left
+        merged["top"] += top
+        texts = [word for part in parts for word in part["text"]]
+        if len(parts) > 1:
+            keep = _dedupe_mask(merged, texts)
+            merged = {name: column[keep] for name, column in merged.items()}
+            texts = [word for word, kept in zip(texts, keep) if kept]
+        merged["text"] = texts
+        return OCRResult.from_tesseract(merged)
+
+    def close(self) -> None:
+        """关闭线程池。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
@@ -0,0 +1,100 @@
+import difflib
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 归一化时去掉的首尾标点
+_PUNCT_PATTERN = re.compile(r"^[\W_]+|[\W_]+$")
+
+# 模糊匹配的最低相似度，以及最佳候选需要领先第二名的幅度
+FUZZY_MIN_SCORE = 0.85
+FUZZY_MIN_MARGIN = 0.1
+
+
+def normalize_word(word: str) -> str:
+    """OCR 词归一化：去掉首尾标点并忽略大小写。"""
+    return _PUNCT_PATTERN.sub("", word).casefold()
+
+
+class OCRIndex:
+    """OCR 词表上的短语索引，每帧构建一次。
+
+    先用 n-gram 索引做精确匹配，再用相似度做模糊匹配；
+    只有唯一确定的匹配才会返回，存在歧义时返回 None，交给 LLM 判断。
+    """
+
+    def __init__(self, words: Sequence[str]):
+        """
+        参数:
+            words (Sequence[str]): 按 OCR 词 id 顺序排列的词文本
+        """
+        self.words = [normalize_word(word) for word in words]
+        # 一元和二元索引：词（或相邻两个词）-> 起始位置列表
+        self.unigrams: Dict[str, List[int]] = defaultdict(list)
+        self.bigrams: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for i, word in enumerate(self.words):
+            self.unigrams[word].append(i)
+            if i + 1 < len(self.words):
+                self.bigrams[(word, self.words[i + 1])].append(i)
+
+    def find_exact(self, tokens: List[str]) -> List[int]:
+        """返回与 tokens 完全一致的所有起始位置。"""
+        n = len(tokens)
+        if n == 1:
+            return list(self.unigrams.get(tokens[0], []))
+        candidates = self.bigrams.get((tokens[0], tokens[1]), [])
+        return [i for i in candidates if self.words[i : i + n] == tokens]
+
+    def find_fuzzy(self, tokens: List[str]) -> List[Tuple[float, int]]:
+        """按相似度对所有长度为 len(tokens) 的窗口打分，返回 (分数, 起始位置)，分数从高到低。"""
+        n = len(tokens)
+        target = " ".join(tokens)
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        # seq2 的预处理结果会被缓存，固定目标短语只需处理一次
+        matcher.set_seq2(target)
+
+        scored = []
+        for i in range(len(self.words) - n + 1):
+            matcher.set_seq1(" ".join(self.words[i : i + n]))
+            if matcher.real_quick_ratio() < FUZZY_MIN_SCORE:
+                continue
+            if matcher.quick_ratio() < FUZZY_MIN_SCORE:
+                continue
+            score = matcher.ratio()
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((score, i))
+        scored.sort(reverse=True)
+        return scored
+
+    def resolve(self, phrase: str, alignment: str = "") -> Optional[int]:
+        """
+        在词表中定位短语，返回对应的词 id。
+
+        参数:
+            phrase (str): 要定位的短语
+            alignment (str): "start" 返回短语第一个词，"end" 返回最后一个词，否则返回第一个词
+
+        返回:
+            Optional[int]: 唯一匹配时返回词 id，无匹配或存在歧义时返回 None
+        """
+        tokens = [normalize_word(token) for token in phrase.split()]
+        tokens = [token for token in tokens if token]
+        if not tokens or len(tokens) > len(self.words):
+            return None
+
+        start = None
+        exact = self.find_exact(tokens)
+        if len(exact) == 1:
+            start = exact[0]
+        elif not exact:
+            fuzzy = self.find_fuzzy(tokens)
+            if len(fuzzy) == 1 or (
+                len(fuzzy) > 1 and fuzzy[0][0] - fuzzy[1][0] >= FUZZY_MIN_MARGIN
+            ):
+                start = fuzzy[0][1]
+
+        if start is None:
+            return None
+        if alignment == "end":
+            return start + len(tokens) - 1
+        return start
@@ -0,0 +1,113 @@
+import os
+import tempfile
+from typing import Optional, Union
+
+# 单次执行返回给 LLM 的输出上限（字节），超出部分只保留开头和结尾
+DEFAULT_MAX_OUTPUT_BYTES = 8192
+# 完整输出日志文件的上限（字节），防止失控的输出占满磁盘
+DEFAULT_SPILL_LIMIT_BYTES = 64 * 1024 * 1024
+
+
+class OutputCapture:
+    """流式收集命令输出，内存中只保留开头和结尾两段。
+
+    输出总量不超过 max_bytes 时完整保留；超过后中间部分被丢弃，
+    完整输出写入临时日志文件，getvalue() 返回带截断标记的文本。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+        spill_dir: Optional[str] = None,
+        spill_limit_bytes: int = DEFAULT_SPILL_LIMIT_BYTES,
+    ):
+        """
+        参数:
+            max_bytes (int): 内存中保留的字节上限，开头和结尾各占一半
+            spill_dir (Optional[str]): 完整输出日志的目录，默认使用系统临时目录
+            spill_limit_bytes (int): 完整输出日志文件的大小上限
+        """
+        self.head_bytes = max_bytes // 2
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.spill_dir = spill_dir
+        self.spill_limit_bytes = spill_limit_bytes
+
+        self.total_bytes = 0
+        self.truncated = False
+        self.log_path: Optional[str] = None
+        # 日志文件创建失败（如 spill_dir 不存在）时为 True，截断的中间部分无处可查
+        self.spill_failed = False
+
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._spill_file = None
+        self._spilled_bytes = 0
+
+    def write(self, data: Union[bytes, str]) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8", errors="replace")
+        if not data:
+            return
+        self.total_bytes += len(data)
+
+        if self._spill_file is not None:
+            self._spill(data)
+
+        if len(self._head) < self.head_bytes:
+            room = self.head_bytes - len(self._head)
+            self._head.extend(data[:room])
+            data = data[room:]
+            if not data:
+                return
+
+        self._tail.extend(data)
+        if len(self._tail) > self.tail_bytes:
+            if not self.truncated:
+                # 第一次溢出：此时 head + tail 仍是完整输出，先整体写入日志文件
+                self.truncated = True
+                self._open_spill_file()
+                self._spill(bytes(self._head) + bytes(self._tail))
+            del self._tail[: len(self._tail) - self.tail_bytes]
+
+    def _open_spill_file(self) -> None:
+        try:
+            fd, self.log_path = tempfile.mkstemp(
+                prefix="code_agent_output_", suffix=".log", dir=self.spill_dir
+            )
+            self._spill_file = os.fdopen(fd, "wb")
+        except OSError:
+            self._spill_file = None
+            self.log_path = None
+            self.spill_failed = True
+
+    def _spill(self, data: bytes) -> None:
+        if self._spill_file is None:
+            return
+        room = self.spill_limit_bytes - self._spilled_bytes
+        if room <= 0:
+            return
+        self._spill_file.write(data[:room])
+        self._spilled_bytes += min(room, len(data))
+
+    def close(self) -> None:
+        """关闭完整输出日志文件。"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def getvalue(self) -> str:
+        """返回保留的输出文本，截断时在开头和结尾之间插入截断标记。"""
+        head = bytes(self._head).decode("utf-8", errors="replace")
+        tail = bytes(self._tail).decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + tail
+
+        omitted = self.total_bytes - len(self._head) - len(self._tail)
+        marker = f"\n...[输出过长，已省略中间 {omitted} 字节，共 {self.total_bytes} 字节"
+        if self.log_path:
+            marker += f"；完整输出见 {self.log_path}"
+        elif self.spill_failed:
+            marker += "；无法创建完整输出日志文件"
+        marker += "]...\n"
+        return head + marker + tail
+
@@ -0,0 +1,365 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+import uuid
+from typing import Dict, Iterable, Optional
+
+from utils.output_capture import DEFAULT_MAX_OUTPUT_BYTES, OutputCapture
+
+logger = logging.getLogger("ComputerAgent.utils.python_kernel")
+
+# 内核启动时预先导入的模块，第一次 import 时无需再等待加载
+DEFAULT_PRELOAD_MODULES = ("pandas", "openpyxl")
+
+
+def _limit_memory(memory_limit_mb: Optional[int]) -> None:
+    """在子进程中限制地址空间大小（仅 POSIX 平台生效）。"""
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Windows 没有 resource 模块，跳过内存限制
+        return
+    limit = int(memory_limit_mb) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class _FdCapture:
+    """把文件描述符（1 / 2）重定向到管道，后台线程把读到的输出写入当前步骤的 OutputCapture。
+
+    print、os.system、未捕获输出的 subprocess 和 C 扩展都写到同一个 fd，因此都能被收集，且保持先后顺序。
+    不在步骤中时（如步骤中启动的后台进程稍后的输出）写回原来的 fd。
+    步骤结束时向 fd 写入一个哨兵，读到哨兵即说明步骤期间写入的输出已全部收集。
+    """
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self._original_fd = os.dup(fd)
+        read_fd, write_fd = os.pipe()
+        os.dup2(write_fd, fd)
+        os.close(write_fd)
+        self._read_fd = read_fd
+        self._lock = threading.Lock()
+        self._capture: Optional[OutputCapture] = None
+        self._sentinel: Optional[bytes] = None
+        self._pending = b""
+        self._drained = threading.Event()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def begin(self, capture: OutputCapture) -> None:
+        with self._lock:
+            self._capture = capture
+
+    def end(self, timeout: float = 5.0) -> None:
+        """等待步骤期间写入的输出全部读出，之后的输出不再写入 capture。"""
+        sentinel = f"__KERNEL_STEP_END_{uuid.uuid4().hex}__".encode()
+        with self._lock:
+            self._sentinel = sentinel
+            self._drained.clear()
+        os.write(self.fd, sentinel)
+        self._drained.wait(timeout)
+        with self._lock:
+            self._capture = None
+            self._sentinel = None
+
+    def _emit(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._capture is not None:
+            self._capture.write(data)
+        else:
+            os.write(self._original_fd, data)
+
+    def _pump(self) -> None:
+        while True:
+            data = os.read(self._read_fd, 65536)
+            if not data:
+                break
+            with self._lock:
+                self._pending += data
+                sentinel = self._sentinel
+                if sentinel is None:
+                    self._emit(self._pending)
+                    self._pending = b""
+                    continue
+                before, found, after = self._pending.partition(sentinel)
+                if found:
+                    self._emit(before)
+                    self._capture = None
+                    self._emit(after)
+                    self._pending = b""
+                    self._drained.set()
+                    continue
+                # 末尾可能是被拆开的半个哨兵，留到下一次读取
+                keep = len(sentinel) - 1
+                self._emit(self._pending[:-keep])
+                self._pending = self._pending[-keep:]
+
+
+def _kernel_main(
+    conn,
+    memory_limit_mb: Optional[int],
+    preload_modules: Iterable[str],
+    max_output_bytes: int,
+    spill_dir: Optional[str],
+    env: Optional[Dict[str, str]] = None,
+):
+    """内核子进程主循环：在同一个命名空间中依次执行收到的代码。"""
+    if env:
+        os.environ.update(env)
+    _limit_memory(memory_limit_mb)
+
+    for module_name in preload_modules:
+        try:
+            __import__(module_name)
+        except Exception:
+            pass
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+
+    # stdout / stderr 按行刷新，与子进程直接写 fd 的输出保持先后顺序
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+    fd_captures = (_FdCapture(1), _FdCapture(2))
+    # 预先导入完成，通知父进程可以开始计时执行代码
+    conn.send({"ready": True})
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        stdout = OutputCapture(max_output_bytes, spill_dir)
+        stderr = OutputCapture(max_output_bytes, spill_dir)
+        for fd_capture, capture in zip(fd_captures, (stdout, stderr)):
+            fd_capture.begin(capture)
+        return_code = 0
+        try:
+            exec(compile(request["code"], "<code_agent>", "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None:
+                return_code = 0
+            elif isinstance(e.code, int):
+                return_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                return_code = 1
+        except BaseException as e:
+            # 去掉内核自身的栈帧，只保留用户代码部分
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            return_code = 1
+        finally:
+            for stream, fd_capture in zip((sys.stdout, sys.stderr), fd_captures):
+                try:
+                    stream.flush()
+                except Exception:
+                    pass
+                fd_capture.end()
+            stdout.close()
+            stderr.close()
+
+        conn.send(
+            {
+                "return_code": return_code,
+                "output": stdout.getvalue(),
+                "error": stderr.getvalue(),
+                "truncated": stdout.truncated or stderr.truncated,
+                "log_paths": [c.log_path for c in (stdout, stderr) if c.log_path],
+            }
+        )
+
+
+class PythonKernel:
+    """长驻的 Python 解释器进程，通过管道接收代码并在同一命名空间中执行。
+
+    变量和已导入模块在多次 execute 之间保留；单步超时或进程崩溃时自动重启内核，
+    此时命名空间会被重置。
+    """
+
+    def __init__(
+        self,
+        timeout: int = 60,
+        memory_limit_mb: Optional[int] = None,
+        preload_modules: Iterable[str] = DEFAULT_PRELOAD_MODULES,
+        max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+        spill_dir: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        startup_timeout: int = 120,
+    ):
+        """
+        参数:
+            timeout (int): 单步默认超时时间，单位秒
+            memory_limit_mb (Optional[int]): 内核进程地址空间上限（MB），None 表示不限制
+            preload_modules (Iterable[str]): 内核启动时预先导入的模块
+            max_output_bytes (int): 每步 stdout/stderr 各自保留的字节上限
+            spill_dir (Optional[str]): 超出上限时完整输出日志的目录
+            env (Optional[Dict[str, str]]): 内核进程额外的环境变量，如 {"DISPLAY": ":99"}
+            startup_timeout (int): 等待内核启动（含预先导入模块）的最长时间，单位秒，不计入单步超时
+        """
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.preload_modules = tuple(preload_modules)
+        self.max_output_bytes = max_output_bytes
+        self.spill_dir = spill_dir
+        self.env = env
+        self.startup_timeout = startup_timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._ready = False
+
+    def start(self) -> None:
+        """启动内核进程（已在运行时不做任何事）。"""
+        if self.is_alive():
+            return
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_kernel_main,
+            args=(
+                child_conn,
+                self.memory_limit_mb,
+                self.preload_modules,
+                self.max_output_bytes,
+                self.spill_dir,
+                self.env,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        # 关闭父进程中的子端，子进程退出时父端才能收到 EOF
+        child_conn.close()
+        self._conn = parent_conn
+        self._ready = False
+        logger.info(f"Python kernel started, pid={self._process.pid}")
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def shutdown(self) -> None:
+        """关闭内核进程。"""
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        if self._process is not None:
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            logger.info(f"Python kernel stopped, pid={self._process.pid}")
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def restart(self) -> None:
+        """强制结束当前内核并启动一个新的内核。"""
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self.start()
+
+    def _wait_ready(self) -> bool:
+        """等待内核完成启动（预先导入模块可能较慢），单步超时从启动完成后才开始计时。"""
+        if self._ready:
+            return True
+        if not self._conn.poll(self.startup_timeout):
+            return False
+        try:
+            message = self._conn.recv()
+        except (EOFError, OSError):
+            return False
+        self._ready = bool(message.get("ready"))
+        return self._ready
+
+    def _startup_failed(self) -> Dict:
+        logger.warning(f"Python kernel did not start within {self.startup_timeout}s")
+        self.shutdown()
+        return {
+            "status": "error",
+            "return_code": -1,
+            "output": "",
+            "error": f"Python 内核未能在 {self.startup_timeout} 秒内启动",
+        }
+
+    def execute(self, code: str, timeout: Optional[int] = None) -> Dict:
+        """在内核中执行代码。
+
+        参数:
+            code (str): 要执行的 Python 代码
+            timeout (Optional[int]): 本次执行的超时时间，默认使用 self.timeout
+
+        返回:
+            Dict: 与 LocalController.run_python_script 相同结构的结果字典
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        if not self.is_alive():
+            if self._process is not None:
+                logger.warning("Python kernel is not running, restarting")
+                self.restart()
+            else:
+                self.start()
+
+        try:
+            if not self._wait_ready():
+                return self._startup_failed()
+            self._conn.send({"code": code})
+        except (BrokenPipeError, OSError):
+            logger.warning("Python kernel pipe is broken, restarting")
+            self.restart()
+            if not self._wait_ready():
+                return self._startup_failed()
+            self._conn.send({"code": code})
+
+        if not self._conn.poll(timeout):
+            logger.warning(f"Python kernel step timed out after {timeout}s, restarting")
+            self.restart()
+            return {
+                "status": "error",
+                "return_code": -1,
+                "output": "",
+                "error": (
+                    f"TimeoutExpired: 代码执行超过 {timeout} 秒，"
+                    "内核已重启，之前定义的变量已丢失"
+                ),
+            }
+
+        try:
+            reply = self._conn.recv()
+        except (EOFError, OSError):
+            self._process.join(timeout=1)
+            exit_code = self._process.exitcode
+            logger.warning(f"Python kernel crashed (exit code {exit_code}), restarting")
+            self.restart()
+            return {
+                "status": "error",
+                "return_code": exit_code if exit_code is not None else -1,
+                "output": "",
+                "error": (
+                    f"内核进程异常退出（exit code {exit_code}），"
+                    "内核已重启，之前定义的变量已丢失"
+                ),
+            }
+
+        return {
+            "status": "ok" if reply["return_code"] == 0 else "error",
+            "return_code": reply["return_code"],
+            "output": reply["output"],
+            "error": reply["error"],
+            "truncated": reply["truncated"],
+            "log_paths": reply["log_paths"],
+        }
@@ -0,0 +1,275 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger("ComputerAgent.utils.telemetry")
+
+# 结束时累加到父 span 的计数字段
+ROLLUP_KEYS = ("prompt_tokens", "completion_tokens", "image_bytes", "llm_calls", "retries")
+
+_sinks: List = []
+_local = threading.local()
+_ids = itertools.count(1)
+_rollup_lock = threading.Lock()
+
+
+class Span:
+    """一段计时区间，记录耗时、token 用量、发送的图片字节数等属性。"""
+
+    __slots__ = ("name", "span_id", "parent", "trace_id", "start_time", "_start", "duration", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.span_id = next(_ids)
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, key: str, value) -> None:
+        """设置属性。"""
+        self.attributes[key] = value
+
+    def add(self, key: str, amount=1) -> None:
+        """累加数值属性。"""
+        with _rollup_lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self) -> None:
+        """结束 span：计算耗时，把计数累加到父 span，并发送给所有 sink。"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if self.parent is not None:
+            with _rollup_lock:
+                for key in ROLLUP_KEYS:
+                    if key in self.attributes:
+                        self.parent.attributes[key] = (
+                            self.parent.attributes.get(key, 0) + self.attributes[key]
+                        )
+        for sink in list(_sinks):
+            try:
+                sink.export(self)
+            except Exception as e:
+                logger.warning(f"Telemetry sink {type(sink).__name__} failed: {e}")
+
+    def to_dict(self) -> Dict:
+        record = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "trace_id": self.trace_id,
+            "start": self.start_time,
+            "duration": self.duration,
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attributes)
+        return record
+
+
+class _NoopSpan:
+    """未注册任何 sink 时使用的空 span，调用开销可以忽略。"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def add(self, key: str, amount=1) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def enabled() -> bool:
+    """是否注册了 sink（未注册时所有 span 都是空操作）。"""
+    return bool(_sinks)
+
+
+def current_span():
+    """返回当前线程正在进行的 span，没有时返回空 span。"""
+    stack = _stack()
+    return stack[-1] if stack else NOOP_SPAN
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes) -> Iterator:
+    """
+    记录一段区间。
+
+    参数:
+        name (str): span 名称，如 "worker.generator"
+        parent (Optional[Span]): 父 span，默认取当前线程正在进行的 span；
+            在线程池中执行的子任务需要显式传入
+        **attributes: 初始属性
+
+    用法:
+        with span("grounding.coords", ref_expr=ref_expr) as s:
+            s.set("cache_hit", True)
+    """
+    if not _sinks:
+        yield NOOP_SPAN
+        return
+
+    if parent is None or isinstance(parent, _NoopSpan):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+    current = Span(name, parent, **attributes)
+    stack = _stack()
+    stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        current.end()
+
+
+def record_usage(usage) -> None:
+    """把一次 API 调用返回的 usage（prompt / completion tokens）记到当前 span。"""
+    if usage is None or not _sinks:
+        return
+    current = current_span()
+    current.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    current.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def image_bytes(messages: List[Dict]) -> int:
+    """统计消息中以 data URL 形式发送的图片大小（base64 字节数）。"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                total += len(part["image_url"]["url"])
+    return total
+
+
+def add_sink(sink) -> None:
+    """注册 sink，之后结束的 span 都会发送给它。"""
+    _sinks.append(sink)
+
+
+def remove_sink(sink) -> None:
+    """注销 sink。"""
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+class JSONLSink:
+    """把每个 span 写成一行 JSON。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class InMemorySink:
+    """在内存中保存 span，并按名称汇总耗时和 token 用量。"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        按 span 名称汇总。
+
+        返回:
+            Dict[str, Dict]: 名称 -> {count, total_seconds, mean_seconds, max_seconds, 以及各计数字段之和}
+        """
+        summary: Dict[str, Dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for item in spans:
+            entry = summary.setdefault(
+                item.name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            entry["count"] += 1
+            entry["total_seconds"] += item.duration
+            entry["max_seconds"] = max(entry["max_seconds"], item.duration)
+            for key in ROLLUP_KEYS:
+                if key in item.attributes:
+                    entry[key] = entry.get(key, 0) + item.attributes[key]
+        for entry in summary.values():
+            entry["mean_seconds"] = entry["total_seconds"] / entry["count"]
+        return summary
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+class OpenTelemetrySink:
+    """转发给 OpenTelemetry tracer（需要安装 opentelemetry-api / opentelemetry-sdk）。
+
+    子 span 先于父 span 结束，因此按调用树缓存，根 span 结束时再整体导出，保持父子关系。
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetrySink 需要安装 opentelemetry-api") from e
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer("ComputerAgent")
+        self._children: Dict[int, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            if span.parent is not None:
+                self._children.setdefault(span.parent.span_id, []).append(span)
+                return
+            self._export_tree(span, None)
+
+    def _export_tree(self, span: Span, context) -> None:
+        start_ns = int(span.start_time * 1e9)
+        otel_span = self.tracer.start_span(span.name, context=context, start_time=start_ns)
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error:
+            otel_span.set_attribute("error", span.error)
+        child_context = self._trace.set_span_in_context(otel_span)
+        for child in self._children.pop(span.span_id, []):
+            self._export_tree(child, child_context)
+        otel_span.end(end_time=start_ns + int(span.duration * 1e9))
@@ -0,0 +1,426 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ComputerAgent.utils.trajectory")
+
+# 当前正在录制的 recorder，由 call_llm_safe 通过 record_llm_call 写入模型调用
+_active_recorder = None
+
+# 录制时 prompt 文本保留的最大字符数，仅用于人工查看
+PROMPT_PREVIEW_CHARS = 2000
+
+# 录制配置中不写入文件的敏感字段
+_SECRET_KEYS = {"api_key", "base_url", "organization"}
+
+# code agent 内部的模型调用角色，回放时由单独的回复源提供，不与 generator / grounding 的回复交错
+CODE_AGENT_ROLES = ("code_agent", "summary")
+
+
+def request_digest(messages: List[Dict]) -> str:
+    """计算一次模型请求（消息列表）的摘要，用于回放时匹配录制的回复。"""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _last_text(messages: List[Dict]) -> str:
+    """取最后一条消息中的文本部分。"""
+    if not messages:
+        return ""
+    content = messages[-1].get("content", "")
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+
+def _public_config(config: Dict) -> Dict:
+    """去掉配置中的密钥等敏感字段（递归处理嵌套的 engine_params）。"""
+    public = {}
+    for key, value in config.items():
+        if key in _SECRET_KEYS:
+            continue
+        public[key] = _public_config(value) if isinstance(value, dict) else value
+    return public
+
+
+def agent_config(agent) -> Dict:
+    """
+    收集 Agent 及其 OSWorldACI 中会影响提示词或控制流程的构造参数，作为 TrajectoryRecorder 的 config，
+    回放时按这些参数重建同样配置的 agent。
+    """
+    grounding_agent = agent.grounding_agent
+    return {
+        "engine_params": agent.worker_engine_params,
+        "engine_params_for_grounding": grounding_agent.engine_params_for_grounding,
+        "code_agent_engine_params": grounding_agent.code_agent_engine_params,
+        "platform": agent.platform,
+        "width": grounding_agent.width,
+        "height": grounding_agent.height,
+        "max_trajectory_length": agent.max_trajectory_length,
+        "enable_reflection": agent.enable_reflection,
+        "macro_mode": agent.macro_mode,
+        "max_macro_actions": agent.max_macro_actions,
+        "enable_local_env": grounding_agent.env is not None,
+        "code_agent_budget": grounding_agent.code_agent_budget,
+        "ocr_config": grounding_agent.ocr_config,
+        "enable_grounding_cache": grounding_agent.enable_grounding_cache,
+        "grounding_retries": grounding_agent.grounding_retries,
+    }
+
+
+def record_llm_call(agent, messages: List[Dict], response: str) -> None:
+    """call_llm_safe 的录制钩子：没有正在录制的轨迹时直接返回。"""
+    recorder = _active_recorder
+    if recorder is not None:
+        recorder.add_llm_call(
+            getattr(agent.engine, "model", None), messages, response, getattr(agent, "usage_role", None)
+        )
+
+
+def record_code_execution(code_type: str, code: str, result: Dict) -> None:
+    """code agent 执行代码块的录制钩子：没有正在录制的轨迹时直接返回。"""
+    recorder = _active_recorder
+    if recorder is not None:
+        recorder.add_code_execution(code_type, code, result)
+
+
+class TrajectoryRecorder:
+    """把每一步的观测、模型输入输出和生成的 exec_code 写入轨迹文件。
+
+    轨迹文件为 JSONL：第一行是运行配置，之后每行一步。
+    截图按内容哈希去重后存到 <path>.images/ 目录，轨迹中只保存引用；
+    模型调用只保存请求摘要、最后一条消息的文本预览和回复。
+    """
+
+    def __init__(self, path: str, config: Optional[Dict] = None):
+        """
+        参数:
+            path (str): 轨迹文件路径
+            config (Optional[Dict]): 运行配置（engine 参数、平台、屏幕尺寸等），回放时用于重建 agent，
+                通常由 agent_config(agent) 生成
+        """
+        self.path = path
+        self.image_dir = path + ".images"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(self.image_dir, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending_calls: List[Dict] = []
+        self._pending_executions: List[Dict] = []
+        self.step_count = 0
+        self._write({"type": "meta", "created": time.time(), "config": _public_config(config or {})})
+
+    def _write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def _save_screenshot(self, screenshot: bytes) -> str:
+        digest = hashlib.sha1(screenshot).hexdigest()
+        name = digest + ".png"
+        image_path = os.path.join(self.image_dir, name)
+        if not os.path.exists(image_path):
+            with open(image_path, "wb") as f:
+                f.write(screenshot)
+        return name
+
+    def start(self) -> "TrajectoryRecorder":
+        """开始录制：之后所有经 call_llm_safe 的模型调用都会记入下一步。"""
+        global _active_recorder
+        _active_recorder = self
+        return self
+
+    def add_llm_call(
+        self, model: Optional[str], messages: List[Dict], response: str, role: Optional[str] = None
+    ) -> None:
+        """记录一次模型调用，role 为调用方的用量角色（generator、grounding、code_agent 等）。"""
+        call = {
+            "model": model,
+            "role": role,
+            "request": request_digest(messages),
+            "prompt": _last_text(messages)[:PROMPT_PREVIEW_CHARS],
+            "response": response,
+        }
+        with self._lock:
+            self._pending_calls.append(call)
+
+    def add_code_execution(self, code_type: str, code: str, result: Dict) -> None:
+        """记录 code agent 执行的一个代码块及其结果，回放时由 ReplayController 返回。"""
+        with self._lock:
+            self._pending_executions.append({"type": code_type, "code": code, "result": result})
+
+    def record_step(self, instruction: str, obs: Dict, info: Dict, actions: List[str]) -> None:
+        """
+        记录一步：本步的观测、期间发生的模型调用以及生成的动作。
+
+        参数:
+            instruction (str): 任务指令
+            obs (Dict): 观测，必须包含 screenshot
+            info (Dict): Agent.predict 返回的信息
+            actions (List[str]): Agent.predict 返回的动作
+        """
+        with self._lock:
+            calls, self._pending_calls = self._pending_calls, []
+            executions, self._pending_executions = self._pending_executions, []
+            self._write(
+                {
+                    "type": "step",
+                    "step": self.step_count,
+                    "instruction": instruction,
+                    "screenshot": self._save_screenshot(obs["screenshot"]),
+                    "llm_calls": calls,
+                    "code_executions": executions,
+                    "code_agent_result": info.get("code_agent_output"),
+                    "plan_code": info.get("plan_code"),
+                    "exec_code": info.get("exec_code"),
+                    "actions": actions,
+                }
+            )
+            self.step_count += 1
+
+    def close(self) -> None:
+        """停止录制并关闭文件。"""
+        global _active_recorder
+        if _active_recorder is self:
+            _active_recorder = None
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self) -> "TrajectoryRecorder":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def load_trajectory(path: str) -> Tuple[Dict, List[Dict]]:
+    """
+    读取轨迹文件。
+
+    返回:
+        Tuple[Dict, List[Dict]]: 运行配置和按顺序排列的步骤
+    """
+    config = {}
+    steps = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("type") == "meta":
+                config = record.get("config", {})
+            elif record.get("type") == "step":
+                steps.append(record)
+    return config, steps
+
+
+class ReplaySource:
+    """回放时为 replay 引擎提供录制的模型回复。
+
+    优先按请求摘要精确匹配（代码未改动时请求与录制时完全一致）；
+    请求有变化时退回到同一模型下尚未使用的最早一条回复。
+    """
+
+    def __init__(self, llm_calls: List[Dict]):
+        self.calls = llm_calls
+        self.used = [False] * len(llm_calls)
+        self.by_request: Dict[str, deque] = defaultdict(deque)
+        self.by_model: Dict[Optional[str], deque] = defaultdict(deque)
+        for index, call in enumerate(llm_calls):
+            self.by_request[call["request"]].append(index)
+            self.by_model[call["model"]].append(index)
+        self.exact_matches = 0
+        self.fallback_matches = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _take(queue: deque, used: List[bool]) -> Optional[int]:
+        while queue:
+            index = queue.popleft()
+            if not used[index]:
+                used[index] = True
+                return index
+        return None
+
+    def next_response(self, model: Optional[str], messages: List[Dict]) -> str:
+        """返回与本次请求对应的录制回复。"""
+        digest = request_digest(messages)
+        with self._lock:
+            index = self._take(self.by_request.get(digest, deque()), self.used)
+            if index is not None:
+                self.exact_matches += 1
+            else:
+                index = self._take(self.by_model.get(model, deque()), self.used)
+                if index is None:
+                    raise RuntimeError(f"轨迹中没有剩余的模型回复可供回放（model={model}）")
+                self.fallback_matches += 1
+                logger.debug(f"Replay request {digest} not recorded, using call #{index} of {model}")
+            return self.calls[index]["response"]
+
+
+class ReplayController:
+    """回放时代替 LocalController：按录制顺序返回 code agent 每个代码块的执行结果，不真正执行代码。
+
+    优先返回同类型、同代码且尚未使用的录制结果；代码有变化时退回到尚未使用的最早一条。
+    """
+
+    def __init__(self, executions: List[Dict]):
+        self.executions = executions
+        self.used = [False] * len(executions)
+        self.by_code: Dict[Tuple[str, str], deque] = defaultdict(deque)
+        self.in_order: deque = deque(range(len(executions)))
+        for index, execution in enumerate(executions):
+            self.by_code[(execution["type"], execution["code"])].append(index)
+        self._lock = threading.Lock()
+
+    def _next_result(self, code_type: str, code: str) -> Dict:
+        with self._lock:
+            index = ReplaySource._take(self.by_code.get((code_type, code), deque()), self.used)
+            if index is None:
+                index = ReplaySource._take(self.in_order, self.used)
+            if index is None:
+                return {"status": "error", "error": "轨迹中没有剩余的代码执行结果可供回放"}
+            return dict(self.executions[index]["result"])
+
+    def run_bash_script(self, code: str, timeout: int = 30) -> Dict:
+        return self._next_result("bash", code)
+
+    def run_python_script(self, code: str, timeout: Optional[int] = None) -> Dict:
+        return self._next_result("python", code)
+
+    def run_batch(self, blocks: List[Tuple[str, str]], timeout: Optional[float] = None) -> List[Dict]:
+        return [self._next_result(code_type, code) for code_type, code in blocks]
+
+
+class ReplayEnv:
+    """回放用的环境：只提供 controller，使 code agent 动作与录制时一样可用。"""
+
+    def __init__(self, controller: ReplayController):
+        self.controller = controller
+
+
+def replay_trajectory(path: str, build_agent: Optional[Callable] = None) -> Dict:
+    """
+    无桌面回放轨迹：把录制的截图依次送入 Agent.predict，模型调用由录制的回复代替，
+    生成的动作只收集不执行，并与录制时的 exec_code 对比。
+
+    参数:
+        path (str): 轨迹文件路径
+        build_agent (Optional[Callable]): 自定义构建函数，接收 (config, engine_params,
+            engine_params_for_grounding)，返回 Agent；默认按录制的配置构建。
+            录制时启用了 code agent 时，默认构建的 agent 使用 ReplayEnv，code agent 的模型回复
+            来自单独的回复源，代码块的执行结果由 ReplayController 按录制结果返回
+
+    返回:
+        Dict: 回放报告，包含总耗时、每步耗时、动作不一致的步骤和回复匹配统计
+    """
+    config, steps = load_trajectory(path)
+    calls = [call for step in steps for call in step["llm_calls"]]
+    source = ReplaySource([call for call in calls if call.get("role") not in CODE_AGENT_ROLES])
+    code_agent_source = ReplaySource([call for call in calls if call.get("role") in CODE_AGENT_ROLES])
+    executions = [execution for step in steps for execution in step.get("code_executions", [])]
+
+    def replay_params(params: Dict, replay_source: ReplaySource = source) -> Dict:
+        replayed = dict(params)
+        replayed["recorded_engine_type"] = params.get("engine_type", "openai")
+        replayed["engine_type"] = "replay"
+        replayed["source"] = replay_source
+        return replayed
+
+    engine_params = replay_params(config.get("engine_params", {}))
+    engine_params_for_grounding = replay_params(config.get("engine_params_for_grounding", {}))
+    code_agent_engine_params = replay_params(
+        config.get("code_agent_engine_params", config.get("engine_params", {})), code_agent_source
+    )
+
+    # 录制时有本地环境（code agent 可用）则回放时同样提供，系统提示词与录制时一致
+    code_agent_enabled = config.get("enable_local_env") or any(
+        step.get("code_agent_result") or step.get("code_executions") for step in steps
+    )
+    env = ReplayEnv(ReplayController(executions)) if code_agent_enabled else None
+
+    if build_agent is None:
+        from agent.agent import Agent
+        from utils.grounding import OSWorldACI
+
+        def build_agent(config, engine_params, engine_params_for_grounding):
+            grounding_agent = OSWorldACI(
+                env=env,
+                platform=config.get("platform", "linux"),
+                engine_params_for_generation=engine_params,
+                engine_params_for_grounding=engine_params_for_grounding,
+                width=config.get("width", 1920),
+                height=config.get("height", 1080),
+                code_agent_budget=config.get("code_agent_budget", 20),
+                code_agent_engine_params=code_agent_engine_params,
+                ocr_config=config.get("ocr_config"),
+                enable_grounding_cache=config.get("enable_grounding_cache", True),
+                grounding_retries=config.get("grounding_retries", 2),
+            )
+            return Agent(
+                engine_params,
+                grounding_agent,
+                platform=config.get("platform", "linux"),
+                max_trajectory_length=config.get("max_trajectory_length", 8),
+                enable_reflection=config.get("enable_reflection", True),
+                macro_mode=config.get("macro_mode", False),
+                max_macro_actions=config.get("max_macro_actions", 4),
+            )
+
+    agent = build_agent(config, engine_params, engine_params_for_grounding)
+    image_dir = path + ".images"
+
+    step_times = []
+    mismatches = []
+    actions_sink = []
+    start = time.perf_counter()
+    for step in steps:
+        with open(os.path.join(image_dir, step["screenshot"]), "rb") as f:
+            obs = {"screenshot": f.read()}
+
+        step_start = time.perf_counter()
+        info, actions = agent.predict(instruction=step["instruction"], observation=obs)
+        step_times.append(time.perf_counter() - step_start)
+
+        actions_sink.append(actions)
+        if info.get("exec_code") != step["exec_code"]:
+            mismatches.append(
+                {
+                    "step": step["step"],
+                    "expected": step["exec_code"],
+                    "actual": info.get("exec_code"),
+                }
+            )
+        recorded_result = step.get("code_agent_result")
+        replayed_result = info.get("code_agent_output")
+        if recorded_result is not None and (replayed_result or {}).get(
+            "completion_reason"
+        ) != recorded_result.get("completion_reason"):
+            mismatches.append(
+                {
+                    "step": step["step"],
+                    "expected": f"code agent: {recorded_result.get('completion_reason')}",
+                    "actual": f"code agent: {(replayed_result or {}).get('completion_reason')}",
+                }
+            )
+
+    report = {
+        "steps": len(steps),
+        "total_seconds": time.perf_counter() - start,
+        "step_seconds": step_times,
+        "mismatches": mismatches,
+        "actions": actions_sink,
+        "exact_matches": source.exact_matches + code_agent_source.exact_matches,
+        "fallback_matches": source.fallback_matches + code_agent_source.fallback_matches,
+        "unused_calls": source.used.count(False) + code_agent_source.used.count(False),
+    }
+    logger.info(
+        f"Replayed {len(steps)} steps in {report['total_seconds']:.3f}s, "
+        f"{len(mismatches)} action mismatches, {report['fallback_matches']} fallback responses"
+    )
+    return report
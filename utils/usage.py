@@ -0,0 +1,86 @@
+import threading
+from typing import Dict, Optional
+
+
+def _empty_totals() -> Dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+class UsageTracker:
+    """按角色（generator、reflection、grounding、text_span、code_agent、summary、warmup）统计 token 用量和费用。
+
+    同时维护当前步和当前任务两级累计；费用按 pricing 中各模型每百万 token 的单价计算，
+    未配置单价的模型只统计 token。
+    """
+
+    def __init__(self, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        参数:
+            pricing (Optional[Dict[str, Dict[str, float]]]): 模型名 -> {"prompt": 单价, "completion": 单价}，
+                单价为每百万 token 的费用
+        """
+        self.pricing = pricing or {}
+        self._lock = threading.Lock()
+        self.step: Dict[str, Dict] = {}
+        self.task: Dict[str, Dict] = {}
+
+    def cost_of(self, model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+        """按单价计算一次调用的费用。"""
+        price = self.pricing.get(model)
+        if not price:
+            return 0.0
+        return (
+            prompt_tokens * price.get("prompt", 0.0)
+            + completion_tokens * price.get("completion", 0.0)
+        ) / 1_000_000
+
+    def record(self, role: Optional[str], model: Optional[str], usage) -> None:
+        """
+        记录一次模型调用的用量。
+
+        参数:
+            role (Optional[str]): 调用方角色，为空时记为 "other"
+            model (Optional[str]): 模型名，用于查找单价
+            usage: API 返回的 usage（包含 prompt_tokens 和 completion_tokens）
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        cost = self.cost_of(model, prompt_tokens, completion_tokens)
+        role = role or "other"
+        with self._lock:
+            for scope in (self.step, self.task):
+                totals = scope.setdefault(role, _empty_totals())
+                totals["calls"] += 1
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost"] += cost
+
+    def start_step(self) -> None:
+        """开始新的一步，清空当前步的累计。"""
+        with self._lock:
+            self.step = {}
+
+    def start_task(self) -> None:
+        """开始新的任务，清空当前步和当前任务的累计。"""
+        with self._lock:
+            self.step = {}
+            self.task = {}
+
+    @staticmethod
+    def _summarize(scope: Dict[str, Dict]) -> Dict:
+        summary = _empty_totals()
+        summary["by_role"] = {role: dict(totals) for role, totals in scope.items()}
+        for totals in scope.values():
+            for key in ("calls", "prompt_tokens", "completion_tokens", "cost"):
+                summary[key] += totals[key]
+        return summary
+
+    def step_totals(self) -> Dict:
+        """当前步的合计及按角色的明细。"""
+        with self._lock:
+            return self._summarize(self.step)
+
+    def task_totals(self) -> Dict:
+        """当前任务的合计及按角色的明细。"""
+        with self._lock:
+            return self._summarize(self.task)
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("ComputerAgent.utils.warmup")
+
+
+def _connection_key(engine) -> tuple:
+    return (type(engine).__name__, getattr(engine, "base_url", None), getattr(engine, "api_key", None))
+
+
+class EndpointWarmup:
+    """在后台预热各个模型端点：建立连接池中的连接，可选地发送系统提示词让服务端缓存前缀。
+
+    同一端点只建立一次连接；开启 prime 时，每个（模型、系统提示词）组合各发送一次一 token 的请求。
+    预热失败只记录日志，不影响后续正常调用。
+    """
+
+    def __init__(self, agents: List, prime: bool = False):
+        """
+        参数:
+            agents (List): 需要预热的 LLMAgent 列表
+            prime (bool): 是否发送系统提示词进行前缀缓存预热（会产生少量 token 费用）
+        """
+        self.prime = prime
+        self.start_time = time.perf_counter()
+        self.ready_seconds: Optional[float] = None
+        self.endpoint_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._done = threading.Event()
+
+        tasks = {}
+        for agent in agents:
+            engine = agent.engine
+            if prime:
+                key = _connection_key(engine) + (getattr(engine, "model", None), agent.system_prompt)
+            else:
+                key = _connection_key(engine)
+            tasks.setdefault(key, agent)
+
+        if not tasks:
+            self._finish()
+            return
+        self._pending = len(tasks)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup")
+        for agent in tasks.values():
+            self._executor.submit(self._warm, agent)
+        self._executor.shutdown(wait=False)
+
+    def _warm(self, agent) -> None:
+        engine = agent.engine
+        name = f"{agent.usage_role or 'agent'}:{getattr(engine, 'model', None)}@{getattr(engine, 'base_url', None)}"
+        try:
+            self.endpoint_seconds[name] = agent.warmup(prime=self.prime)
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.warning("Warm-up of %s failed: %s", name, e)
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self._finish()
+
+    def _finish(self) -> None:
+        self.ready_seconds = time.perf_counter() - self.start_time
+        logger.info(
+            "Endpoints ready in %.2fs (%d warmed, %d failed)",
+            self.ready_seconds,
+            len(self.endpoint_seconds),
+            len(self.errors),
+        )
+        self._done.set()
+
+    def done(self) -> bool:
+        """预热是否已全部完成。"""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        等待预热完成。
+
+        返回:
+            Optional[float]: 从开始预热到全部完成的秒数，超时返回 None
+        """
+        self._done.wait(timeout)
+        return self.ready_seconds